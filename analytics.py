@@ -0,0 +1,218 @@
+"""Daily activity rollups behind the admin dashboard.
+
+user_activity_daily / category_activity_daily hold one row per (day,
+user) and (day, category), day = UTC epoch day. Write paths add their
+deltas in the same transaction as the write itself:
+
+    ideas        ideas submitted
+    votes        idea votes cast (an unvote takes one back)
+    ratings      star ratings given
+    comments     comments written
+    star_sum / star_count
+                 stars received by the user's ideas / by the category's ideas
+
+Deleting ideas, comments or users does not rewrite past days (rows of a
+deleted user or category go with it through ON DELETE CASCADE);
+rebuild_activity() recomputes everything from the current tables, but
+puts votes and ratings (no per-day history there) on day 0. A bulk
+import adds its own rows' deltas instead (recording_inserts).
+compact_activity() (nightly, flask rollup-analytics) folds days older
+than the retention window into a single day-0 row per user / category,
+so "all time" panels read at most KEEP_DAYS + 1 rows per key.
+"""
+import os
+from contextlib import contextmanager
+
+ACTIVITY_COLUMNS = ("ideas", "votes", "ratings", "comments", "star_sum", "star_count")
+KEEP_DAYS = int(os.environ.get("ANALYTICS_KEEP_DAYS", "90"))
+TODAY_SQL = "CAST(strftime('%s', 'now') AS INTEGER) / 86400"
+
+_TABLES = {
+    "user_activity_daily": "user_id",
+    "category_activity_daily": "category_id",
+}
+
+
+def create_activity_tables(conn):
+    for table, key in _TABLES.items():
+        parent = "users(user_id)" if key == "user_id" else "categories(category_id)"
+        counters = ",\n".join(f"        {col} INTEGER NOT NULL DEFAULT 0" for col in ACTIVITY_COLUMNS)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            day INTEGER NOT NULL,
+            {key} INTEGER NOT NULL,
+{counters},
+            PRIMARY KEY (day, {key}),
+            FOREIGN KEY ({key}) REFERENCES {parent} ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{key} ON {table} ({key})")
+
+
+def _record(c, table, key_id, deltas):
+    if key_id is None:
+        return
+    unknown = set(deltas) - set(ACTIVITY_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown activity counters: {sorted(unknown)}")
+    cols = list(deltas)
+    key = _TABLES[table]
+    c.execute(f"""
+        INSERT INTO {table} (day, {key}, {", ".join(cols)})
+        VALUES ({TODAY_SQL}, ?, {", ".join("?" * len(cols))})
+        ON CONFLICT(day, {key}) DO UPDATE SET {", ".join(f"{col} = {col} + excluded.{col}" for col in cols)}
+    """, [key_id] + [deltas[col] for col in cols])
+
+
+def record_user_activity(c, user_id, **deltas):
+    _record(c, "user_activity_daily", user_id, deltas)
+
+
+def record_category_activity(c, category_id, **deltas):
+    _record(c, "category_activity_daily", category_id, deltas)
+
+
+def compact_activity(conn, keep_days=KEEP_DAYS):
+    """Fold days older than keep_days into the day-0 row of each user / category; returns rows folded."""
+    folded = 0
+    sums = ", ".join(f"SUM({col})" for col in ACTIVITY_COLUMNS)
+    updates = ", ".join(f"{col} = {col} + excluded.{col}" for col in ACTIVITY_COLUMNS)
+    for table, key in _TABLES.items():
+        cutoff = f"day > 0 AND day < {TODAY_SQL} - ?"
+        conn.execute(f"""
+            INSERT INTO {table} (day, {key}, {", ".join(ACTIVITY_COLUMNS)})
+            SELECT 0, {key}, {sums} FROM {table} WHERE {cutoff} GROUP BY {key}
+            ON CONFLICT(day, {key}) DO UPDATE SET {updates}
+        """, (keep_days,))
+        folded += conn.execute(f"DELETE FROM {table} WHERE {cutoff}", (keep_days,)).rowcount
+    return folded
+
+
+def rebuild_activity(conn):
+    """Recompute both rollups from ideas / votes / star_ratings / comments.
+
+    Ideas and comments land on the day they were written; votes and
+    ratings have no timestamp and land in the day-0 row.
+    """
+    for table in _TABLES:
+        conn.execute(f"DELETE FROM {table}")
+
+    sources = {
+        "user_id": [
+            ("ideas", "SELECT COALESCE(submitted_at, 0) / 86400 AS day, submitter_id AS k, COUNT(*) AS n "
+                      "FROM ideas WHERE submitter_id IS NOT NULL GROUP BY day, k"),
+            ("votes", "SELECT 0 AS day, user_id AS k, COUNT(*) AS n FROM votes GROUP BY k"),
+            ("ratings", "SELECT 0 AS day, user_id AS k, COUNT(*) AS n FROM star_ratings GROUP BY k"),
+            ("comments", "SELECT COALESCE(created_at, 0) / 86400 AS day, user_id AS k, COUNT(*) AS n "
+                         "FROM comments WHERE user_id IS NOT NULL GROUP BY day, k"),
+            ("star_sum, star_count", "SELECT 0 AS day, ideas.submitter_id AS k, SUM(stars) AS s, COUNT(*) AS n "
+                                     "FROM star_ratings JOIN ideas ON ideas.id = star_ratings.idea_id "
+                                     "WHERE ideas.submitter_id IS NOT NULL GROUP BY k"),
+        ],
+        "category_id": [
+            ("ideas", "SELECT COALESCE(submitted_at, 0) / 86400 AS day, category_id AS k, COUNT(*) AS n "
+                      "FROM ideas WHERE category_id IS NOT NULL GROUP BY day, k"),
+            ("votes", "SELECT 0 AS day, ideas.category_id AS k, COUNT(*) AS n "
+                      "FROM votes JOIN ideas ON ideas.id = votes.idea_id "
+                      "WHERE ideas.category_id IS NOT NULL GROUP BY k"),
+            ("ratings", "SELECT 0 AS day, ideas.category_id AS k, COUNT(*) AS n "
+                        "FROM star_ratings JOIN ideas ON ideas.id = star_ratings.idea_id "
+                        "WHERE ideas.category_id IS NOT NULL GROUP BY k"),
+            ("comments", "SELECT COALESCE(comments.created_at, 0) / 86400 AS day, ideas.category_id AS k, "
+                         "COUNT(*) AS n FROM comments JOIN ideas ON ideas.id = comments.idea_id "
+                         "WHERE ideas.category_id IS NOT NULL GROUP BY day, k"),
+            ("star_sum, star_count", "SELECT 0 AS day, ideas.category_id AS k, SUM(stars) AS s, COUNT(*) AS n "
+                                     "FROM star_ratings JOIN ideas ON ideas.id = star_ratings.idea_id "
+                                     "WHERE ideas.category_id IS NOT NULL GROUP BY k"),
+        ],
+    }
+    for table, key in _TABLES.items():
+        for cols, select in sources[key]:
+            values = "s, n" if "," in cols else "n"
+            excluded = ", ".join(f"{col} = excluded.{col}" for col in cols.split(", "))
+            conn.execute(f"""
+                INSERT INTO {table} (day, {key}, {cols})
+                SELECT day, k, {values} FROM ({select}) WHERE true
+                ON CONFLICT(day, {key}) DO UPDATE SET {excluded}
+            """)
+
+
+# table -> (time column, activity column, [(rollup, key expression)]) for recording_inserts
+_INSERT_DELTAS = {
+    "ideas": ("submitted_at", "ideas", [("user_activity_daily", "NEW.submitter_id"),
+                                        ("category_activity_daily", "NEW.category_id")]),
+    "votes": ("voted_at", "votes", [("user_activity_daily", "NEW.user_id"),
+                                    ("category_activity_daily",
+                                     "(SELECT category_id FROM ideas WHERE id = NEW.idea_id)")]),
+    "comments": ("created_at", "comments", [("user_activity_daily", "NEW.user_id"),
+                                            ("category_activity_daily",
+                                             "(SELECT category_id FROM ideas WHERE id = NEW.idea_id)")]),
+}
+
+
+@contextmanager
+def recording_inserts(conn):
+    """While active, every row inserted into ideas / votes / comments on conn
+    adds one to its day's rollups (TEMP triggers: this connection only, and
+    rows an INSERT OR IGNORE skips add nothing)."""
+    for table, (at, col, targets) in _INSERT_DELTAS.items():
+        body = "".join(f"""
+            INSERT INTO {rollup} (day, {_TABLES[rollup]}, {col})
+            SELECT COALESCE(NEW.{at}, 0) / 86400, k, 1 FROM (SELECT {key} AS k) WHERE k IS NOT NULL
+            ON CONFLICT(day, {_TABLES[rollup]}) DO UPDATE SET {col} = {col} + 1;""" for rollup, key in targets)
+        conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS record_{table}_insert AFTER INSERT ON main.{table} "
+                     f"BEGIN {body} END")
+    try:
+        yield
+    finally:
+        for table in _INSERT_DELTAS:
+            conn.execute(f"DROP TRIGGER IF EXISTS temp.record_{table}_insert")
+
+
+# ---------------- DASHBOARD PANELS (one query each) ----------------
+def _since_day(days):
+    # None = all time (day-0 rows included)
+    return 0 if days is None else f"{TODAY_SQL} - {int(days) - 1}"
+
+
+def top_users(c, days=30, limit=20):
+    c.execute(f"""
+        SELECT users.user_id, users.username, users.role,
+               SUM(a.ideas) AS ideas, SUM(a.votes) AS votes, SUM(a.ratings) AS ratings,
+               SUM(a.comments) AS comments, SUM(a.star_count) AS stars_received,
+               ROUND(SUM(a.star_sum) * 1.0 / NULLIF(SUM(a.star_count), 0), 2) AS avg_stars
+        FROM user_activity_daily a
+        JOIN users ON users.user_id = a.user_id
+        WHERE a.day >= {_since_day(days)}
+        GROUP BY a.user_id
+        ORDER BY SUM(a.ideas) + SUM(a.votes) + SUM(a.ratings) + SUM(a.comments) DESC
+        LIMIT ?
+    """, (limit,))
+    return c.fetchall()
+
+
+def category_activity(c, days=30):
+    c.execute(f"""
+        SELECT categories.category_id, categories.name,
+               SUM(a.ideas) AS ideas, SUM(a.votes) AS votes, SUM(a.ratings) AS ratings,
+               SUM(a.comments) AS comments,
+               ROUND(SUM(a.star_sum) * 1.0 / NULLIF(SUM(a.star_count), 0), 2) AS avg_stars
+        FROM category_activity_daily a
+        JOIN categories ON categories.category_id = a.category_id
+        WHERE a.day >= {_since_day(days)}
+        GROUP BY a.category_id
+        ORDER BY SUM(a.ideas) DESC, categories.name
+    """)
+    return c.fetchall()
+
+
+def daily_totals(c, days=30):
+    c.execute(f"""
+        SELECT day * 86400 AS day_start, SUM(ideas) AS ideas, SUM(votes) AS votes,
+               SUM(ratings) AS ratings, SUM(comments) AS comments
+        FROM category_activity_daily
+        WHERE day >= {_since_day(days)} AND day > 0
+        GROUP BY day
+        ORDER BY day
+    """)
+    return c.fetchall()
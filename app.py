@@ -1,21 +1,268 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash
+from flask import Flask, render_template, request, redirect, session, url_for, flash, g, has_app_context, has_request_context, jsonify, make_response, Response
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+from drafts import DraftStore
+from passwords import HasherBusy, LoginThrottle, PasswordHasher, needs_rehash
 import os
-from datetime import datetime, timedelta
-
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import re
+import json
+import subprocess
+import sys
+import click
+from markupsafe import Markup, escape
+from werkzeug.middleware.proxy_fix import ProxyFix
+import db
+from db import ConnectionPool, connect
+from migrations import STAR_AVG_SQL, migrate, rebuild_idea_stats, rebuild_search_index, schema_version, table_exists
+from similarity import find_similar, idea_title_key, index_title, unindex_title
+from response_cache import ResponseCache, make_etag
+from write_queue import WriteBehindQueue
+from snapshot import ReadSnapshot
+import purge
+from purge import PurgeQueue
+import maintenance
+from metrics import Metrics, RequestStats
+import analytics
+import bulk
+from analytics import record_category_activity, record_user_activity
+import ranking
+from ranking import rating_points, update_rank
+import threading
+import time
+from functools import wraps
+from config import CONFIGS
+
+# Routes register on this module-level app as the module loads; create_app()
+# (called at the bottom) applies the config class. Importing does no
+# database work: prepare_db() runs once, on the first use of a connection.
 app = Flask(__name__)
-app.secret_key = "secret123"
-
-DB_PATH = "database.db"
+_wsgi_app = app.wsgi_app
+
+def create_app(config=None):
+    """Configure and return the app; config is a config.py class (default: APP_CONFIG, else production)."""
+    app.config.from_object(config or CONFIGS[os.environ.get("APP_CONFIG", "production")])
+    hops = app.config.get("TRUSTED_PROXIES", 0)
+    app.wsgi_app = ProxyFix(_wsgi_app, x_for=hops, x_proto=hops) if hops else _wsgi_app
+    return app
+
+DB_PATH = os.environ.get("DATABASE_PATH", "database.db")
+
+DB_POOL = ConnectionPool(DB_PATH)
+
+# --- one-time database preparation, deferred from import to first use ---
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+def prepare_db(conn):
+    """On the process's first connection: apply pending migrations (unless
+    SCHEMA_CHECK is off) and look up FTS5. Afterwards a flag check."""
+    global _db_ready, FTS_ENABLED
+    if _db_ready:
+        return conn
+    with _db_ready_lock:
+        if not _db_ready:
+            if app.config.get("SCHEMA_CHECK", True):
+                migrate(conn, verbose=True)
+            FTS_ENABLED = table_exists(conn, "ideas_fts")
+            _db_ready = True
+    return conn
 
 def get_db():
-    """Return a new sqlite connection with foreign_keys enabled and Row factory."""
-    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
+    """Return this request's pooled connection (a standalone one outside a request).
+
+    Connections are configured once when opened (see db.connect); calling
+    close() in a view only ends that borrow, the connection is returned to
+    the pool when the app context is torn down.
+    """
+    if not has_app_context():
+        return prepare_db(connect(DB_PATH))
+    conn = g.get("db")
+    if conn is None:
+        conn = g.db = prepare_db(DB_POOL.acquire())
+        g.db_changes = conn.total_changes
+    conn.borrowers += 1
+    return conn
+
+@app.before_request
+def prepare_db_on_first_request():
+    # background threads (snapshot, write queue, purge, maintenance) open
+    # their own connections and rely on the schema being current
+    if not _db_ready:
+        get_db().close()
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        DB_POOL.release(conn)
+
+# --- READ_SNAPSHOT=1: read-only routes query an in-memory copy (see snapshot.py) ---
+SNAPSHOT = ReadSnapshot(DB_PATH) if os.environ.get("READ_SNAPSHOT") == "1" else None
+
+def get_read_db():
+    """Connection for read-only pages: the worker's in-memory snapshot when it is
+    fresh enough and already holds this user's last write, else get_db()."""
+    if SNAPSHOT is None or not has_request_context():
+        return get_db()
+    conn = g.get("read_db")
+    if conn is None:
+        found = SNAPSHOT.reader(session.get("wrote_at", 0))
+        if found is None:
+            return get_db()
+        conn, g.read_snapshot = found
+        g.read_db = conn
+    conn.borrowers += 1
     return conn
 
+def remember_own_write():
+    # the write has committed by now; snapshots taken before it are skipped for this user
+    session["wrote_at"] = time.time()
+
+@app.after_request
+def track_snapshot_reads(response):
+    if SNAPSHOT is None:
+        return response
+    snap = g.get("read_snapshot")
+    if snap is not None:
+        response.headers["X-Snapshot-Staleness"] = f"{time.time() - snap.verified_at:.3f}"
+    conn = g.get("db")
+    if g.get("wrote") or (conn is not None and conn.total_changes > g.get("db_changes", 0)):
+        remember_own_write()
+    return response
+
+@app.route("/admin/snapshot")
+def admin_snapshot():
+    if session.get("role") != "admin":
+        return "Access denied"
+    if SNAPSHOT is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(SNAPSHOT.stats(), enabled=True))
+
+# ---------------- METRICS (per-request SQL counts / timings, /metrics) ----------------
+METRICS = Metrics()
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")   # lets a Prometheus scraper in without an admin session
+
+def request_route():
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+def record_statement(sql, seconds):
+    if has_request_context():
+        METRICS.on_statement(g.get("sql_stats"), request_route(), sql, seconds)
+    else:
+        METRICS.on_statement(None, "-", sql, seconds)
+
+if os.environ.get("METRICS", "1") == "1":
+    db.STATEMENT_HOOKS.append(record_statement)
+
+@app.before_request
+def start_request_metrics():
+    g.sql_stats = RequestStats()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_metrics(response):
+    stats = g.pop("sql_stats", None)
+    if stats is not None:
+        METRICS.on_request_end(request_route(), request.method, response.status_code,
+                               time.perf_counter() - g.request_started, stats)
+    return response
+
+@app.teardown_request
+def finish_failed_request_metrics(exc):
+    # after_request is skipped when the view raised
+    stats = g.pop("sql_stats", None)
+    if stats is not None:
+        METRICS.on_request_end(request_route(), request.method, 500,
+                               time.perf_counter() - g.request_started, stats)
+
+@app.route("/metrics")
+def metrics():
+    token_ok = METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+    if session.get("role") != "admin" and not token_ok:
+        return "Access denied", 403
+    pool = DB_POOL.stats()
+    cache = PAGE_CACHE.stats()
+    gauges = [
+        ("db_pool_connections", "Pooled SQLite connections by state.",
+         {(("state", "in_use"),): pool["in_use"], (("state", "idle"),): pool["idle"]}),
+        ("page_cache_entries", "Rendered pages held in the page cache.", {(): cache["entries"]}),
+    ]
+    counters = [
+        ("db_pool_wait_seconds_total", "Time requests waited for a pooled connection.",
+         {(): pool["wait_seconds_total"]}),
+        ("db_pool_timeouts_total", "Pool acquire timeouts.", {(): pool["timeouts_total"]}),
+        ("page_cache_requests_total", "Page cache lookups by result.",
+         {(("result", "hit"),): cache["hits"], (("result", "miss"),): cache["misses"],
+          (("result", "not_modified"),): cache["not_modified"]}),
+    ]
+    hasher = HASHER.stats()
+    gauges.append(("password_hash_in_flight", "Password hash jobs running or queued.", {(): hasher["in_flight"]}))
+    counters += [
+        ("password_hash_rejected_total", "Logins / registrations turned away with the hasher full.",
+         {(): hasher["rejected_total"]}),
+        ("login_throttled_total", "Login attempts rejected by the per-IP / per-account throttle.",
+         {(): LOGIN_THROTTLE.throttled}),
+    ]
+    purge = PURGE.stats()
+    counters += [
+        ("purge_jobs_total", "Purge jobs run by this worker by result.",
+         {(("result", "done"),): purge["jobs_done_total"], (("result", "failed"),): purge["jobs_failed_total"]}),
+        ("purge_rows_deleted_total", "Rows removed by purge batches in this worker.",
+         {(): purge["rows_deleted_total"]}),
+    ]
+    if WRITE_QUEUE is not None:
+        queue_stats = WRITE_QUEUE.stats()
+        gauges += [
+            ("write_queue_depth", "Vote / rating intents waiting for the writer.", {(): queue_stats["queue_depth"]}),
+            ("write_queue_latency_seconds_max", "Longest enqueue-to-commit time.",
+             {(): queue_stats["queue_latency_seconds_max"]}),
+        ]
+        counters += [
+            ("write_queue_batches_total", "Write-behind batches committed.", {(): queue_stats["batches_total"]}),
+            ("write_queue_intents_total", "Write-behind intents applied.", {(): queue_stats["intents_total"]}),
+        ]
+    if MAINTENANCE_ENABLED:
+        counters.append(
+            ("maintenance_runs_total", "Maintenance task runs by this worker by result.",
+             {(("result", "ok"),): MAINTENANCE.runs - MAINTENANCE.failures,
+              (("result", "failed"),): MAINTENANCE.failures}))
+    if SNAPSHOT is not None:
+        snap = SNAPSHOT.stats()
+        gauges.append(
+            ("read_snapshot_staleness_seconds", "Time since the read snapshot was last known current.",
+             {(): snap["staleness_seconds"] or 0}))
+        counters += [
+            ("read_snapshot_refreshes_total", "In-memory snapshot copies taken.", {(): snap["refreshes_total"]}),
+            ("read_snapshot_reads_total", "Read-route connections by source.",
+             {(("source", "snapshot"),): snap["reads_served_total"],
+              (("source", "primary_stale"),): snap["fallback_stale_total"],
+              (("source", "primary_own_write"),): snap["fallback_own_write_total"]}),
+        ]
+    return METRICS.render(gauges, counters), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# ---------------- TIMESTAMPS ----------------
+# ideas.submitted_at / comments.created_at are UTC epoch seconds; they are
+# only turned into text when a template renders them
+EPOCH_NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+def load_timezone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        # no tz database on this host (e.g. Windows without tzdata): the old fixed +1h
+        return timezone(timedelta(hours=1))
+
+DISPLAY_TIMEZONE = load_timezone(os.environ.get("DISPLAY_TIMEZONE", "Africa/Algiers"))
+
+@app.template_filter("localtime")
+def localtime_filter(epoch, fmt="%Y-%m-%d %H:%M:%S", tz=None):
+    """{{ ts|localtime }} -- epoch seconds in DISPLAY_TIMEZONE (or the zone name given as tz)."""
+    if epoch is None:
+        return ""
+    zone = load_timezone(tz) if tz else DISPLAY_TIMEZONE
+    return datetime.fromtimestamp(epoch, zone).strftime(fmt)
+
 def table_has_column(table_name: str, column_name: str) -> bool:
     """Check if a table has a given column."""
     conn = get_db()
@@ -26,28 +273,197 @@ def table_has_column(table_name: str, column_name: str) -> bool:
         return column_name in cols
     finally:
         conn.close()
-# --- ensure star_ratings table exists (safe migration) ---
-def ensure_star_ratings_table():
-    conn = get_db()
-    c = conn.cursor()
-    # ينشئ الجدول فقط لو لم يكن موجودًا
+
+# --- schema: versioned migrations (see migrations.py) ---
+# applied by prepare_db() on first use; with SCHEMA_CHECK=0 run this once per deploy
+@app.cli.command("db-upgrade")
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    conn = connect(DB_PATH)
+    applied = migrate(conn, verbose=True)
+    print(f"schema at version {schema_version(conn)}" + ("" if applied else " (nothing to do)"))
+    conn.close()
+
+# --- idea_stats rollup (vote score / stars per idea, kept current on write) ---
+# star_avg is stored (rounded like the listing shows it) so /ideas can be
+# ordered and paginated straight off idx_idea_stats_rank.
+def bump_idea_stats(c, idea_id, vote_score=0, vote_count=0, star_sum=0, star_count=0):
+    """Apply deltas to an idea's rollup row; must run inside the caller's transaction."""
+    # a soft-deleted idea has no row and must not get one back (see purge.py)
     c.execute("""
-    CREATE TABLE IF NOT EXISTS star_ratings (
-        rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        idea_id INTEGER NOT NULL,
-        user_id INTEGER NOT NULL,
-        stars INTEGER NOT NULL CHECK(stars BETWEEN 1 AND 5),
-        UNIQUE(idea_id, user_id),
-        FOREIGN KEY (idea_id) REFERENCES ideas(id) ON DELETE CASCADE,
-        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-    );
-    """)
+        INSERT INTO idea_stats (idea_id, vote_score, vote_count, star_sum, star_count)
+        SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM ideas WHERE id = ? AND deleted_at IS NULL)
+        ON CONFLICT(idea_id) DO UPDATE SET
+            vote_score = vote_score + excluded.vote_score,
+            vote_count = vote_count + excluded.vote_count,
+            star_sum = star_sum + excluded.star_sum,
+            star_count = star_count + excluded.star_count
+    """, (idea_id, vote_score, vote_count, star_sum, star_count, idea_id))
+    if star_sum or star_count:
+        c.execute(f"UPDATE idea_stats SET star_avg = {STAR_AVG_SQL} WHERE idea_id = ?", (idea_id,))
+
+# --- page cache: version counters + ETag / 304 for /ideas and /ideas/<id> ---
+# Writes bump counters in cache_versions inside their own transaction, so
+# every worker sees the change on its next read:
+#   "ideas"     -> anything shown on the /ideas listing
+#   "idea:<id>" -> anything shown on that idea's page
+#   "meta"      -> category / user names shown on both
+PAGE_CACHE = ResponseCache(int(os.environ.get("RESPONSE_CACHE_SIZE", "512")))
+
+def bump_cache_version(c, *keys):
+    c.executemany("""
+        INSERT INTO cache_versions (key, version) VALUES (?, 1)
+        ON CONFLICT(key) DO UPDATE SET version = version + 1
+    """, [(k,) for k in keys])
+
+def cache_versions(c, keys):
+    marks = ",".join("?" * len(keys))
+    c.execute(f"SELECT key, version FROM cache_versions WHERE key IN ({marks})", keys)
+    found = dict(c.fetchall())
+    return tuple(found.get(k, 0) for k in keys)
+
+def cached_page(version_keys, viewer_variant):
+    """Serve a GET page from PAGE_CACHE / answer 304 while its versions are unchanged.
+
+    version_keys(**view_args) names the counters the page depends on;
+    viewer_variant() returns what differs between viewers (role, user),
+    which is part of both the cache key and the ETag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # the same source (snapshot or primary) the view will render from
+            conn = get_read_db()
+            versions = cache_versions(conn.cursor(), version_keys(**kwargs))
+            conn.close()
+            variant = viewer_variant()
+            etag = make_etag(request.full_path, variant, versions)
+
+            if request.if_none_match.contains_weak(etag):
+                PAGE_CACHE.count_not_modified()
+                resp = make_response("", 304)
+            else:
+                key = (request.full_path, variant)
+                body = PAGE_CACHE.get(key, etag)
+                if body is not None:
+                    resp = make_response(body)
+                else:
+                    resp = make_response(view(**kwargs))
+                    if resp.status_code != 200:
+                        return resp
+                    PAGE_CACHE.put(key, etag, resp.get_data())
+
+            resp.set_etag(etag, weak=True)
+            # anonymous pages may be stored by the proxy; signed-in ones only by the browser
+            resp.headers["Cache-Control"] = ("private" if "user_id" in session else "public") + ", no-cache"
+            resp.vary.add("Cookie")
+            return resp
+        return wrapper
+    return decorator
+
+@app.route("/admin/page_cache")
+def admin_page_cache():
+    if session.get("role") != "admin":
+        return "Access denied"
+    return jsonify(PAGE_CACHE.stats())
+
+# --- ideas_fts full-text index (title + description, BM25-ranked search) ---
+# External-content FTS5 table over ideas; submit / edit / delete keep it in
+# sync explicitly. If this SQLite build has no FTS5, search falls back to LIKE.
+FTS_ENABLED = False     # set by prepare_db() once the schema is known
+
+def fts_index_idea(c, idea_id, title, description):
+    if FTS_ENABLED:
+        c.execute("INSERT INTO ideas_fts(rowid, title, description) VALUES (?, ?, ?)",
+                  (idea_id, title, description))
+
+def fts_unindex_idea(c, idea_id, title, description):
+    # external-content tables need the old values to remove their tokens
+    if FTS_ENABLED:
+        c.execute("INSERT INTO ideas_fts(ideas_fts, rowid, title, description) VALUES('delete', ?, ?, ?)",
+                  (idea_id, title, description))
+
+def fts_match_query(search):
+    """Turn free text into a safe FTS5 query: every word must match (as a prefix)."""
+    words = re.findall(r"\w+", search)
+    return " ".join('"{}"*'.format(w) for w in words)
+
+# snippet()/highlight() markers; swapped for <mark> after HTML-escaping the text
+HL_OPEN, HL_CLOSE = "\x02", "\x03"
+
+def highlight_markup(text):
+    escaped = str(escape(text or ""))
+    return Markup(escaped.replace(HL_OPEN, "<mark>").replace(HL_CLOSE, "</mark>"))
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Rebuild the ideas_fts full-text index from the ideas table."""
+    conn = get_db()   # prepare_db() sets FTS_ENABLED
+    if not FTS_ENABLED:
+        conn.close()
+        print("FTS5 is not available in this SQLite build.")
+        return
+    rebuild_search_index(conn)
     conn.commit()
     conn.close()
+    print("ideas_fts rebuilt.")
 
-# نفّذ التأكد عند بدء التطبيق
-ensure_star_ratings_table()
-import re
+@app.cli.command("rebuild-idea-stats")
+def rebuild_idea_stats_command():
+    """Recompute the idea_stats rollup from scratch."""
+    conn = get_db()
+    rebuild_idea_stats(conn)
+    ranking.rebuild_ranking(conn)
+    conn.commit()
+    conn.close()
+    print("idea_stats rebuilt.")
+
+@app.cli.command("rerank")
+@click.option("--rebuild", is_flag=True, help="Recompute every ranking from the votes / star_ratings tables.")
+def rerank_command(rebuild):
+    """Periodic (hourly or so): rebase the trending scores on the current time."""
+    conn = get_db()
+    if rebuild:
+        ranking.rebuild_ranking(conn)
+        print("rankings rebuilt.")
+    else:
+        ranking.rebase(conn.cursor())
+        print("trending scores rebased.")
+    conn.commit()
+    conn.close()
+
+@app.cli.command("rollup-analytics")
+@click.option("--rebuild", is_flag=True, help="Recompute the rollups from the ideas / votes / comments tables.")
+def rollup_analytics_command(rebuild):
+    """Nightly: fold old days of the admin activity rollups (or rebuild them)."""
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    if rebuild:
+        analytics.rebuild_activity(conn)
+        print("activity rollups rebuilt.")
+    else:
+        folded = analytics.compact_activity(conn)
+        print(f"folded {folded} daily rows older than {analytics.KEEP_DAYS} days.")
+    conn.commit()
+    conn.close()
+
+def idea_owner(c, idea_id):
+    """(submitter_id, category_id) of an idea, for the activity rollups; (None, None) if gone."""
+    c.execute("SELECT submitter_id, category_id FROM ideas WHERE id = ?", (idea_id,))
+    row = c.fetchone()
+    return (row["submitter_id"], row["category_id"]) if row else (None, None)
+
+def idea_is_live(c, idea_id):
+    """False for a missing idea and for one deleted but not purged yet."""
+    c.execute("SELECT 1 FROM ideas WHERE id = ? AND deleted_at IS NULL", (idea_id,))
+    return c.fetchone() is not None
+
+def user_is_live(c, user_id):
+    """False for a deleted user. Their session may outlive the delete, and a row
+    they add after the purge has run would later go with the user row through
+    ON DELETE CASCADE without idea_stats / scores being adjusted."""
+    c.execute("SELECT 1 FROM users WHERE user_id = ? AND deleted_at IS NULL", (user_id,))
+    return c.fetchone() is not None
 
 def password_strong(passwd):
     if len(passwd) < 6:
@@ -93,10 +509,7 @@ def register():
                 email=email
             )
 
-        # Password OK → hash it
-        password_hash = generate_password_hash(raw_password)
-
-        # Check email exists
+        # Check email exists (before paying for the hash)
         conn = get_db()
         c = conn.cursor()
 
@@ -110,6 +523,13 @@ def register():
                 email=email
             )
 
+        # Password OK → hash it (in the hasher pool)
+        try:
+            password_hash = HASHER.hash(raw_password)
+        except HasherBusy:
+            conn.close()
+            return "Server busy, please try again in a moment.", 503
+
         # Insert new user
         c.execute("""
             INSERT INTO users (username, email, password_hash, role)
@@ -124,18 +544,76 @@ def register():
     return render_template("register.html")
 
 
+ADMIN_USERS_PAGE = 50
+ADMIN_USERS_PAGE_MAX = 200
+ADMIN_SEARCH_COUNT_CAP = 1000   # stop counting search matches past this ("1000+")
+USER_ROLES = ("submitter", "reviewer", "admin")
+
 @app.route("/admin")
 def admin_panel():
     if session.get("role") != "admin":
         return "Access denied"
 
-    conn = get_db()
+    q = request.args.get("q", "").strip()
+    role = request.args.get("role", "")
+    role = role if role in USER_ROLES else ""
+    after = request.args.get("after", 0, type=int)
+    limit = min(request.args.get("limit", ADMIN_USERS_PAGE, type=int) or ADMIN_USERS_PAGE, ADMIN_USERS_PAGE_MAX)
+
+    # prefix match on username or email: two NOCASE index range seeks whose
+    # ids drive the page (ORed into one WHERE, SQLite walks users by rowid)
+    where, params = ["users.user_id > ?", "users.deleted_at IS NULL"], [after]
+    if q:
+        where.append("""users.user_id IN (
+            SELECT user_id FROM users WHERE username COLLATE NOCASE >= ? AND username COLLATE NOCASE < ?
+            UNION
+            SELECT user_id FROM users WHERE email COLLATE NOCASE >= ? AND email COLLATE NOCASE < ?)""")
+        params += [q, q + "\U0010ffff"] * 2
+    if role:
+        where.append("users.role = ?")
+        params.append(role)
+
+    conn = get_read_db()
     c = conn.cursor()
-    c.execute("SELECT user_id, username, email, role FROM users")
+    c.execute(f"""
+        SELECT user_id, username, email, role FROM users
+        WHERE {" AND ".join(where)}
+        ORDER BY user_id
+        LIMIT ?
+    """, params + [limit + 1])
     users = c.fetchall()
+
+    # totals: per-role counters kept by triggers; a search counts its
+    # matches, capped so a one-letter prefix stays cheap
+    if q:
+        c.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM users WHERE {' AND '.join(where[1:])} LIMIT ?)",
+                  params[1:] + [ADMIN_SEARCH_COUNT_CAP + 1])
+        total = c.fetchone()[0]
+    elif role:
+        c.execute("SELECT COALESCE(SUM(n), 0) FROM user_counts WHERE role = ?", (role,))
+        total = c.fetchone()[0]
+    else:
+        c.execute("SELECT COALESCE(SUM(n), 0) FROM user_counts")
+        total = c.fetchone()[0]
     conn.close()
 
-    return render_template("admin_users.html", users=users)
+    next_url = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_url = url_for("admin_panel", q=q or None, role=role or None, after=users[-1]["user_id"],
+                           limit=request.args.get("limit"))
+
+    return render_template("admin_users.html", users=users, q=q, role=role, roles=USER_ROLES,
+                           total=min(total, ADMIN_SEARCH_COUNT_CAP) if q else total,
+                           total_capped=bool(q) and total > ADMIN_SEARCH_COUNT_CAP,
+                           next_url=next_url, is_first_page=after == 0)
+
+
+@app.route("/admin/db_pool")
+def admin_db_pool():
+    if session.get("role") != "admin":
+        return "Access denied"
+    return jsonify(DB_POOL.stats())
 
 
 @app.route("/change_role/<int:user_id>", methods=["POST"])
@@ -162,23 +640,52 @@ def auth_home():
     return render_template("auth_home.html")
 
 # ---------------- LOGIN ----------------
+HASHER = PasswordHasher()
+LOGIN_THROTTLE = LoginThrottle(
+    ip_limit=int(os.environ.get("LOGIN_IP_LIMIT", "30")),
+    account_limit=int(os.environ.get("LOGIN_ACCOUNT_LIMIT", "10")),
+    window=float(os.environ.get("LOGIN_WINDOW_SECONDS", "300")),
+)
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form["email"].strip().lower()
         password = request.form["password"]
 
+        # shed credential stuffing before it reaches the DB / hasher;
+        # remote_addr is the client's address (ProxyFix, see TRUSTED_PROXIES)
+        if not LOGIN_THROTTLE.allow(request.remote_addr, email):
+            return "Too many login attempts, please wait a few minutes.", 429
+
         conn = get_db()
         c = conn.cursor()
-        c.execute("SELECT user_id, password_hash, role FROM users WHERE email=?", (email,))
+        c.execute("SELECT user_id, password_hash, role FROM users WHERE email=? AND deleted_at IS NULL", (email,))
         user = c.fetchone()
-        conn.close()
 
-        if user and check_password_hash(user["password_hash"], password):
+        try:
+            ok = user is not None and HASHER.verify(user["password_hash"], password)
+        except HasherBusy:
+            conn.close()
+            return "Server busy, please try again in a moment.", 503
+
+        if ok:
+            LOGIN_THROTTLE.succeeded(email)
+            # hash made with an older / cheaper method -> upgrade it now that we know the password
+            if needs_rehash(user["password_hash"]):
+                try:
+                    c.execute("UPDATE users SET password_hash = ? WHERE user_id = ? AND password_hash = ?",
+                              (HASHER.hash(password), user["user_id"], user["password_hash"]))
+                    conn.commit()
+                except HasherBusy:
+                    pass   # next login will try again
+            conn.close()
             session["user_id"] = user["user_id"]
             session["role"] = user["role"]   
             return redirect("/ideas")
 
+        conn.close()
+        LOGIN_THROTTLE.failed(request.remote_addr, email)
         return "Invalid email or password!"
 
     return render_template("login.html")
@@ -189,14 +696,44 @@ def logout():
     session.clear()
     return redirect("/login")
 
+# ---------------- DRAFTS (server-side, the cookie only keeps draft_v) ----------------
+DRAFTS = DraftStore()
+
+def save_draft(user_id, form):
+    conn = get_db()
+    c = conn.cursor()
+    session["draft_v"] = DRAFTS.save(c, user_id, form.get("title", ""), form.get("description", ""),
+                                     form.get("category_id", ""))
+    conn.commit()
+    conn.close()
+
+@app.route("/drafts/autosave", methods=["POST"])
+def autosave_draft():
+    if "user_id" not in session:
+        return jsonify({"error": "login required"}), 401
+    data = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(data, dict) or not all(isinstance(data.get(field, ""), str)
+                                             for field in ("title", "description", "category_id")):
+        return jsonify({"error": "the body must be an object with string title / description / category_id"}), 400
+    save_draft(session["user_id"], data)
+    return jsonify({"saved": True, "version": session["draft_v"]})
+
+@app.cli.command("purge-drafts")
+def purge_drafts_command():
+    """Delete idea drafts older than DRAFT_TTL_DAYS."""
+    conn = get_db()
+    removed = DRAFTS.purge_expired(conn.cursor())
+    conn.commit()
+    conn.close()
+    print(f"removed {removed} expired drafts.")
+
 # ---------------- حفظ نموذج الـ Submit مؤقتًا ثم الانتقال لإضافة كاتيجوري (Submitter) ----------------
 @app.route("/remember_form_before_category", methods=["POST"])
 def remember_form_before_category():
-    # يحفظ الحقول في session ثم يذهب إلى واجهة إضافة كاتيجوري الخاصة بالـ submitter
-    session["temp_title"] = request.form.get("title", "")
-    session["temp_description"] = request.form.get("description", "")
-    # حفظ اختيار الكاتيجوري إن كان موجودًا (قد يكون فارغا)
-    session["temp_category"] = request.form.get("category_id", "")
+    # يحفظ الحقول في draft (سيرفر) ثم يذهب إلى واجهة إضافة كاتيجوري الخاصة بالـ submitter
+    if "user_id" not in session:
+        return redirect("/login")
+    save_draft(session["user_id"], request.form)
     return redirect(url_for("submit_add_category"))
 
 
@@ -216,7 +753,9 @@ def submit_add_category():
         c = conn.cursor()
         try:
             c.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+            bump_cache_version(c, "categories")
             conn.commit()
+            forget_categories()
         except sqlite3.IntegrityError:
             conn.close()
             return "<h3 style='color:red;'>Category already exists!</h3><a href='{}'>Back</a>".format(url_for("submit_add_category"))
@@ -247,7 +786,9 @@ def add_category():
         c = conn.cursor()
         try:
             c.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+            bump_cache_version(c, "categories")
             conn.commit()
+            forget_categories()
         except sqlite3.IntegrityError:
             conn.close()
             return "<h3 style='color:red;'>Category already exists!</h3><a href='/add_category'>Back</a>"
@@ -271,13 +812,7 @@ def manage_categories():
     if "role" not in session or session["role"] != "admin":
         return "<h3 style='color:red;'>Access denied – Admins only</h3><a href='/ideas'>Back</a>"
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT category_id, name FROM categories ORDER BY name")
-    categories = c.fetchall()
-    conn.close()
-
-    return render_template("manage_categories.html", categories=categories)
+    return render_template("manage_categories.html", categories=get_all_categories())
 
 # ---------------- EDIT CATEGORY ----------------
 @app.route("/edit_category/<int:category_id>", methods=["GET", "POST"])
@@ -291,7 +826,9 @@ def edit_category(category_id):
         newname = request.form["name"].strip()
         try:
             c.execute("UPDATE categories SET name = ? WHERE category_id = ?", (newname, category_id))
+            bump_cache_version(c, "categories", "meta")
             conn.commit()
+            forget_categories()
         except sqlite3.IntegrityError:
             conn.close()
             return "<h3 style='color:red;'>Category name already exists!</h3><a href='/manage_categories'>Back</a>"
@@ -303,13 +840,41 @@ def edit_category(category_id):
     if not cat:
         return "Category not found!"
     return render_template("edit_category.html", category=cat)
+# --- category cache: the list changes rarely, so it is kept per process and
+# revalidated against cache_versions["categories"] at most every
+# CATEGORY_CACHE_CHECK_SECONDS; the worker that writes drops its copy at once.
+CATEGORY_CACHE_CHECK_SECONDS = float(os.environ.get("CATEGORY_CACHE_CHECK_SECONDS", "2"))
+_category_cache = {"version": None, "rows": [], "checked": 0.0}
+_category_lock = threading.Lock()
+
 def get_all_categories():
-    conn = get_db()
+    """[{category_id, name}] ordered by name; no query while the cached copy is fresh."""
+    now = time.monotonic()
+    with _category_lock:
+        if _category_cache["version"] is not None and now - _category_cache["checked"] < CATEGORY_CACHE_CHECK_SECONDS:
+            return _category_cache["rows"]
+
+    conn = get_read_db()
     c = conn.cursor()
-    c.execute("SELECT category_id, name FROM categories ORDER BY name ASC")
-    rows = c.fetchall()
+    version = cache_versions(c, ["categories"])[0]
+    with _category_lock:
+        fresh = _category_cache["version"] == version
+    if not fresh:
+        c.execute("SELECT category_id, name FROM categories ORDER BY name ASC")
+        rows = [dict(r) for r in c.fetchall()]
     conn.close()
-    return rows
+
+    with _category_lock:
+        if not fresh:
+            _category_cache["rows"] = rows
+            _category_cache["version"] = version
+        _category_cache["checked"] = now
+        return _category_cache["rows"]
+
+def forget_categories():
+    """Call after committing a category write."""
+    with _category_lock:
+        _category_cache["version"] = None
 
 # ---------------- DELETE CATEGORY ----------------
 @app.route("/delete_category/<int:category_id>", methods=["POST"])
@@ -322,7 +887,9 @@ def delete_category(category_id):
 
     try:
         c.execute("DELETE FROM categories WHERE category_id=?", (category_id,))
+        bump_cache_version(c, "categories")
         conn.commit()
+        forget_categories()
     except sqlite3.IntegrityError:
         conn.close()
         return render_template(
@@ -346,14 +913,20 @@ def submit_idea():
     conn = get_db()
     c = conn.cursor()
 
-    # جلب كل التصنيفات
-    c.execute("SELECT category_id, name FROM categories ORDER BY name")
-    categories = c.fetchall()
+    # جلب كل التصنيفات (من الكاش)
+    categories = get_all_categories()
+
+    # cookies from before server-side drafts: move their temp_* fields into the store
+    if "temp_title" in session:
+        save_draft(session["user_id"], {"title": session.pop("temp_title", ""),
+                                        "description": session.pop("temp_description", ""),
+                                        "category_id": session.pop("temp_category", "")})
 
-    # استرجاع البيانات المحفوظة في السشن (في حال رجع من Add Category)
-    saved_title = session.get("temp_title", "")
-    saved_desc = session.get("temp_description", "")
-    saved_cat = session.get("temp_category", "")
+    # استرجاع المسودة المحفوظة (في حال رجع من Add Category أو من autosave)
+    draft = DRAFTS.get(c, session["user_id"], session.get("draft_v")) or {}
+    saved_title = draft.get("title", "")
+    saved_desc = draft.get("description", "")
+    saved_cat = draft.get("category_id", "")
 
     if request.method == "POST":
         title = request.form["title"].strip()
@@ -361,8 +934,9 @@ def submit_idea():
         category_id = request.form.get("category_id")
         user_id = session["user_id"]
 
-        # 🔴 1 — التحقق هل يوجد عنوان فكرة مشابه سابقاً؟
-        c.execute("SELECT id FROM ideas WHERE LOWER(title) = LOWER(?)", (title,))
+        # 🔴 1 — التحقق هل يوجد عنوان فكرة مشابه سابقاً؟ (idx_ideas_title_key)
+        title_key = idea_title_key(title)
+        c.execute("SELECT id FROM ideas WHERE title_key = ?", (title_key,))
         existing = c.fetchone()
         if existing:
             conn.close()
@@ -370,20 +944,45 @@ def submit_idea():
                        categories=categories,
                        error="This idea already exists!")
 
+        # 🟠 2 — أفكار قريبة جداً؟ نحذّر المستخدم مرة واحدة قبل الإرسال
+        if not request.form.get("confirm_similar"):
+            similar = find_similar(c, title)
+            if similar:
+                conn.close()
+                return render_template("submit_idea.html",
+                                       categories=categories,
+                                       similar=similar,
+                                       saved_title=title,
+                                       saved_desc=description,
+                                       saved_cat=category_id or "")
 
         # إذا لم توجد → أضف الفكرة
-        c.execute("""
-            INSERT INTO ideas (title, description, category_id, submitter_id, submission_date)
-            VALUES (?, ?, ?, ?, datetime('now'))
-        """, (title, description, category_id, user_id))
+        try:
+            c.execute(f"""
+                INSERT INTO ideas (title, description, category_id, submitter_id, submitted_at, title_key)
+                VALUES (?, ?, ?, ?, {EPOCH_NOW_SQL}, ?)
+            """, (title, description, category_id, user_id, title_key))
+        except sqlite3.IntegrityError:
+            # same title submitted concurrently
+            conn.close()
+            return render_template("submit_idea.html",
+                       categories=categories,
+                       error="This idea already exists!")
+        new_id = c.lastrowid
+        bump_idea_stats(c, new_id)
+        update_rank(c, new_id)
+        record_user_activity(c, user_id, ideas=1)
+        record_category_activity(c, category_id, ideas=1)
+        fts_index_idea(c, new_id, title, description)
+        index_title(c, new_id, title)
+        # idea:<id> too: a "not found" page for this id may already be cached
+        bump_cache_version(c, "ideas", f"idea:{new_id}")
+        # احذف المسودة بعد الإدخال الناجح فقط
+        DRAFTS.delete(c, user_id)
 
         conn.commit()
         conn.close()
-
-        # احذف قيم السشن بعد الإدخال الناجح فقط
-        session.pop("temp_title", None)
-        session.pop("temp_description", None)
-        session.pop("temp_category", None)
+        session.pop("draft_v", None)
 
         return redirect("/ideas")
 
@@ -394,83 +993,254 @@ def submit_idea():
                            saved_desc=saved_desc,
                            saved_cat=saved_cat)
 
-# ---------------- LIST IDEAS ----------------
-@app.route("/ideas")
-def ideas():
-    search = request.args.get("search", "").strip()
-
+# ---------------- SIMILAR IDEAS (live warning while typing a title) ----------------
+@app.route("/ideas/similar")
+def similar_ideas():
+    if "user_id" not in session:
+        return jsonify([]), 401
+    title = request.args.get("title", "").strip()
+    exclude_id = request.args.get("exclude", type=int)
     conn = get_db()
     c = conn.cursor()
+    c.execute("SELECT id, title FROM ideas WHERE title_key = ?", (idea_title_key(title),))
+    exact = c.fetchone()
+    similar = find_similar(c, title, exclude_id=exclude_id) if title else []
+    conn.close()
+    return jsonify({
+        "exists": bool(exact) and exact["id"] != exclude_id,
+        "similar": similar,
+    })
 
-    if search:
-        c.execute("""
-            SELECT ideas.id, ideas.title, ideas.description, 
-       categories.name AS category,
-       ideas.submission_date, 
-       ideas.submitter_id,
-       users.username AS submitter_name
-       FROM ideas
+# ---------------- LIST IDEAS ----------------
+IDEAS_PAGE_SIZE = 20
+IDEAS_PAGE_MAX = 100
+
+IDEAS_SORTS = ("top",) + tuple(ranking.SORT_COLUMNS)
+
+def parse_ideas_cursor(raw, sort="top"):
+    """Decode an /ideas "after" cursor ("stars:score:id", "rank:id" for the
+    ranked sorts, "rank:id:landmark" for trending); None if absent or malformed."""
+    try:
+        if sort != "top":
+            rank, idea_id, *landmark = raw.split(":")
+            if len(landmark) > 1:
+                return None
+            return float(rank), int(idea_id), int(landmark[0]) if landmark else None
+        stars, score, idea_id = raw.split(":")
+        return float(stars), int(score), int(idea_id)
+    except ValueError:
+        return None
+
+def search_ideas(c, search, limit, offset):
+    """Ranked search over title + description; rows carry highlighted title / snippet."""
+    if FTS_ENABLED:
+        match = fts_match_query(search)
+        if not match:
+            return []
+        # bm25 weights: a hit in the title counts 10x a hit in the description
+        c.execute(f"""
+            SELECT ideas.id, categories.name AS category, ideas.submitted_at,
+                   COALESCE(idea_stats.vote_score, 0) AS score,
+                   COALESCE(idea_stats.star_avg, 0) AS stars,
+                   highlight(ideas_fts, 0, '{HL_OPEN}', '{HL_CLOSE}') AS title,
+                   snippet(ideas_fts, 1, '{HL_OPEN}', '{HL_CLOSE}', '…', 16) AS snippet
+            FROM ideas_fts
+            JOIN ideas ON ideas.id = ideas_fts.rowid
             LEFT JOIN categories ON ideas.category_id = categories.category_id
-            LEFT JOIN users ON ideas.submitter_id = users.user_id
-            WHERE ideas.id = ?
-        """, (f"%{search}%", f"%{search}%"))
+            LEFT JOIN idea_stats ON idea_stats.idea_id = ideas.id
+            WHERE ideas_fts MATCH ? AND ideas.deleted_at IS NULL
+            ORDER BY bm25(ideas_fts, 10.0, 1.0)
+            LIMIT ? OFFSET ?
+        """, (match, limit, offset))
     else:
         c.execute("""
-            SELECT ideas.id, ideas.title, categories.name AS category, ideas.submission_date
+            SELECT ideas.id, categories.name AS category, ideas.submitted_at,
+                   COALESCE(idea_stats.vote_score, 0) AS score,
+                   COALESCE(idea_stats.star_avg, 0) AS stars,
+                   ideas.title, substr(ideas.description, 1, 160) AS snippet
             FROM ideas
             LEFT JOIN categories ON ideas.category_id = categories.category_id
-        """)
-
-    idea_rows = c.fetchall()
-    ideas_with_extra = []
+            LEFT JOIN idea_stats ON idea_stats.idea_id = ideas.id
+            WHERE (ideas.title LIKE ? OR ideas.description LIKE ?) AND ideas.deleted_at IS NULL
+            ORDER BY ideas.id DESC
+            LIMIT ? OFFSET ?
+        """, (f"%{search}%", f"%{search}%", limit, offset))
+
+    results = []
+    for row in c.fetchall():
+        idea = dict(row)
+        idea["title"] = highlight_markup(idea["title"])
+        idea["snippet"] = highlight_markup(idea["snippet"])
+        results.append(idea)
+    return results
+
+def list_ideas_page(c, after, limit, sort="top"):
+    """One page of the listing in `sort` order after cursor `after`; returns (rows, next cursor or None)."""
+    # keyset pagination: seek into idx_idea_stats_rank (or the index of the
+    # rank column, see ranking.py) after the last row of the previous page,
+    # so page N costs the same as page 1
+    where = ""
+    params = []
+    landmark = None
+    if sort != "top":
+        column = f"idea_stats.{ranking.SORT_COLUMNS[sort]}"
+        if ranking.SORT_COLUMNS[sort] in ranking.TRENDING:
+            # trending scores are relative to the landmark rebase() moves
+            c.execute("SELECT landmark FROM rank_landmark WHERE id = 1")
+            landmark = c.fetchone()[0]
+        if after:
+            rank = after[0]
+            if landmark is not None and after[2] is not None:
+                rank = ranking.rescale(ranking.SORT_COLUMNS[sort], rank, after[2], landmark)
+            where = f"WHERE {column} <= ? AND ({column} < ? OR idea_stats.idea_id > ?)"
+            params = [rank, rank, after[1]]
+        order = f"{column} DESC, idea_stats.idea_id ASC"
+    else:
+        column = "NULL"
+        if after:
+            where = """WHERE (idea_stats.star_avg, idea_stats.vote_score) <= (?, ?)
+                         AND ((idea_stats.star_avg, idea_stats.vote_score) < (?, ?)
+                              OR idea_stats.idea_id > ?)"""
+            params = [after[0], after[1], after[0], after[1], after[2]]
+        order = "idea_stats.star_avg DESC, idea_stats.vote_score DESC, idea_stats.idea_id ASC"
+
+    c.execute(f"""
+        SELECT ideas.id, ideas.title, categories.name AS category, ideas.submitted_at,
+               idea_stats.vote_score AS score, idea_stats.star_avg AS stars, {column} AS rank
+        FROM idea_stats
+        JOIN ideas ON ideas.id = idea_stats.idea_id
+        LEFT JOIN categories ON ideas.category_id = categories.category_id
+        {where}
+        ORDER BY {order}
+        LIMIT ?
+    """, params + [limit + 1])
+    rows = c.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if sort != "top":
+        return rows, f"{last['rank']!r}:{last['id']}" + (f":{landmark}" if landmark is not None else "")
+    return rows, f"{last['stars']}:{last['score']}:{last['id']}"
 
-    for idea in idea_rows:
-        idea_id = idea["id"]
+@app.route("/ideas")
+@cached_page(lambda: ["ideas", "meta"],
+             lambda: (session.get("role"), "user_id" in session))
+def ideas():
+    search = request.args.get("search", "").strip()
 
-        # ⭐ Average stars
-        c.execute("SELECT AVG(stars) FROM star_ratings WHERE idea_id = ?", (idea_id,))
-        avg_stars = c.fetchone()[0] or 0
+    conn = get_read_db()
+    c = conn.cursor()
 
-        # 🔼 Score
-        c.execute("SELECT COALESCE(SUM(vote_value),0) FROM votes WHERE idea_id = ?", (idea_id,))
-        score = c.fetchone()[0]
+    limit = min(request.args.get("limit", IDEAS_PAGE_SIZE, type=int) or IDEAS_PAGE_SIZE, IDEAS_PAGE_MAX)
 
-        ideas_with_extra.append({
-            "id": idea["id"],
-            "title": idea["title"],
-            "category": idea["category"],
-            "stars": round(avg_stars, 1),
-            "score": score,
-            "date": idea["submission_date"],
-        })
+    # ⭐ / 🔼 come from the idea_stats rollup in the same query (no per-idea lookups)
+    if search:
+        page = max(request.args.get("page", 1, type=int) or 1, 1)
+        idea_rows = search_ideas(c, search, limit + 1, (page - 1) * limit)
+        conn.close()
 
+        next_url = None
+        if len(idea_rows) > limit:
+            idea_rows = idea_rows[:limit]
+            next_url = url_for("ideas", search=search, page=page + 1, limit=request.args.get("limit"))
+        return render_template("ideas.html", ideas=idea_rows, next_url=next_url,
+                               is_first_page=page == 1)
+
+    sort = request.args.get("sort", "top")
+    if sort not in IDEAS_SORTS:
+        sort = "top"
+    after = parse_ideas_cursor(request.args.get("after", ""), sort)
+    idea_rows, next_after = list_ideas_page(c, after, limit, sort)
     conn.close()
 
-    sorted_ideas = sorted(
-        ideas_with_extra,
-        key=lambda x: (-x["stars"], -x["score"], x["date"]),
-    )
+    next_url = None
+    if next_after:
+        next_url = url_for("ideas", sort=None if sort == "top" else sort, after=next_after,
+                           limit=request.args.get("limit"))
 
-    return render_template("ideas.html", ideas=sorted_ideas)
+    return render_template("ideas.html", ideas=idea_rows, next_url=next_url,
+                           is_first_page=after is None, sort=sort, sorts=IDEAS_SORTS)
 
 # ---------------- VIEW IDEA ----------------
-from datetime import datetime, timedelta
+COMMENT_THREADS_PAGE = 20
+COMMENT_REPLIES_PAGE = 50
+COMMENT_REPLIES_MAX = 2000
+
+def load_comment_threads(c, root_ids, replies_limit, replies_after=0):
+    """Load the given top-level comments plus a page of replies of each, as a tree.
+
+    Replies come from one UNION ALL of per-thread LIMIT seeks on
+    idx_comments_thread (replies_after: keyset, the last reply already
+    shown), so the cost is bounded by the page, not the thread size. A
+    reply whose parent is not on the page (shown on an earlier one, or an
+    imported id lower than its parent's) hangs off the thread's root.
+    """
+    if not root_ids:
+        return []
+
+    columns = """comments.comment_id, comments.user_id, comments.content, comments.created_at,
+               comments.parent_id, comments.thread_id, comments.score, users.username"""
+    marks = ",".join("?" * len(root_ids))
+    parts = [f"SELECT * FROM (SELECT {columns} FROM comments LEFT JOIN users ON comments.user_id = users.user_id "
+             f"WHERE comments.comment_id IN ({marks}))"]
+    params = list(root_ids)
+    for root_id in root_ids:
+        parts.append(f"SELECT * FROM (SELECT {columns} FROM comments LEFT JOIN users ON comments.user_id = users.user_id "
+                     "WHERE comments.thread_id = ? AND comments.comment_id > ? ORDER BY comments.comment_id LIMIT ?)")
+        params += [root_id, replies_after, replies_limit + 1]
+    c.execute(" UNION ALL ".join(parts) + " ORDER BY comment_id", params)
+
+    roots = {}
+    replies = {root_id: [] for root_id in root_ids}
+    for cmt in c.fetchall():
+        node = {
+            "comment_id": cmt["comment_id"],
+            "user_id": cmt["user_id"],
+            "content": cmt["content"],
+            "created_at": cmt["created_at"],
+            "parent_id": cmt["parent_id"],
+            "username": cmt["username"],
+            "score": cmt["score"],
+            "children": [],
+            "more_replies": False,
+            "next_replies_after": None,
+        }
+        if cmt["thread_id"] is None:
+            roots[node["comment_id"]] = node
+        else:
+            replies[cmt["thread_id"]].append(node)
+
+    # link once every node of the page is loaded: parents may come after their replies
+    for root_id, thread in replies.items():
+        root = roots[root_id]
+        if len(thread) > replies_limit:
+            thread = thread[:replies_limit]
+            root["more_replies"] = True
+            root["next_replies_after"] = thread[-1]["comment_id"]
+        nodes = {node["comment_id"]: node for node in thread}
+        nodes[root_id] = root
+        for node in thread:
+            nodes.get(node["parent_id"], root)["children"].append(node)
+    return [roots[root_id] for root_id in root_ids]
 
 @app.route("/ideas/<int:id>")
+@cached_page(lambda id: [f"idea:{id}", "meta"],
+             lambda: (session.get("user_id"), session.get("role")))
 def view_idea(id):
-    conn = get_db()
+    conn = get_read_db()
     c = conn.cursor()
 
     # ──────────────────────────────
     # جلب الفكرة
     # ──────────────────────────────
     c.execute("""
-        SELECT ideas.id, ideas.title, ideas.description, ideas.submission_date,
+        SELECT ideas.id, ideas.title, ideas.description, ideas.submitted_at,
                categories.name AS category, ideas.submitter_id,users.username AS submitter_username
         FROM ideas
         LEFT JOIN categories ON ideas.category_id = categories.category_id
         LEFT JOIN users ON ideas.submitter_id = users.user_id
-        WHERE ideas.id = ?
+        WHERE ideas.id = ? AND ideas.deleted_at IS NULL
     """, (id,))
     
     idea = c.fetchone()
@@ -479,24 +1249,13 @@ def view_idea(id):
         return "Idea not found!"
 
     # ──────────────────────────────
-    # تعديل توقيت الفكرة +1 ساعة
+    # السكور + النجوم (Average) من idea_stats
     # ──────────────────────────────
-    raw_time = idea["submission_date"]
-    converted_time = datetime.strptime(raw_time, "%Y-%m-%d %H:%M:%S") + timedelta(hours=1)
-    idea_time = converted_time.strftime("%Y-%m-%d %H:%M:%S")
-
-    # ──────────────────────────────
-    # حساب السكور
-    # ──────────────────────────────
-    c.execute("SELECT COALESCE(SUM(vote_value),0) FROM votes WHERE idea_id=?", (id,))
-    score = c.fetchone()[0]
-
-    # ──────────────────────────────
-    # حساب النجوم (Average)
-    # ──────────────────────────────
-    c.execute("SELECT AVG(stars) FROM star_ratings WHERE idea_id=?", (id,))
-    avg_row = c.fetchone()
-    avg_stars = round(avg_row[0], 1) if avg_row and avg_row[0] else 0
+    c.execute("SELECT vote_score, star_sum, star_count, comment_count FROM idea_stats WHERE idea_id=?", (id,))
+    stats = c.fetchone()
+    score = stats["vote_score"] if stats else 0
+    avg_stars = round(stats["star_sum"] / stats["star_count"], 1) if stats and stats["star_count"] else 0
+    comment_count = stats["comment_count"] if stats else 0
 
     # ──────────────────────────────
     # نجوم المستخدم (نظهرها فقط للمستخدم)
@@ -509,47 +1268,65 @@ def view_idea(id):
             user_stars = r[0]
 
     # ──────────────────────────────
-    # تحميل التعليقات + تعديل الوقت +1 ساعة
+    # تحميل التعليقات (صفحة من الـ threads)
     # ──────────────────────────────
-    c.execute("""
-        SELECT comments.comment_id, comments.user_id, comments.content, comments.timestamp,
-               comments.parent_id, users.username,
-               COALESCE((SELECT SUM(vote_value) FROM comment_votes WHERE comment_id = comments.comment_id), 0) AS score
-        FROM comments
-        LEFT JOIN users ON comments.user_id = users.user_id
-        WHERE comments.idea_id = ?
-        ORDER BY comments.timestamp ASC
-    """, (id,))
-    
-    comments_raw = c.fetchall()
-    comments = []
-
-    for cmt in comments_raw:
-        raw_t = cmt["timestamp"]
-        fixed_t = datetime.strptime(raw_t, "%Y-%m-%d %H:%M:%S") + timedelta(hours=1)
-        final_time = fixed_t.strftime("%Y-%m-%d %H:%M:%S")
-
-        comments.append({
-            "comment_id": cmt["comment_id"],
-            "user_id": cmt["user_id"],
-            "content": cmt["content"],
-            "timestamp": final_time,
-            "parent_id": cmt["parent_id"],
-            "username": cmt["username"],
-            "score": cmt["score"]
-        })
+    thread = request.args.get("thread", type=int)
+    comments_sort = "top" if request.args.get("comments_sort") == "top" else "oldest"
+    after = request.args.get("comments_after", "")
+    # one thread on its own page: its replies page by id after the last one shown
+    replies_after = (request.args.get("replies_after", 0, type=int) or 0) if thread else 0
 
+    if thread:
+        c.execute("""
+            SELECT comment_id FROM comments
+            WHERE idea_id = ? AND parent_id IS NULL AND comment_id = ?
+        """, (id, thread))
+    elif comments_sort == "top":
+        # keyset on (score DESC, comment_id ASC) over idx_comments_idea_top
+        try:
+            after_score, after_id = (int(v) for v in after.split(":"))
+            keyset = "AND score <= ? AND (score < ? OR comment_id > ?)"
+            params = [after_score, after_score, after_id]
+        except ValueError:
+            keyset, params = "", []
+        c.execute(f"""
+            SELECT comment_id, score FROM comments
+            WHERE idea_id = ? AND parent_id IS NULL {keyset}
+            ORDER BY score DESC, comment_id ASC
+            LIMIT ?
+        """, [id] + params + [COMMENT_THREADS_PAGE + 1])
+    else:
+        c.execute("""
+            SELECT comment_id, score FROM comments
+            WHERE idea_id = ? AND parent_id IS NULL AND comment_id > ?
+            ORDER BY comment_id
+            LIMIT ?
+        """, (id, int(after) if after.isdigit() else 0, COMMENT_THREADS_PAGE + 1))
+    root_rows = c.fetchall()
+    root_ids = [r["comment_id"] for r in root_rows]
+
+    next_comments_after = None
+    if len(root_ids) > COMMENT_THREADS_PAGE:
+        root_ids = root_ids[:COMMENT_THREADS_PAGE]
+        last = root_rows[COMMENT_THREADS_PAGE - 1]
+        next_comments_after = (f"{last['score']}:{last['comment_id']}" if comments_sort == "top"
+                               else last["comment_id"])
+
+    comments = load_comment_threads(c, root_ids, COMMENT_REPLIES_PAGE, replies_after)
     conn.close()
 
     return render_template(
         "view_idea.html",
         idea=idea,
-        idea_time=idea_time,           # ← الوقت المصحح
         score=score,
         avg_stars=avg_stars,
         user_stars=user_stars,         # ← عدد النجوم الخاصة بالمستخدم فقط
-        comments=comments,
-        
+        comments=comments,             # ← top-level threads, replies nested in "children"
+        comment_count=comment_count,
+        next_comments_after=next_comments_after,
+        comments_sort=comments_sort,
+        thread=thread,
+        replies_after=replies_after,
     )
 
 
@@ -563,7 +1340,7 @@ def edit_idea(idea_id):
     c = conn.cursor()
 
     # 1) جلب صاحب الفكرة
-    c.execute("SELECT submitter_id FROM ideas WHERE id = ?", (idea_id,))
+    c.execute("SELECT submitter_id FROM ideas WHERE id = ? AND deleted_at IS NULL", (idea_id,))
     row = c.fetchone()
 
     if not row:
@@ -579,18 +1356,43 @@ def edit_idea(idea_id):
         return "<h3 style='color:red;'>You can edit ONLY your own ideas.</h3><a href='/ideas'>Back</a>"
 
 
-    c.execute("SELECT category_id, name FROM categories ORDER BY name")
-    cats = c.fetchall()
+    cats = get_all_categories()
 
     if request.method == "POST":
         title = request.form["title"].strip()
         description = request.form["description"].strip()
         category_id = request.form.get("category_id")
 
-        c.execute("""UPDATE ideas 
-                     SET title=?, description=?, category_id=? 
-                     WHERE id=?""",
-                  (title, description, category_id, idea_id))
+        title_key = idea_title_key(title)
+        c.execute("SELECT id FROM ideas WHERE title_key = ? AND id != ?", (title_key, idea_id))
+        if c.fetchone():
+            c.execute("SELECT id, title, description, category_id FROM ideas WHERE id=?", (idea_id,))
+            idea = c.fetchone()
+            conn.close()
+            return render_template("edit_idea.html", idea=idea, categories=cats,
+                                   error="Another idea already has this title!")
+
+        c.execute("SELECT title, description FROM ideas WHERE id=?", (idea_id,))
+        old = c.fetchone()
+        fts_unindex_idea(c, idea_id, old["title"], old["description"])
+        fts_index_idea(c, idea_id, title, description)
+        if old["title"] != title:
+            unindex_title(c, idea_id)
+            index_title(c, idea_id, title)
+        try:
+            c.execute("""UPDATE ideas 
+                         SET title=?, description=?, category_id=?, title_key=? 
+                         WHERE id=?""",
+                      (title, description, category_id, title_key, idea_id))
+        except sqlite3.IntegrityError:
+            # same title saved concurrently by another edit / submit
+            conn.rollback()
+            c.execute("SELECT id, title, description, category_id FROM ideas WHERE id=?", (idea_id,))
+            idea = c.fetchone()
+            conn.close()
+            return render_template("edit_idea.html", idea=idea, categories=cats,
+                                   error="Another idea already has this title!")
+        bump_cache_version(c, "ideas", f"idea:{idea_id}")
         conn.commit()
         conn.close()
         return redirect(f"/ideas/{idea_id}")
@@ -611,7 +1413,7 @@ def delete_idea(idea_id):
     conn = get_db()
     c = conn.cursor()
 
-    c.execute("SELECT submitter_id FROM ideas WHERE id = ?", (idea_id,))
+    c.execute("SELECT submitter_id FROM ideas WHERE id = ? AND deleted_at IS NULL", (idea_id,))
     row = c.fetchone()
 
     if not row:
@@ -629,18 +1431,279 @@ def delete_idea(idea_id):
         conn.close()
         return "<h3 style='color:red;'>You can delete ONLY your own ideas.</h3><a href='/ideas'>Back</a>"
 
-    # 3) حذف الأصوات والتعليقات
-    c.execute("DELETE FROM votes WHERE idea_id = ?", (idea_id,))
-    c.execute("DELETE FROM comments WHERE idea_id = ?", (idea_id,))
-
-    # 4) حذف الفكرة
-    c.execute("DELETE FROM ideas WHERE id = ?", (idea_id,))
+    # 3) إخفاء الفكرة فوراً، والأصوات والتعليقات تُحذف في الخلفية (purge)
+    soft_delete_idea(c, idea_id)
     conn.commit()
     conn.close()
+    PURGE.start()
 
     return redirect("/ideas")
 
+# ---------------- PURGE (soft delete now, dependent rows in batches later; see purge.py) ----------------
+def soft_delete_idea(c, idea_id):
+    """Hide an idea everywhere at once and queue its purge; False if already gone. Does not commit."""
+    c.execute("SELECT title, description FROM ideas WHERE id = ? AND deleted_at IS NULL", (idea_id,))
+    row = c.fetchone()
+    if row is None:
+        return False
+    # title_key -> NULL: the title may be submitted again right away
+    c.execute(f"UPDATE ideas SET deleted_at = {EPOCH_NOW_SQL}, title_key = NULL WHERE id = ?", (idea_id,))
+    c.execute("DELETE FROM idea_stats WHERE idea_id = ?", (idea_id,))
+    fts_unindex_idea(c, idea_id, row["title"], row["description"])
+    unindex_title(c, idea_id)
+    bump_cache_version(c, "ideas", f"idea:{idea_id}")
+    purge.enqueue(c, "idea", idea_id)
+    return True
+
+def soft_delete_user(c, user_id):
+    """Hide a (non-admin) user and queue the purge; False if gone or an admin. Does not commit."""
+    c.execute(f"""
+        UPDATE users SET deleted_at = {EPOCH_NOW_SQL}
+        WHERE user_id = ? AND deleted_at IS NULL AND role != 'admin'
+    """, (user_id,))
+    if c.rowcount == 0:
+        return False
+    bump_cache_version(c, "meta")
+    purge.enqueue(c, "user", user_id)
+    return True
+
+def purge_batch(c, sql, target_id, limit):
+    c.execute(sql, (target_id, limit))
+    return c.rowcount
+
+# idea: comment votes, replies detached from their parents (so deleting a
+# comment never cascades down a thread), comments, votes, ratings, and
+# finally the idea row
+def purge_idea_comment_votes(c, idea_id, limit):
+    return purge_batch(c, """
+        DELETE FROM comment_votes WHERE vote_id IN (
+            SELECT comment_votes.vote_id FROM comments
+            JOIN comment_votes ON comment_votes.comment_id = comments.comment_id
+            WHERE comments.idea_id = ? LIMIT ?)
+    """, idea_id, limit)
+
+def purge_idea_replies(c, idea_id, limit):
+    return purge_batch(c, """
+        UPDATE comments SET parent_id = NULL WHERE comment_id IN (
+            SELECT comment_id FROM comments WHERE idea_id = ? AND parent_id IS NOT NULL LIMIT ?)
+    """, idea_id, limit)
+
+def purge_idea_comments(c, idea_id, limit):
+    return purge_batch(c, """
+        DELETE FROM comments WHERE comment_id IN (SELECT comment_id FROM comments WHERE idea_id = ? LIMIT ?)
+    """, idea_id, limit)
+
+def purge_idea_votes(c, idea_id, limit):
+    return purge_batch(c, "DELETE FROM votes WHERE vote_id IN (SELECT vote_id FROM votes WHERE idea_id = ? LIMIT ?)",
+                       idea_id, limit)
+
+def purge_idea_ratings(c, idea_id, limit):
+    return purge_batch(c, """
+        DELETE FROM star_ratings WHERE rating_id IN (SELECT rating_id FROM star_ratings WHERE idea_id = ? LIMIT ?)
+    """, idea_id, limit)
+
+def purge_idea_row(c, idea_id, limit):
+    c.execute("DELETE FROM ideas WHERE id = ? AND deleted_at IS NOT NULL", (idea_id,))
+    return c.rowcount
+
+# user: take their votes / ratings / comment votes back out of the aggregates
+# while deleting them, detach their comments and ideas (kept, as before), then
+# delete the user row
+def purge_user_votes(c, user_id, limit):
+    c.execute("SELECT vote_id, idea_id, vote_value, voted_at FROM votes WHERE user_id = ? LIMIT ?", (user_id, limit))
+    rows = c.fetchall()
+    for row in rows:
+        bump_idea_stats(c, row["idea_id"], vote_score=-row["vote_value"], vote_count=-1)
+        update_rank(c, row["idea_id"], [(-row["vote_value"], row["voted_at"])])
+    if rows:
+        c.execute(f"DELETE FROM votes WHERE vote_id IN ({','.join('?' * len(rows))})", [r["vote_id"] for r in rows])
+        bump_cache_version(c, "ideas", *{f"idea:{r['idea_id']}" for r in rows})
+    return len(rows)
+
+def purge_user_ratings(c, user_id, limit):
+    c.execute("SELECT rating_id, idea_id, stars, rated_at FROM star_ratings WHERE user_id = ? LIMIT ?",
+              (user_id, limit))
+    rows = c.fetchall()
+    for row in rows:
+        bump_idea_stats(c, row["idea_id"], star_sum=-row["stars"], star_count=-1)
+        update_rank(c, row["idea_id"], [(-rating_points(row["stars"]), row["rated_at"])])
+    if rows:
+        c.execute(f"DELETE FROM star_ratings WHERE rating_id IN ({','.join('?' * len(rows))})",
+                  [r["rating_id"] for r in rows])
+        bump_cache_version(c, "ideas", *{f"idea:{r['idea_id']}" for r in rows})
+    return len(rows)
+
+def purge_user_comment_votes(c, user_id, limit):
+    c.execute("SELECT vote_id, comment_id, vote_value FROM comment_votes WHERE user_id = ? LIMIT ?", (user_id, limit))
+    rows = c.fetchall()
+    c.executemany("UPDATE comments SET score = score - ? WHERE comment_id = ?",
+                  [(r["vote_value"], r["comment_id"]) for r in rows])
+    if rows:
+        c.execute(f"DELETE FROM comment_votes WHERE vote_id IN ({','.join('?' * len(rows))})",
+                  [r["vote_id"] for r in rows])
+    return len(rows)
+
+def purge_user_comments(c, user_id, limit):
+    return purge_batch(c, """
+        UPDATE comments SET user_id = NULL WHERE comment_id IN (
+            SELECT comment_id FROM comments WHERE user_id = ? LIMIT ?)
+    """, user_id, limit)
+
+def purge_user_ideas(c, user_id, limit):
+    return purge_batch(c, "UPDATE ideas SET submitter_id = NULL WHERE id IN (SELECT id FROM ideas WHERE submitter_id = ? LIMIT ?)",
+                       user_id, limit)
+
+def purge_user_row(c, user_id, limit):
+    c.execute("DELETE FROM users WHERE user_id = ? AND deleted_at IS NOT NULL", (user_id,))
+    # author names on many pages
+    bump_cache_version(c, "ideas", "meta")
+    return c.rowcount
+
+PURGE = PurgeQueue(DB_PATH, {
+    "idea": [purge_idea_comment_votes, purge_idea_replies, purge_idea_comments, purge_idea_votes, purge_idea_ratings, purge_idea_row],
+    "user": [purge_user_votes, purge_user_ratings, purge_user_comment_votes, purge_user_comments,
+             purge_user_ideas, purge_user_row],
+})
+
+@app.route("/admin/bulk_delete", methods=["POST"])
+def admin_bulk_delete():
+    if session.get("role") != "admin":
+        return "Access denied"
+    kind = request.form.get("kind")
+    if kind not in ("idea", "user"):
+        return "kind must be idea or user", 400
+    try:
+        ids = {int(i) for i in re.split(r"[\s,]+", " ".join(request.form.getlist("ids"))) if i}
+    except ValueError:
+        return "ids must be integers", 400
+
+    conn = get_db()
+    c = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    soft_delete = soft_delete_idea if kind == "idea" else soft_delete_user
+    queued = sum(soft_delete(c, target_id) for target_id in sorted(ids))
+    conn.commit()
+    conn.close()
+    PURGE.start()
+
+    flash(f"{queued} {kind}{'' if queued == 1 else 's'} deleted; related data is being removed in the background.",
+          "success")
+    return redirect(url_for("admin_panel") if kind == "user" else url_for("admin_dashboard"))
+
+@app.route("/admin/purge_jobs")
+def admin_purge_jobs():
+    if session.get("role") != "admin":
+        return "Access denied"
+    conn = get_db()
+    counts, jobs = purge.job_progress(conn.cursor())
+    conn.close()
+    return jsonify(dict(PURGE.stats(), jobs_by_state=counts, recent=jobs))
+
+@app.cli.command("purge")
+def purge_command():
+    """Finish queued / interrupted purges of deleted ideas and users."""
+    conn = get_db()
+    finished = PURGE.drain(conn)
+    conn.close()
+    print(f"{finished} purge jobs finished.")
+
 # ---------------- VOTE (UP / DOWN) ----------------
+def record_vote_activity(c, idea_id, user_id, votes):
+    record_user_activity(c, user_id, votes=votes)
+    record_category_activity(c, idea_owner(c, idea_id)[1], votes=votes)
+
+def apply_vote(c, idea_id, user_id, vote_value):
+    """Record an up/down vote; the same vote twice removes it (unvote). Does not commit."""
+    if not idea_is_live(c, idea_id) or not user_is_live(c, user_id):
+        return
+    now = int(time.time())
+    # see existing vote
+    c.execute("SELECT vote_value, voted_at FROM votes WHERE idea_id = ? AND user_id = ?", (idea_id, user_id))
+    row = c.fetchone()
+    if row:
+        prev = row["vote_value"]
+        # take the old vote back out of the trending scores at its own time
+        events = [(-prev, row["voted_at"])]
+        if prev == vote_value:
+            # same vote -> remove (unvote)
+            c.execute("DELETE FROM votes WHERE idea_id = ? AND user_id = ?", (idea_id, user_id))
+            bump_idea_stats(c, idea_id, vote_score=-prev, vote_count=-1)
+            record_vote_activity(c, idea_id, user_id, -1)
+        else:
+            # change vote
+            c.execute("UPDATE votes SET vote_value = ?, voted_at = ? WHERE idea_id = ? AND user_id = ?",
+                      (vote_value, now, idea_id, user_id))
+            bump_idea_stats(c, idea_id, vote_score=vote_value - prev)
+            events.append((vote_value, now))
+        update_rank(c, idea_id, events)
+    else:
+        # insert vote
+        try:
+            c.execute("INSERT INTO votes (idea_id, user_id, vote_value, voted_at) VALUES (?, ?, ?, ?)",
+                      (idea_id, user_id, vote_value, now))
+            bump_idea_stats(c, idea_id, vote_score=vote_value, vote_count=1)
+            record_vote_activity(c, idea_id, user_id, 1)
+            update_rank(c, idea_id, [(vote_value, now)])
+        except sqlite3.IntegrityError:
+            # unique constraint violation or other -> try update
+            c.execute("SELECT vote_value, voted_at FROM votes WHERE idea_id = ? AND user_id = ?", (idea_id, user_id))
+            row = c.fetchone()
+            if row:
+                c.execute("UPDATE votes SET vote_value = ?, voted_at = ? WHERE idea_id = ? AND user_id = ?",
+                          (vote_value, now, idea_id, user_id))
+                bump_idea_stats(c, idea_id, vote_score=vote_value - row["vote_value"])
+                update_rank(c, idea_id, [(-row["vote_value"], row["voted_at"]), (vote_value, now)])
+    if c.connection.in_transaction:
+        bump_cache_version(c, "ideas", f"idea:{idea_id}")
+
+def apply_rating(c, idea_id, user_id, stars):
+    """Insert or change the user's 1-5 star rating. Does not commit."""
+    if not idea_is_live(c, idea_id) or not user_is_live(c, user_id):
+        return
+    now = int(time.time())
+    c.execute("SELECT stars, rated_at FROM star_ratings WHERE idea_id=? AND user_id=?", (idea_id, user_id))
+    prev = c.fetchone()
+    c.execute("""
+        INSERT INTO star_ratings (idea_id, user_id, stars, rated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(idea_id, user_id) DO UPDATE SET stars=excluded.stars, rated_at=excluded.rated_at
+    """, (idea_id, user_id, stars, now))
+    submitter_id, category_id = idea_owner(c, idea_id)
+    if prev:
+        bump_idea_stats(c, idea_id, star_sum=stars - prev["stars"])
+        received = dict(star_sum=stars - prev["stars"])
+    else:
+        bump_idea_stats(c, idea_id, star_sum=stars, star_count=1)
+        received = dict(star_sum=stars, star_count=1)
+        record_user_activity(c, user_id, ratings=1)
+    events = [(rating_points(stars), now)]
+    if prev:
+        events.append((-rating_points(prev["stars"]), prev["rated_at"]))
+    update_rank(c, idea_id, events)
+    record_user_activity(c, submitter_id, **received)
+    record_category_activity(c, category_id, ratings=0 if prev else 1, **received)
+    bump_cache_version(c, "ideas", f"idea:{idea_id}")
+
+# WRITE_BEHIND=1: votes and ratings go through one writer thread per process
+# that commits them in batches (see write_queue.py); the request still waits
+# for its batch, so the redirect shows the user's own vote
+WRITE_QUEUE = None
+if os.environ.get("WRITE_BEHIND") == "1":
+    WRITE_QUEUE = WriteBehindQueue(
+        DB_PATH,
+        {"vote": apply_vote, "rate": apply_rating},
+        batch_max=int(os.environ.get("WRITE_BATCH_MAX", "200")),
+        batch_delay=float(os.environ.get("WRITE_BATCH_DELAY_MS", "5")) / 1000,
+    )
+
+@app.route("/admin/write_queue")
+def admin_write_queue():
+    if session.get("role") != "admin":
+        return "Access denied"
+    if WRITE_QUEUE is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(WRITE_QUEUE.stats(), enabled=True))
+
 @app.route("/vote/<int:idea_id>/<action>")
 def vote(idea_id, action):
     if "user_id" not in session:
@@ -654,6 +1717,14 @@ def vote(idea_id, action):
         return redirect(f"/ideas/{idea_id}")
     user_id = session["user_id"]
     vote_value = 1 if action == "up" else -1
+
+    if WRITE_QUEUE is not None:
+        g.wrote = True
+        if not WRITE_QUEUE.submit("vote", idea_id, user_id, vote_value):
+            return (f"<h3>Your vote could not be saved right now, please try again.</h3>"
+                    f"<a href='/ideas/{idea_id}'>Back</a>"), 503
+        return redirect(f"/ideas/{idea_id}")
+
     conn = get_db()
     c = conn.cursor()
     # ensure votes table exists with vote_value column
@@ -661,24 +1732,7 @@ def vote(idea_id, action):
     if not c.fetchone():
         conn.close()
         return "<h3>Voting is not set up in the database.</h3><a href='/ideas'>Back</a>"
-    # see existing vote
-    c.execute("SELECT vote_value FROM votes WHERE idea_id = ? AND user_id = ?", (idea_id, user_id))
-    row = c.fetchone()
-    if row:
-        prev = row["vote_value"]
-        if prev == vote_value:
-            # same vote -> remove (unvote)
-            c.execute("DELETE FROM votes WHERE idea_id = ? AND user_id = ?", (idea_id, user_id))
-        else:
-            # change vote
-            c.execute("UPDATE votes SET vote_value = ? WHERE idea_id = ? AND user_id = ?", (vote_value, idea_id, user_id))
-    else:
-        # insert vote
-        try:
-            c.execute("INSERT INTO votes (idea_id, user_id, vote_value) VALUES (?, ?, ?)", (idea_id, user_id, vote_value))
-        except sqlite3.IntegrityError:
-            # unique constraint violation or other -> try update
-            c.execute("UPDATE votes SET vote_value = ? WHERE idea_id = ? AND user_id = ?", (vote_value, idea_id, user_id))
+    apply_vote(c, idea_id, user_id, vote_value)
     conn.commit()
     conn.close()
     return redirect(f"/ideas/{idea_id}")
@@ -693,24 +1747,58 @@ def rate(idea_id, stars):
 
     user_id = session["user_id"]
 
+    if WRITE_QUEUE is not None:
+        g.wrote = True
+        if not WRITE_QUEUE.submit("rate", idea_id, user_id, stars):
+            return (f"<h3>Your rating could not be saved right now, please try again.</h3>"
+                    f"<a href='/ideas/{idea_id}'>Back</a>"), 503
+        return redirect(f"/ideas/{idea_id}")
+
     conn = get_db()
     c = conn.cursor()
 
     # أدخل أو عدّل التقييم
     try:
-        c.execute("""
-            INSERT INTO star_ratings (idea_id, user_id, stars)
-            VALUES (?, ?, ?)
-            ON CONFLICT(idea_id, user_id) DO UPDATE SET stars=excluded.stars
-        """, (idea_id, user_id, stars))
+        apply_rating(c, idea_id, user_id, stars)
     except Exception as e:
         print("Rating error:", e)
+        conn.rollback()
 
     conn.commit()
     conn.close()
 
     return redirect(f"/ideas/{idea_id}")
 
+def insert_comment(c, idea_id, user_id, content, parent_id=None):
+    """Add a comment (or reply); returns its comment_id, None if the idea (or the user) does not exist. Does not commit."""
+    # تأكد أن idea_id موجود
+    c.execute("SELECT category_id FROM ideas WHERE id=? AND deleted_at IS NULL", (idea_id,))
+    idea = c.fetchone()
+    if not idea or not user_is_live(c, user_id):
+        return None
+
+    # parent_id يجب أن يشير لتعليق موجود (في نفس الفكرة) أو NULL
+    thread_id = None
+    if parent_id:
+        c.execute("SELECT comment_id, thread_id FROM comments WHERE comment_id=? AND idea_id=?",
+                  (parent_id, idea_id))
+        parent = c.fetchone()
+        if not parent:
+            parent_id = None  # حماية
+        else:
+            thread_id = parent["thread_id"] or parent["comment_id"]
+
+    # إضافة التعليق
+    c.execute(f"""
+        INSERT INTO comments (idea_id, user_id, content, parent_id, thread_id, created_at)
+        VALUES (?, ?, ?, ?, ?, {EPOCH_NOW_SQL})
+    """, (idea_id, user_id, content, parent_id, thread_id))
+    comment_id = c.lastrowid
+    record_user_activity(c, user_id, comments=1)
+    record_category_activity(c, idea["category_id"], comments=1)
+    bump_cache_version(c, f"idea:{idea_id}")
+    return comment_id
+
 @app.route("/add_comment/<int:idea_id>", methods=["POST"])
 def add_comment(idea_id):
     if "user_id" not in session:
@@ -724,25 +1812,10 @@ def add_comment(idea_id):
 
     conn = get_db()
     c = conn.cursor()
-
-    # تأكد أن idea_id موجود
-    c.execute("SELECT id FROM ideas WHERE id=?", (idea_id,))
-    if not c.fetchone():
+    comment_id = insert_comment(c, idea_id, session["user_id"], content, parent_id)
+    if comment_id is None:
         conn.close()
         return "Idea not found"
-
-    # parent_id يجب أن يشير لتعليق موجود أو NULL
-    if parent_id:
-        c.execute("SELECT comment_id FROM comments WHERE comment_id=?", (parent_id,))
-        if not c.fetchone():
-            parent_id = None  # حماية
-
-    # إضافة التعليق
-    c.execute("""
-        INSERT INTO comments (idea_id, user_id, content, parent_id, timestamp)
-        VALUES (?, ?, ?, ?, datetime('now'))
-    """, (idea_id, session["user_id"], content, parent_id))
-    
     conn.commit()
     conn.close()
 
@@ -771,6 +1844,7 @@ def delete_comment(comment_id):
     # حذف الكومنت (والردود عليه إذا موجودة)
     c.execute("DELETE FROM comments WHERE parent_id=?", (comment_id,))
     c.execute("DELETE FROM comments WHERE comment_id=?", (comment_id,))
+    bump_cache_version(c, f"idea:{row['idea_id']}")
     conn.commit()
     conn.close()
 
@@ -781,27 +1855,25 @@ def admin_dashboard():
     if "user_id" not in session or session.get("role") != "admin":
         return "<h3 style='color:red;'>Access denied — Admins only.</h3>"
 
+    # ?days=7|30|90|all -- every panel is one query over the daily rollups
+    days_arg = request.args.get("days", "30")
+    days = None if days_arg == "all" else max(min(request.args.get("days", 30, type=int) or 30, 3650), 1)
+
     conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT user_id, username, email, role FROM users")
-    users = c.fetchall()
+    top_users = analytics.top_users(c, days)
+    categories = analytics.category_activity(c, days)
+    daily = analytics.daily_totals(c, days)
     conn.close()
 
-    return render_template("admin_dashboard.html", users=users)
+    return render_template("admin_dashboard.html", top_users=top_users, categories=categories,
+                           daily=daily, days=days_arg if days is None else days)
 
-@app.route("/comment_vote/<int:comment_id>/<action>")
-def comment_vote(comment_id, action):
-    if "user_id" not in session:
-        return redirect("/login")
-
-    user_id = session["user_id"]
-    if action not in ("up", "down"):
-        return redirect(request.referrer)
-
-    vote_value = 1 if action == "up" else -1
-
-    conn = get_db()
-    c = conn.cursor()
+def apply_comment_vote(c, comment_id, user_id, vote_value):
+    """Toggle / change the user's vote on a comment; returns the new score (None if no such comment, or user)."""
+    c.execute("SELECT 1 FROM comments WHERE comment_id=?", (comment_id,))
+    if not c.fetchone() or not user_is_live(c, user_id):
+        return None
 
     # هل قام المستخدم بالتصويت مسبقاً؟
     c.execute("SELECT vote_value FROM comment_votes WHERE comment_id=? AND user_id=?", 
@@ -813,6 +1885,7 @@ def comment_vote(comment_id, action):
             # نفس التصويت → إزالة
             c.execute("DELETE FROM comment_votes WHERE comment_id=? AND user_id=?",
                       (comment_id, user_id))
+            delta = -row["vote_value"]
         else:
             # تغيير التصويت
             c.execute("""
@@ -820,13 +1893,37 @@ def comment_vote(comment_id, action):
                 SET vote_value=? 
                 WHERE comment_id=? AND user_id=?
             """, (vote_value, comment_id, user_id))
+            delta = vote_value - row["vote_value"]
     else:
         # تصويت جديد
         c.execute("""
             INSERT INTO comment_votes (comment_id, user_id, vote_value)
             VALUES (?, ?, ?)
         """, (comment_id, user_id, vote_value))
+        delta = vote_value
+
+    # نفس الـ transaction: حدّث سكور الكومنت
+    c.execute("UPDATE comments SET score = score + ? WHERE comment_id = ? RETURNING idea_id, score", (delta, comment_id))
+    cmt = c.fetchone()
+    if not cmt:
+        return None
+    bump_cache_version(c, f"idea:{cmt['idea_id']}")
+    return cmt["score"]
+
+@app.route("/comment_vote/<int:comment_id>/<action>")
+def comment_vote(comment_id, action):
+    if "user_id" not in session:
+        return redirect("/login")
 
+    user_id = session["user_id"]
+    if action not in ("up", "down"):
+        return redirect(request.referrer)
+
+    vote_value = 1 if action == "up" else -1
+
+    conn = get_db()
+    c = conn.cursor()
+    apply_comment_vote(c, comment_id, user_id, vote_value)
     conn.commit()
     conn.close()
 
@@ -839,15 +1936,467 @@ def delete_user(user_id):
 
     conn = get_db()
     c = conn.cursor()
-
-    # لا نحذف الأفكار الخاصة باليوزر
-    c.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+    # hidden now; votes, ratings and comment links are purged in the background
+    deleted = soft_delete_user(c, user_id)
     conn.commit()
     conn.close()
+    if not deleted:
+        flash("User not found (or an admin).", "danger")
+        return redirect(url_for("admin_panel"))
+    PURGE.start()
 
     flash("User deleted successfully.", "success")
     return redirect(url_for("admin_panel"))
 
+# ---------------- JSON API (v1) ----------------
+# Same data and write paths as the HTML routes, for the page's JS and for
+# integrations. Auth is the normal session cookie; errors are {"error": ...}.
+API_PREFIX = "/api/v1"
+API_BATCH_MAX = 100
+
+def api_error(message, status):
+    return jsonify({"error": message}), status
+
+def api_user():
+    return session.get("user_id")
+
+def api_json():
+    """The request's JSON object body ({} if there is none); None if it is JSON but not an object."""
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    return data if isinstance(data, dict) else None
+
+def idea_summaries(c, ids, user_id=None):
+    """Ideas with their aggregates (and the viewer's vote / stars) for a list of ids, in that order."""
+    if not ids:
+        return []
+    marks = ",".join("?" * len(ids))
+    c.execute(f"""
+        SELECT ideas.id, ideas.title, ideas.description, ideas.submitted_at,
+               ideas.category_id, categories.name AS category,
+               ideas.submitter_id, users.username AS submitter_username,
+               COALESCE(idea_stats.vote_score, 0) AS vote_score,
+               COALESCE(idea_stats.vote_count, 0) AS vote_count,
+               COALESCE(idea_stats.star_avg, 0) AS star_avg,
+               COALESCE(idea_stats.star_count, 0) AS star_count
+        FROM ideas
+        LEFT JOIN categories ON ideas.category_id = categories.category_id
+        LEFT JOIN users ON ideas.submitter_id = users.user_id
+        LEFT JOIN idea_stats ON idea_stats.idea_id = ideas.id
+        WHERE ideas.id IN ({marks}) AND ideas.deleted_at IS NULL
+    """, ids)
+    found = {row["id"]: dict(row) for row in c.fetchall()}
+
+    if user_id is not None and found:
+        for idea in found.values():
+            idea["user_vote"] = 0
+            idea["user_stars"] = 0
+        present = list(found)
+        marks = ",".join("?" * len(present))
+        c.execute(f"SELECT idea_id, vote_value FROM votes WHERE user_id = ? AND idea_id IN ({marks})",
+                  [user_id] + present)
+        for row in c.fetchall():
+            found[row["idea_id"]]["user_vote"] = row["vote_value"]
+        c.execute(f"SELECT idea_id, stars FROM star_ratings WHERE user_id = ? AND idea_id IN ({marks})",
+                  [user_id] + present)
+        for row in c.fetchall():
+            found[row["idea_id"]]["user_stars"] = row["stars"]
+    return [found[i] for i in ids if i in found]
+
+def parse_vote_value(value):
+    if value in (1, "up"):
+        return 1
+    if value in (-1, "down"):
+        return -1
+    return None
+
+def parse_stars(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 5 else None
+
+def parse_id(value):
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    return value if isinstance(value, int) and not isinstance(value, bool) and value > 0 else None
+
+@app.route(f"{API_PREFIX}/ideas")
+def api_ideas():
+    limit = min(request.args.get("limit", IDEAS_PAGE_SIZE, type=int) or IDEAS_PAGE_SIZE, IDEAS_PAGE_MAX)
+    search = request.args.get("search", "").strip()
+    conn = get_db()
+    c = conn.cursor()
+    if search:
+        page = max(request.args.get("page", 1, type=int) or 1, 1)
+        rows = search_ideas(c, search, limit + 1, (page - 1) * limit)
+        conn.close()
+        return jsonify({
+            "ideas": [{"id": r["id"], "title": str(r["title"].striptags()), "category": r["category"],
+                       "score": r["score"], "stars": r["stars"]} for r in rows[:limit]],
+            "next_page": page + 1 if len(rows) > limit else None,
+        })
+    sort = request.args.get("sort", "top")
+    if sort not in IDEAS_SORTS:
+        conn.close()
+        return api_error(f"sort must be one of: {', '.join(IDEAS_SORTS)}", 400)
+    rows, next_after = list_ideas_page(c, parse_ideas_cursor(request.args.get("after", ""), sort), limit, sort)
+    conn.close()
+    return jsonify({"ideas": [{k: r[k] for k in r.keys() if k != "rank"} for r in rows], "next_after": next_after})
+
+@app.route(f"{API_PREFIX}/ideas/batch")
+def api_ideas_batch():
+    try:
+        ids = [int(i) for i in request.args.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        return api_error("ids must be a comma-separated list of integers", 400)
+    if len(ids) > API_BATCH_MAX:
+        return api_error(f"at most {API_BATCH_MAX} ids per call", 400)
+    conn = get_db()
+    ideas = idea_summaries(conn.cursor(), list(dict.fromkeys(ids)), api_user())
+    conn.close()
+    return jsonify({"ideas": ideas})
+
+@app.route(f"{API_PREFIX}/ideas/<int:idea_id>")
+def api_idea(idea_id):
+    conn = get_db()
+    c = conn.cursor()
+    found = idea_summaries(c, [idea_id], api_user())
+    if not found:
+        conn.close()
+        return api_error("idea not found", 404)
+    idea = found[0]
+    c.execute("SELECT comment_count FROM idea_stats WHERE idea_id = ?", (idea_id,))
+    row = c.fetchone()
+    idea["comment_count"] = row[0] if row else 0
+    conn.close()
+    return jsonify(idea)
+
+@app.route(f"{API_PREFIX}/ideas/<int:idea_id>/comments")
+def api_idea_comments(idea_id):
+    """Top-level comments by id (after=), each with its first replies; thread=<id> returns
+    that one thread, its replies paged by replies_after (a node's next_replies_after)."""
+    after = request.args.get("after", 0, type=int)
+    thread = request.args.get("thread", type=int)
+    replies_after = (request.args.get("replies_after", 0, type=int) or 0) if thread else 0
+    replies_limit = min(request.args.get("replies", COMMENT_REPLIES_PAGE, type=int) or COMMENT_REPLIES_PAGE,
+                        COMMENT_REPLIES_MAX)
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM ideas WHERE id = ? AND deleted_at IS NULL", (idea_id,))
+    if not c.fetchone():
+        conn.close()
+        return api_error("idea not found", 404)
+    if thread:
+        c.execute("SELECT comment_id FROM comments WHERE idea_id = ? AND parent_id IS NULL AND comment_id = ?",
+                  (idea_id, thread))
+    else:
+        c.execute("""
+            SELECT comment_id FROM comments
+            WHERE idea_id = ? AND parent_id IS NULL AND comment_id > ?
+            ORDER BY comment_id
+            LIMIT ?
+        """, (idea_id, after, COMMENT_THREADS_PAGE + 1))
+    root_ids = [r["comment_id"] for r in c.fetchall()]
+    next_after = root_ids[COMMENT_THREADS_PAGE - 1] if len(root_ids) > COMMENT_THREADS_PAGE else None
+    threads = load_comment_threads(c, root_ids[:COMMENT_THREADS_PAGE], replies_limit, replies_after)
+    conn.close()
+    return jsonify({"comments": threads, "next_after": next_after})
+
+@app.route(f"{API_PREFIX}/ideas/<int:idea_id>/comments", methods=["POST"])
+def api_add_comment(idea_id):
+    user_id = api_user()
+    if user_id is None:
+        return api_error("login required", 401)
+    data = api_json()
+    if data is None:
+        return api_error("the body must be a JSON object", 400)
+    content = str(data.get("content", "")).strip()
+    if not content:
+        return api_error("content is required", 400)
+    parent_id = data.get("parent_id")
+    if parent_id is not None:
+        parent_id = parse_id(parent_id)
+        if parent_id is None:
+            return api_error("parent_id must be a comment id", 400)
+    conn = get_db()
+    c = conn.cursor()
+    comment_id = insert_comment(c, idea_id, user_id, content, parent_id)
+    if comment_id is None:
+        conn.close()
+        return api_error("idea not found", 404)
+    conn.commit()
+    c.execute("SELECT comment_id, idea_id, parent_id, thread_id, content, created_at, score FROM comments WHERE comment_id = ?",
+              (comment_id,))
+    comment = dict(c.fetchone())
+    conn.close()
+    return jsonify(comment), 201
+
+@app.route(f"{API_PREFIX}/ideas/<int:idea_id>/vote", methods=["POST"])
+def api_vote(idea_id):
+    data = api_json()
+    if data is None:
+        return api_error("the body must be a JSON object", 400)
+    return api_batch_response([{"op": "vote", "idea_id": idea_id, "value": data.get("value")}])
+
+@app.route(f"{API_PREFIX}/ideas/<int:idea_id>/rating", methods=["POST"])
+def api_rate(idea_id):
+    data = api_json()
+    if data is None:
+        return api_error("the body must be a JSON object", 400)
+    return api_batch_response([{"op": "rate", "idea_id": idea_id, "stars": data.get("stars")}])
+
+@app.route(f"{API_PREFIX}/batch", methods=["POST"])
+def api_batch():
+    """Apply several votes / ratings in one transaction.
+
+    Body: {"operations": [{"op": "vote", "idea_id": 1, "value": 1},
+                          {"op": "rate", "idea_id": 2, "stars": 4}, ...]}
+    Either every operation is applied or none is. Returns the updated
+    ideas with their aggregates and the caller's vote / stars.
+    """
+    data = api_json()
+    if data is None:
+        return api_error("the body must be a JSON object", 400)
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return api_error("operations must be a non-empty list", 400)
+    return api_batch_response(operations)
+
+def api_batch_response(operations):
+    user_id = api_user()
+    if user_id is None:
+        return api_error("login required", 401)
+    if len(operations) > API_BATCH_MAX:
+        return api_error(f"at most {API_BATCH_MAX} operations per call", 400)
+
+    # validate everything before writing anything
+    intents = []
+    for i, op in enumerate(operations):
+        if not isinstance(op, dict) or not isinstance(op.get("idea_id"), int):
+            return api_error(f"operation {i}: idea_id is required", 400)
+        if op.get("op") == "vote":
+            if session.get("role") not in ("submitter", "reviewer", "admin"):
+                return api_error("your role cannot vote", 403)
+            value = parse_vote_value(op.get("value"))
+            if value is None:
+                return api_error(f"operation {i}: value must be 1 / -1 or \"up\" / \"down\"", 400)
+            intents.append((apply_vote, op["idea_id"], value))
+        elif op.get("op") == "rate":
+            stars = parse_stars(op.get("stars"))
+            if stars is None:
+                return api_error(f"operation {i}: stars must be an integer from 1 to 5", 400)
+            intents.append((apply_rating, op["idea_id"], stars))
+        else:
+            return api_error(f"operation {i}: op must be \"vote\" or \"rate\"", 400)
+
+    idea_ids = list(dict.fromkeys(idea_id for _, idea_id, _ in intents))
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f"SELECT id FROM ideas WHERE id IN ({','.join('?' * len(idea_ids))}) AND deleted_at IS NULL", idea_ids)
+    missing = set(idea_ids) - {row["id"] for row in c.fetchall()}
+    if missing:
+        conn.close()
+        return api_error(f"idea not found: {sorted(missing)}", 404)
+    if not user_is_live(c, user_id):
+        conn.close()
+        return api_error("this account has been deleted", 403)
+
+    if WRITE_QUEUE is not None and len(intents) == 1:
+        apply, idea_id, value = intents[0]
+        g.wrote = True
+        if not WRITE_QUEUE.submit("vote" if apply is apply_vote else "rate", idea_id, user_id, value):
+            conn.close()
+            return api_error("the write queue is busy, try again", 503)
+    else:
+        conn.execute("BEGIN IMMEDIATE")
+        for apply, idea_id, value in intents:
+            apply(c, idea_id, user_id, value)
+        conn.commit()
+
+    ideas = idea_summaries(c, idea_ids, user_id)
+    conn.close()
+    return jsonify({"ideas": ideas})
+
+@app.route(f"{API_PREFIX}/comments/<int:comment_id>/vote", methods=["POST"])
+def api_comment_vote(comment_id):
+    user_id = api_user()
+    if user_id is None:
+        return api_error("login required", 401)
+    data = api_json()
+    if data is None:
+        return api_error("the body must be a JSON object", 400)
+    value = parse_vote_value(data.get("value"))
+    if value is None:
+        return api_error("value must be 1 / -1 or \"up\" / \"down\"", 400)
+    conn = get_db()
+    c = conn.cursor()
+    score = apply_comment_vote(c, comment_id, user_id, value)
+    if score is None:
+        conn.close()
+        return api_error("comment not found", 404)
+    conn.commit()
+    c.execute("SELECT vote_value FROM comment_votes WHERE comment_id = ? AND user_id = ?", (comment_id, user_id))
+    row = c.fetchone()
+    conn.close()
+    return jsonify({"comment_id": comment_id, "score": score, "user_vote": row["vote_value"] if row else 0})
+
+# ---------------- BULK EXPORT / IMPORT (see bulk.py) ----------------
+EXPORT_TOKEN = os.environ.get("EXPORT_TOKEN")   # nightly BI job without an admin session
+
+@app.route("/admin/export/ideas")
+def admin_export_ideas():
+    token_ok = EXPORT_TOKEN and request.headers.get("Authorization") == f"Bearer {EXPORT_TOKEN}"
+    if session.get("role") != "admin" and not token_ok:
+        return "Access denied", 403
+    fmt = request.args.get("format", "csv")
+    if fmt not in bulk.EXPORT_FORMATS:
+        return f"format must be one of: {', '.join(bulk.EXPORT_FORMATS)}", 400
+
+    # the body is generated after this request's pooled connection has gone
+    # back to the pool, so the export reads through a connection of its own,
+    # opened once the body is read (a HEAD or an unread response opens none)
+    def generate():
+        export_conn = connect(DB_PATH)
+        try:
+            yield from bulk.export_ideas(export_conn, fmt)
+        finally:
+            export_conn.close()
+
+    filename = f"ideas-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    return Response(generate(), mimetype=bulk.EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.cli.command("import-jsonl")
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--batch", default=bulk.IMPORT_BATCH, show_default=True, help="Records per transaction.")
+def import_jsonl_command(source, batch):
+    """Bulk-load ideas / votes / comments from a JSON-lines file ('-' = stdin)."""
+    conn = get_db()
+    try:
+        counts = bulk.import_jsonl(conn, source, batch)
+    except bulk.BulkImportError as e:
+        counts = None
+        print(f"import stopped: {e}")
+    # also after a failed import: the batches before the error are in
+    bulk.rebuild_derived(conn)
+    bump_cache_version(conn.cursor(), "ideas", "meta")
+    conn.commit()
+    conn.close()
+    if counts is None:
+        raise SystemExit(1)
+    print(", ".join(f"{n} {kind}s" for kind, n in counts.items()) + " imported.")
+
+# ---------------- MAINTENANCE (checkpoint / optimize / analyze / vacuum / backup, see maintenance.py) ----------------
+# MAINTENANCE=1 runs the schedule in a background thread of every worker;
+# without it, `flask maintenance` from cron does the same
+DB_BACKUP_DIR = os.environ.get("DB_BACKUP_DIR",
+                               os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "backups"))
+DB_BACKUP_HOURS = float(os.environ.get("DB_BACKUP_HOURS", "24"))
+
+def rerank_task(conn):
+    ranking.rebase(conn.cursor())
+    return {}
+
+def purge_drafts_task(conn):
+    return {"drafts_removed": DRAFTS.purge_expired(conn.cursor())}
+
+def rollup_analytics_task(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    return {"rows_folded": analytics.compact_activity(conn)}
+
+def purge_task(conn):
+    # picks up purges cut off by a restart
+    return {"jobs_finished": PURGE.drain(conn)}
+
+MAINTENANCE = maintenance.MaintenanceScheduler(DB_PATH, maintenance.db_tasks(DB_BACKUP_DIR, DB_BACKUP_HOURS) + [
+    maintenance.Task("rerank", rerank_task, 3600),
+    maintenance.Task("purge", purge_task, 3600),
+    maintenance.Task("purge_drafts", purge_drafts_task, 86400, idle=True),
+    maintenance.Task("rollup_analytics", rollup_analytics_task, 86400, idle=True),
+])
+MAINTENANCE_ENABLED = os.environ.get("MAINTENANCE") == "1"
+
+@app.before_request
+def maintenance_request_started():
+    if MAINTENANCE_ENABLED:
+        MAINTENANCE.start()
+        MAINTENANCE.request_started()
+        g.maintenance_counted = True
+
+@app.teardown_request
+def maintenance_request_finished(exc):
+    if g.pop("maintenance_counted", False):
+        MAINTENANCE.request_finished()
+
+@app.route("/admin/maintenance")
+def admin_maintenance():
+    if session.get("role") != "admin":
+        return "Access denied"
+    conn = get_db()
+    status = MAINTENANCE.status(conn)
+    conn.close()
+    return jsonify(dict(status, enabled=MAINTENANCE_ENABLED, backup_dir=DB_BACKUP_DIR))
+
+@app.cli.command("maintenance")
+@click.argument("tasks", nargs=-1, type=click.Choice(list(MAINTENANCE.tasks)))
+@click.option("--status", is_flag=True, help="Show the last run of every task instead.")
+@click.option("--enable-incremental-vacuum", is_flag=True,
+              help="One-off full VACUUM that switches the file to auto_vacuum = INCREMENTAL.")
+def maintenance_command(tasks, status, enable_incremental_vacuum):
+    """Run the maintenance tasks that are due (or the ones named, right away)."""
+    conn = get_db()
+    if status:
+        for task in MAINTENANCE.status(conn)["tasks"]:
+            last = task["last"]
+            print(f"{task['task']:<20} every {task['interval_seconds']:>6}s  last: "
+                  + (f"{datetime.fromtimestamp(last['started_at']):%Y-%m-%d %H:%M:%S} "
+                     f"{last['seconds'] or 0:.3f}s {last['error'] or last['details']}" if last else "never"))
+    elif enable_incremental_vacuum:
+        print(maintenance.enable_incremental_vacuum(conn))
+    else:
+        ran = MAINTENANCE.run_due(conn, names=set(tasks) or None, force=bool(tasks))
+        for name, seconds, details, error in ran:
+            print(f"{name:<20} {'failed' if error else 'ok'} in {seconds:.3f}s  {error or json.dumps(details)}")
+        failed = [name for name, _, _, error in ran if error]
+        print(f"{len(ran)} tasks run" + (f", failed: {', '.join(failed)}" if failed else "."))
+        if failed:
+            conn.close()
+            raise SystemExit(1)
+    conn.close()
+
+# ---------------- STARTUP TIME (cold start: fresh interpreter -> first response) ----------------
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get(sys.argv[1])
+first = time.perf_counter()
+client.get(sys.argv[1])
+print(json.dumps({"import": imported - start, "first_request": first - imported,
+                  "warm_request": time.perf_counter() - first}))
+"""
+
+@app.cli.command("startup-time")
+@click.option("--runs", default=5, show_default=True, help="Fresh processes to time.")
+@click.option("--path", default="/login", show_default=True, help="URL of the first request.")
+def startup_time_command(runs, path):
+    """Time cold starts: process spawn, importing app.py, the first and a second request."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, path], cwd=here, env=os.environ,
+                             capture_output=True, text=True, check=True).stdout
+        sample = json.loads(out.strip().splitlines()[-1])
+        # everything up to the first response, interpreter start-up included
+        sample["total"] = time.perf_counter() - start - sample["warm_request"]
+        samples.append(sample)
+    print(f"{runs} cold starts, GET {path} (ms)      min   median      max")
+    for key in ("import", "first_request", "warm_request", "total"):
+        values = sorted(s[key] * 1000 for s in samples)
+        print(f"  {key:<28}{values[0]:>8.1f}{values[len(values) // 2]:>9.1f}{values[-1]:>9.1f}")
+
 # ---------------- Home redirect ----------------
 @app.route("/")
 def home():
@@ -855,6 +2404,8 @@ def home():
 
 
 # ---------------- Run ----------------
+create_app()
+
 if __name__ == "__main__":
     # ensure DB exists
     if not os.path.exists(DB_PATH):
@@ -0,0 +1,314 @@
+"""Per-route load benchmark: throughput, latency percentiles and SQL statements per request.
+
+Drives the routes through Flask's test client from N threads (or, with
+--url, a running server such as gunicorn over HTTP; SQL counts are then
+not available). Ids, search words and logins are drawn from the database,
+so fill it first with generate_data.py. Results are written as JSON to
+benchmarks/ (commit id in the file name) and can be compared with an
+earlier run.
+
+Usage:  DATABASE_PATH=bench.db python benchmark.py --requests 300 --concurrency 8
+        python benchmark.py --db bench.db --routes ideas,view_idea --compare benchmarks/<old>.json
+        python benchmark.py --db bench.db --url http://127.0.0.1:8000
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from generate_data import GENERATED_EMAIL, GENERATED_PASSWORD
+
+RESULTS_DIR = "benchmarks"
+
+
+# ---------------- SCENARIOS ----------------
+# name -> (method, function(sample, rng) returning (url, form or None), needs login)
+def scenarios():
+    def ideas_page(s, rng):
+        return "/ideas", None
+
+    def ideas_deep_page(s, rng):
+        return f"/ideas?after={rng.choice(s['cursors'])}", None
+
+    def ideas_trending(s, rng):
+        return f"/ideas?sort={rng.choice(['hot', 'trending_24h', 'trending_7d', 'controversial'])}", None
+
+    def ideas_search(s, rng):
+        return f"/ideas?search={rng.choice(s['words'])}", None
+
+    def view_idea(s, rng):
+        return f"/ideas/{rng.choice(s['hot_ideas'])}", None
+
+    def view_idea_top(s, rng):
+        return f"/ideas/{rng.choice(s['hot_ideas'])}?comments_sort=top", None
+
+    def similar(s, rng):
+        return f"/ideas/similar?title={urllib.parse.quote(rng.choice(s['titles']))}", None
+
+    def api_ideas_batch(s, rng):
+        return "/api/v1/ideas/batch?ids=" + ",".join(str(rng.choice(s['idea_ids'])) for _ in range(20)), None
+
+    def api_idea(s, rng):
+        return f"/api/v1/ideas/{rng.choice(s['idea_ids'])}", None
+
+    def vote(s, rng):
+        return f"/vote/{rng.choice(s['idea_ids'])}/{rng.choice(['up', 'down'])}", None
+
+    def rate(s, rng):
+        return f"/rate/{rng.choice(s['idea_ids'])}/{rng.randint(1, 5)}", None
+
+    def add_comment(s, rng):
+        return f"/add_comment/{rng.choice(s['hot_ideas'])}", {"content": "benchmark " + rng.choice(s['words'])}
+
+    def comment_vote(s, rng):
+        return f"/comment_vote/{rng.choice(s['comment_ids'])}/up", None
+
+    return {
+        "ideas": ("get", ideas_page, False),
+        "ideas_deep_page": ("get", ideas_deep_page, False),
+        "ideas_trending": ("get", ideas_trending, False),
+        "ideas_search": ("get", ideas_search, False),
+        "view_idea": ("get", view_idea, True),
+        "view_idea_top": ("get", view_idea_top, True),
+        "ideas_similar": ("get", similar, True),
+        "api_ideas_batch": ("get", api_ideas_batch, True),
+        "api_idea": ("get", api_idea, True),
+        "vote": ("get", vote, True),
+        "rate": ("get", rate, True),
+        "add_comment": ("post", add_comment, True),
+        "comment_vote": ("get", comment_vote, True),
+    }
+
+
+def sample_database(path):
+    from db import connect
+
+    conn = connect(path)
+    s = {
+        "idea_ids": [r[0] for r in conn.execute("SELECT id FROM ideas ORDER BY random() LIMIT 2000")],
+        # the most commented ideas: worst case for view_idea
+        "hot_ideas": [r[0] for r in conn.execute(
+            "SELECT idea_id FROM comments GROUP BY idea_id ORDER BY COUNT(*) DESC LIMIT 50")],
+        "comment_ids": [r[0] for r in conn.execute("SELECT comment_id FROM comments ORDER BY random() LIMIT 2000")],
+        "titles": [r[0] for r in conn.execute("SELECT title FROM ideas ORDER BY random() LIMIT 200")],
+        "cursors": [f"{r[0]}:{r[1]}:{r[2]}" for r in conn.execute(
+            "SELECT star_avg, vote_score, idea_id FROM idea_stats ORDER BY random() LIMIT 200")],
+        "emails": [r[0] for r in conn.execute(
+            "SELECT email FROM users WHERE email LIKE ? AND role != 'admin' LIMIT 500",
+            (GENERATED_EMAIL.format("%"),))],
+    }
+    s["hot_ideas"] = s["hot_ideas"] or s["idea_ids"]
+    s["comment_ids"] = s["comment_ids"] or [0]
+    s["words"] = sorted({w for t in s["titles"] for w in t.lower().split() if w.isalpha()}) or ["idea"]
+    conn.close()
+    if not s["idea_ids"] or not s["emails"]:
+        sys.exit("no generated data in this database: run generate_data.py first")
+    return s
+
+
+# ---------------- CLIENTS ----------------
+class TestClient:
+    """In-process client; counts SQL statements per request through db.CONNECT_HOOKS."""
+
+    counter = threading.local()
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    @classmethod
+    def install_sql_counter(cls):
+        import db
+
+        def count(conn):
+            conn.set_trace_callback(cls._count_statement)
+        db.CONNECT_HOOKS.append(count)
+
+    @classmethod
+    def _count_statement(cls, sql):
+        if not sql.startswith("--"):
+            cls.counter.n = getattr(cls.counter, "n", 0) + 1
+
+    def login(self, email):
+        self.client.post("/login", data={"email": email, "password": GENERATED_PASSWORD})
+
+    def request(self, method, url, form):
+        TestClient.counter.n = 0
+        resp = getattr(self.client, method)(url, data=form)
+        return resp.status_code, TestClient.counter.n
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def login(self, email):
+        self.request("post", "/login", {"email": email, "password": GENERATED_PASSWORD})
+
+    def request(self, method, url, form):
+        data = urllib.parse.urlencode(form).encode() if method == "post" else None
+        try:
+            with self.opener.open(self.base_url + url, data=data) as resp:
+                resp.read()
+                return resp.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# ---------------- RUN ----------------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run_scenario(make_client, sample, name, scenario, requests, concurrency, seed):
+    method, build, needs_login = scenario
+    latencies, sql_counts, errors = [], [], 0
+    lock = threading.Lock()
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(i):
+        nonlocal errors
+        rng = random.Random(f"{seed}:{name}:{i}")
+        client = make_client()
+        if needs_login:
+            client.login(rng.choice(sample["emails"]))
+        local = []
+        for _ in range(per_thread[i]):
+            url, form = build(sample, rng)
+            start = time.perf_counter()
+            status, sql = client.request(method, url, form)
+            local.append((time.perf_counter() - start, sql, status >= 400))
+        with lock:
+            for elapsed, sql, failed in local:
+                latencies.append(elapsed)
+                if sql is not None:
+                    sql_counts.append(sql)
+                errors += failed
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1) if wall else 0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "sql_per_request": round(statistics.fmean(sql_counts), 1) if sql_counts else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_table(results, previous=None):
+    print(f"{'route':<18}{'req':>6}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'sql':>7}")
+    for name, r in results.items():
+        line = (f"{name:<18}{r['requests']:>6}{r['errors']:>5}{r['rps']:>9}{r['p50_ms']:>9}"
+                f"{r['p95_ms']:>9}{r['p99_ms']:>9}{r['sql_per_request'] if r['sql_per_request'] is not None else '-':>7}")
+        old = (previous or {}).get(name)
+        if old and old["p95_ms"]:
+            line += f"   p95 {100 * (r['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.0f}%"
+            if old["rps"]:
+                line += f"  rps {100 * (r['rps'] - old['rps']) / old['rps']:+.0f}%"
+        print(line)
+
+
+def main(argv=None):
+    all_scenarios = scenarios()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.environ.get("DATABASE_PATH", "database.db"))
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process test client")
+    parser.add_argument("--routes", default=",".join(all_scenarios),
+                        help="comma-separated subset of: " + ", ".join(all_scenarios))
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--page-cache", action="store_true",
+                        help="keep the in-process page cache on (off by default to measure the queries)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.routes.split(",") if n.strip()]
+    unknown = [n for n in names if n not in all_scenarios]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    os.environ["DATABASE_PATH"] = args.db
+    if not args.page_cache:
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    # every simulated user logs in from 127.0.0.1
+    os.environ.setdefault("LOGIN_IP_LIMIT", "1000000")
+    sample = sample_database(args.db)
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        TestClient.install_sql_counter()
+        from app import app
+
+        def make_client():
+            return TestClient(app)
+
+    results = {}
+    for name in names:
+        results[name] = run_scenario(make_client, sample, name, all_scenarios[name],
+                                     args.requests, args.concurrency, args.seed)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["routes"]
+    print_table(results, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = git_commit()
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+        with open(path, "w") as f:
+            json.dump({
+                "commit": commit,
+                "created_at": int(time.time()),
+                "target": args.url or "test-client",
+                "config": {"requests": args.requests, "concurrency": args.concurrency, "seed": args.seed,
+                           "page_cache": args.page_cache, "db": os.path.basename(args.db)},
+                "routes": results,
+            }, f, indent=2)
+        print(f"results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Bulk export / import of ideas (nightly BI pulls, data migrations).
+
+export_ideas() streams every idea with its aggregates as CSV or JSON
+lines. It reads through one cursor in fetchmany() batches, so memory
+stays flat however many rows there are, and the export is a single
+consistent snapshot (one read transaction; under WAL writers carry on).
+
+import_jsonl() loads JSON lines into ideas / votes / comments with
+executemany(), committing every IMPORT_BATCH records. "type" picks the
+table and defaults to "idea", so an export loads back as is:
+
+    {"id": 7, "title": "...", "description": "...", "category_id": 2, "submitter_id": 5,
+     "submitted_at": 1700000000}
+    {"type": "vote", "idea_id": 7, "user_id": 5, "vote_value": 1, "voted_at": 1700000100}
+    {"type": "comment", "comment_id": 9, "idea_id": 7, "user_id": 5, "content": "...",
+     "parent_id": null, "created_at": 1700000200}
+
+Ideas may give "category" / "submitter" names instead of the ids. Within
+a batch ideas are inserted before comments and votes, so a record may
+refer to any idea earlier in the file; a comment's parent must come
+before it. Duplicate votes are skipped; a duplicate idea (same id or
+title) or a dangling reference stops the import at that batch, with the
+earlier batches kept. Each inserted row adds its day to the activity
+rollups in its own batch (analytics.recording_inserts), so the per-day
+history already there is kept. The other derived tables (idea_stats,
+rankings, search and similarity indexes) are recomputed once at the end
+by rebuild_derived().
+"""
+import csv
+import io
+import json
+import os
+import time
+
+import analytics
+from migrations import rebuild_idea_stats, rebuild_search_index, table_exists
+from ranking import rebuild_ranking
+from similarity import idea_title_key, lsh_buckets
+
+EXPORT_BATCH = int(os.environ.get("EXPORT_BATCH", "2000"))
+IMPORT_BATCH = int(os.environ.get("IMPORT_BATCH", "5000"))
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+EXPORT_COLUMNS = ("id", "title", "description", "category_id", "category", "submitter_id", "submitter",
+                  "submitted_at", "vote_score", "vote_count", "star_avg", "star_count", "comment_count")
+
+
+class BulkImportError(Exception):
+    """A record could not be loaded; batches before it are committed."""
+
+
+# ---------------- EXPORT ----------------
+def export_ideas(conn, fmt):
+    """Yield the export as text chunks of up to EXPORT_BATCH rows."""
+    c = conn.cursor()
+    c.execute("""
+        SELECT ideas.id, ideas.title, ideas.description, ideas.category_id, categories.name AS category,
+               ideas.submitter_id, users.username AS submitter, ideas.submitted_at,
+               COALESCE(idea_stats.vote_score, 0), COALESCE(idea_stats.vote_count, 0),
+               COALESCE(idea_stats.star_avg, 0), COALESCE(idea_stats.star_count, 0),
+               COALESCE(idea_stats.comment_count, 0)
+        FROM ideas
+        LEFT JOIN categories ON categories.category_id = ideas.category_id
+        LEFT JOIN users ON users.user_id = ideas.submitter_id
+        LEFT JOIN idea_stats ON idea_stats.idea_id = ideas.id
+        WHERE ideas.deleted_at IS NULL
+        ORDER BY ideas.id
+    """)
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH)
+            writer.writerows(tuple(row) for row in rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            if not rows:
+                return
+    else:
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH)
+            if not rows:
+                return
+            yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+# ---------------- IMPORT ----------------
+_INSERTS = {
+    "idea": """
+        INSERT INTO ideas (id, title, description, category_id, submitter_id, submitted_at, title_key)
+        VALUES (?, ?, ?, COALESCE(?, (SELECT category_id FROM categories WHERE name = ?)),
+                COALESCE(?, (SELECT user_id FROM users WHERE username = ?)), ?, ?)
+    """,
+    # thread_id is the parent's thread (or the parent itself, for a reply to a root)
+    "comment": """
+        INSERT INTO comments (comment_id, idea_id, user_id, content, parent_id, thread_id, created_at)
+        VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(thread_id, comment_id) FROM comments WHERE comment_id = ?), ?)
+    """,
+    "vote": """
+        INSERT OR IGNORE INTO votes (idea_id, user_id, vote_value, voted_at)
+        VALUES (?, ?, ?, ?)
+    """,
+}
+
+
+def _idea_row(rec, now):
+    title = rec["title"].strip()
+    return (rec.get("id"), title, rec.get("description") or "", rec.get("category_id"), rec.get("category"),
+            rec.get("submitter_id"), rec.get("submitter"), rec.get("submitted_at") or now, idea_title_key(title))
+
+
+def _comment_row(rec, now):
+    return (rec.get("comment_id"), rec["idea_id"], rec.get("user_id"), rec["content"], rec.get("parent_id"),
+            rec.get("parent_id"), rec.get("created_at") or now)
+
+
+def _vote_row(rec, now):
+    if rec["vote_value"] not in (1, -1):
+        raise ValueError("vote_value must be 1 or -1")
+    return rec["idea_id"], rec["user_id"], rec["vote_value"], rec.get("voted_at") or now
+
+
+_ROWS = {"idea": _idea_row, "comment": _comment_row, "vote": _vote_row}
+
+
+def import_jsonl(conn, lines, batch_size=IMPORT_BATCH):
+    """Load JSON lines into ideas / comments / votes; returns {type: rows inserted}."""
+    now = int(time.time())
+    counts = dict.fromkeys(_INSERTS, 0)
+    pending = {kind: [] for kind in _INSERTS}
+    first_line = 1
+
+    def flush(last_line):
+        # one transaction per batch, tables in dependency order
+        try:
+            for kind, sql in _INSERTS.items():
+                if pending[kind]:
+                    counts[kind] += conn.executemany(sql, pending[kind]).rowcount
+                    pending[kind].clear()
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise BulkImportError(f"{e}; lines {first_line}-{last_line} were not imported") from e
+
+    n = 0
+    buffered = 0
+    with analytics.recording_inserts(conn):
+        for n, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                kind = rec.get("type", "idea")
+                pending[kind].append(_ROWS[kind](rec, now))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                conn.rollback()
+                raise BulkImportError(f"line {n}: bad record ({e!r}); lines {first_line}-{n} were not imported") from e
+            buffered += 1
+            if buffered >= batch_size:
+                flush(n)
+                buffered = 0
+                first_line = n + 1
+        if buffered:
+            flush(n)
+    return counts
+
+
+def rebuild_derived(conn):
+    """Recompute what the app keeps up to date on every write, after a bulk load."""
+    conn.execute("""
+        UPDATE comments SET score = (
+            SELECT SUM(vote_value) FROM comment_votes WHERE comment_votes.comment_id = comments.comment_id)
+        WHERE comment_id IN (SELECT comment_id FROM comment_votes)
+    """)
+    rebuild_idea_stats(conn)
+    rebuild_ranking(conn)
+    if table_exists(conn, "ideas_fts"):
+        rebuild_search_index(conn)
+    conn.commit()
+    # similarity buckets only for ideas that have none yet
+    new_titles = conn.execute("""
+        SELECT id, title FROM ideas
+        WHERE deleted_at IS NULL
+          AND NOT EXISTS (SELECT 1 FROM idea_title_lsh WHERE idea_title_lsh.idea_id = ideas.id)
+    """)
+    conn.executemany("INSERT OR IGNORE INTO idea_title_lsh (bucket, idea_id) VALUES (?, ?)",
+                     ((bucket, idea_id) for idea_id, title in new_titles for bucket in lsh_buckets(title)))
+    conn.execute("ANALYZE")
+    conn.commit()
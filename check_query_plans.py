@@ -0,0 +1,188 @@
+"""Check that every query the routes run is served by an index.
+
+Builds a throwaway database with init_db.py, drives each route through
+Flask's test client while tracing the SQL it executes, then runs EXPLAIN
+QUERY PLAN on every statement. A plan step that scans a whole table
+without an index fails the check, unless the table is listed in
+FULL_SCAN_ALLOWED for that route. So does a walk over a rowid range
+("rowid>?") while the WHERE clause also filters on other columns of that
+table: with a selective filter that is a table scan in keyset clothing.
+ROWID_WALK_ALLOWED lists the walks whose filter rejects (almost) nothing.
+
+Usage:  python check_query_plans.py     (exit status 1 on failure)
+"""
+import os
+import re
+import runpy
+import sqlite3
+import sys
+import tempfile
+
+# routes that list a whole (small or deliberately unpaginated) table
+FULL_SCAN_ALLOWED = {
+    "/manage_categories": {"categories"},
+    "/submit": {"categories"},
+    "/edit/1": {"categories"},
+    "/admin": {"user_counts"},          # one row per role
+    "/admin/export/ideas?format=jsonl": {"ideas"},    # the export reads every idea
+    "/admin/purge_jobs": {"purge_jobs"},   # newest jobs: rowid order from the end, LIMIT 50
+}
+
+# keyset pages by id whose extra filter (deleted_at IS NULL, ...) rarely rejects a row
+ROWID_WALK_ALLOWED = {
+    "/admin": {"users"},
+    "/admin?role=submitter&after=1&limit=1": {"users"},
+}
+
+# "--" marks statements SQLite runs internally (FTS5 shadow tables etc.)
+SKIP_PREFIXES = ("--", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "CREATE", "DROP", "ALTER")
+
+
+def seed(conn):
+    from werkzeug.security import generate_password_hash
+
+    pw = generate_password_hash("Passw0rd!")
+    conn.execute("INSERT INTO users (username, email, password_hash, role) VALUES ('sub', 'sub@x.io', ?, 'submitter')", (pw,))
+    conn.execute("INSERT INTO users (username, email, password_hash, role) VALUES ('rev', 'rev@x.io', ?, 'reviewer')", (pw,))
+    conn.commit()
+
+
+def filtered_columns(conn, table, statement):
+    """Columns of table, other than its INTEGER PRIMARY KEY, compared in the statement's WHERE clauses."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+               if not (row[5] and row[2].upper() == "INTEGER")]
+    where = " ".join(re.findall(r"\bWHERE\b(.*?)(?=\bORDER BY\b|\bGROUP BY\b|\bLIMIT\b|$)", statement, re.I))
+    return [col for col in columns
+            if re.search(rf"\b{col}\b\s*(?:COLLATE \w+\s*)?(?:[=<>!]|IS\b|IN\b|LIKE\b|BETWEEN\b)", where, re.I)]
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="query_plans_")
+    db_path = os.path.join(workdir, "database.db")
+    os.environ["DATABASE_PATH"] = db_path
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    runpy.run_path(os.path.join(here, "init_db.py"))
+
+    import db
+
+    captured = []
+    current = {"route": None}
+
+    def trace(conn):
+        conn.set_trace_callback(lambda sql: captured.append((current["route"], sql)))
+
+    db.CONNECT_HOOKS.append(trace)
+    import app as app_module
+
+    conn = db.connect(db_path)
+    seed(conn)
+    client = app_module.app.test_client()
+
+    def hit(method, url, **kwargs):
+        current["route"] = url
+        # get_data(): streamed bodies run their queries while being read
+        getattr(client, method)(url, **kwargs).get_data()
+        current["route"] = None
+
+    def login(email, password):
+        client.get("/logout")
+        hit("post", "/login", data={"email": email, "password": password})
+
+    login("sub@x.io", "Passw0rd!")
+    hit("get", "/submit")
+    hit("post", "/submit", data={"title": "Solar roofs", "description": "solar panels everywhere", "category_id": "1"})
+    hit("post", "/submit", data={"title": "Bike lanes", "description": "more lanes", "category_id": "2"})
+    hit("get", "/ideas")
+    hit("get", "/ideas?limit=1")
+    hit("get", "/ideas?after=0.0:0:1")
+    hit("get", "/ideas?search=solar")
+    for sort in ("hot", "trending_24h", "trending_7d", "controversial"):
+        hit("get", f"/ideas?sort={sort}")
+        hit("get", f"/ideas?sort={sort}&after=0.0:1")
+    hit("get", "/vote/1/up")
+    hit("get", "/rate/1/4")
+    hit("post", "/add_comment/1", data={"content": "first"})
+    hit("post", "/add_comment/1", data={"content": "reply", "parent_id": "1"})
+    hit("get", "/comment_vote/2/up", headers={"Referer": "/ideas/1"})
+    hit("get", "/ideas/1")
+    hit("get", "/ideas/1?comments_sort=top")
+    hit("get", "/ideas/1?comments_after=1")
+    hit("get", "/ideas/1?thread=1&replies_after=1")
+    hit("get", "/api/v1/ideas")
+    hit("get", "/api/v1/ideas/batch?ids=1,2")
+    hit("get", "/api/v1/ideas/1")
+    hit("get", "/api/v1/ideas/1/comments")
+    hit("get", "/api/v1/ideas/1/comments?thread=1&replies_after=1")
+    hit("post", "/api/v1/batch", json={"operations": [{"op": "vote", "idea_id": 2, "value": 1},
+                                                      {"op": "rate", "idea_id": 2, "stars": 3}]})
+    hit("post", "/api/v1/ideas/1/comments", json={"content": "via api", "parent_id": 1})
+    hit("post", "/api/v1/comments/1/vote", json={"value": "down"})
+    hit("get", "/edit/1")
+    hit("post", "/edit/1", data={"title": "Solar roofs v2", "description": "x", "category_id": "1"})
+    hit("post", "/delete_comment/2")
+    hit("post", "/remember_form_before_category", data={"title": "t", "description": "d"})
+    hit("post", "/submit_add_category", data={"name": "Energy"})
+    hit("get", "/delete/2")
+
+    login("ayadebbihi@gmail.com", "26112002Ad@")
+    hit("get", "/admin")
+    hit("get", "/admin?q=Re")
+    hit("get", "/admin?q=Re&role=reviewer")
+    hit("get", "/admin?role=submitter&after=1&limit=1")
+    hit("get", "/admin_dashboard")
+    hit("get", "/admin/export/ideas?format=jsonl")
+    hit("get", "/admin/purge_jobs")
+    hit("get", "/admin/maintenance")
+    hit("get", "/manage_categories")
+    hit("post", "/edit_category/5", data={"name": "Power"})
+    hit("post", "/delete_category/5")
+    hit("post", "/change_role/3", data={"new_role": "submitter"})
+    hit("post", "/admin/delete_user/3")
+    hit("post", "/register", data={"username": "new", "email": "new@x.io", "password": "Passw0rd!"})
+
+    failures = []
+    checked = set()
+    for route, sql in captured:
+        if route is None:
+            continue
+        statement = " ".join(sql.split())
+        if statement.upper().startswith(SKIP_PREFIXES) or (route, statement) in checked:
+            continue
+        checked.add((route, statement))
+        if statement.upper().startswith("INSERT") and " SELECT " not in statement.upper():
+            continue
+        try:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+        except sqlite3.Error as e:
+            failures.append((route, statement, [f"cannot explain: {e}"]))
+            continue
+        bad = []
+        for row in plan:
+            detail = row[3]
+            walk = re.match(r"SEARCH (\w+) USING INTEGER PRIMARY KEY \(rowid[<>]", detail)
+            if walk and walk.group(1) not in ROWID_WALK_ALLOWED.get(route, ()):
+                filtered = filtered_columns(conn, walk.group(1), statement)
+                if filtered:
+                    bad.append(f"{detail} (also filters on {', '.join(filtered)})")
+                continue
+            m = re.match(r"SCAN (\w+)(.*)", detail)
+            if not m or "USING" in m.group(2) or "VIRTUAL TABLE" in m.group(2):
+                continue
+            table = m.group(1)
+            if table in FULL_SCAN_ALLOWED.get(route, ()):
+                continue
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+                bad.append(detail)
+        if bad:
+            failures.append((route, statement, bad))
+
+    conn.close()
+    print(f"checked {len(checked)} statements across {len({r for r, _ in checked})} routes")
+    for route, statement, bad in failures:
+        print(f"\nFAIL {route}\n  {statement}\n  " + "\n  ".join(bad))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""App configuration classes for create_app().
+
+APP_CONFIG picks one by name (production by default). Settings that size
+process-wide machinery (DATABASE_PATH, DB_POOL_SIZE, METRICS, READ_SNAPSHOT,
+WRITE_BEHIND, MAINTENANCE, ...) stay environment variables, read by the
+module that owns them.
+"""
+import os
+
+
+class Config:
+    SECRET_KEY = os.environ.get("SECRET_KEY", "secret123")
+    # "1": the first database use in each process applies pending migrations
+    # (one PRAGMA user_version read once the schema is current).
+    # "0": skip it; the deploy runs `flask db-upgrade` once instead.
+    SCHEMA_CHECK = os.environ.get("SCHEMA_CHECK", "1") == "1"
+    # reverse proxies in front of the app that append to X-Forwarded-For /
+    # X-Forwarded-Proto; request.remote_addr (login throttle) is then the
+    # client. Proxied deployments opt in: trusted without a proxy, every
+    # client could pick a fresh address per login attempt.
+    TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "0"))
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+
+
+CONFIGS = {
+    "production": Config,
+    "development": DevelopmentConfig,
+    "testing": TestingConfig,
+}
@@ -0,0 +1,237 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# ---- connection tuning (override with environment variables) ----
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "10"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "16384"))
+DB_STATEMENT_CACHE = int(os.environ.get("DB_STATEMENT_CACHE", "512"))
+
+# callables run on every new connection (tracing / instrumentation)
+CONNECT_HOOKS = []
+# callables(sql, seconds) run once per statement on our connections
+STATEMENT_HOOKS = []
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement to STATEMENT_HOOKS with the time spent
+    running it: execute() plus fetching its rows, since SQLite produces most
+    rows of a SELECT while they are fetched. A statement is reported once it
+    has no more rows, or when the cursor runs the next one, closes or goes away."""
+
+    _sql = None
+    _seconds = 0.0
+
+    def _start(self, sql, seconds):
+        self._finish()
+        if self.description is None:     # no result rows: done already
+            _report(sql, seconds)
+        else:
+            self._sql, self._seconds = sql, seconds
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            _report(sql, self._seconds)
+
+    def _timed(self, fetch, exhausted, *args):
+        start = time.perf_counter()
+        done = True
+        try:
+            result = fetch(*args)
+            done = exhausted(result)
+            return result
+        finally:
+            self._seconds += time.perf_counter() - start
+            if done:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        if not STATEMENT_HOOKS:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except BaseException:
+            self._finish()
+            _report(sql, time.perf_counter() - start)
+            raise
+        self._start(sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not STATEMENT_HOOKS:
+            return super().executemany(sql, seq_of_parameters)
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _report(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        if self._sql is None:
+            return super().fetchone()
+        return self._timed(super().fetchone, lambda row: row is None)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._sql is None:
+            return super().fetchmany(size)
+        return self._timed(super().fetchmany, lambda rows: len(rows) < size, size)
+
+    def fetchall(self):
+        if self._sql is None:
+            return super().fetchall()
+        return self._timed(super().fetchall, lambda rows: True)
+
+    def __next__(self):
+        if self._sql is None:
+            return super().__next__()
+        # StopIteration leaves done=True in _timed and reports the statement
+        return self._timed(super().__next__, lambda row: False)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+def _report(sql, seconds):
+    for hook in STATEMENT_HOOKS:
+        hook(sql, seconds)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection handed out once per request.
+
+    Route code keeps calling conn.close() as before; that only ends the
+    caller's borrow (rolling back anything left uncommitted). The
+    connection itself goes back to the pool at the end of the request.
+    """
+
+    borrowers = 0
+    pooled = True
+
+    def close(self):
+        if not self.pooled:
+            return super().close()
+        self.borrowers = max(self.borrowers - 1, 0)
+        if self.borrowers == 0 and self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+    # conn.execute() does not go through cursor(), so route both explicitly
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path, pooled=False):
+    """Open a connection configured once for the app: WAL, NORMAL sync, mmap, cache."""
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=DB_STATEMENT_CACHE, factory=PooledConnection)
+    conn.pooled = pooled
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE};")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB};")
+    for hook in CONNECT_HOOKS:
+        hook(conn)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of pre-configured connections with acquire/wait metrics."""
+
+    def __init__(self, path, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def acquire(self):
+        wait = 0.0
+        if not self._slots.acquire(blocking=False):
+            start = time.perf_counter()
+            ok = self._slots.acquire(timeout=self.timeout)
+            wait = time.perf_counter() - start
+            with self._lock:
+                self.waited += 1
+                self.wait_seconds_total += wait
+                self.wait_seconds_max = max(self.wait_seconds_max, wait)
+                if not ok:
+                    self.timeouts += 1
+            if not ok:
+                raise sqlite3.OperationalError(
+                    f"connection pool exhausted ({self.max_size} in use for {self.timeout}s)")
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = connect(self.path, pooled=True)
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self.created += 1
+
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.borrowers = 0
+            self._idle.put(conn)
+        except sqlite3.Error:
+            # broken connection: drop it, a fresh one is opened on demand
+            with self._lock:
+                self.created -= 1
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "open": self.created,
+                "in_use": self.in_use,
+                "idle": self._idle.qsize(),
+                "acquired_total": self.acquired,
+                "waited_total": self.waited,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "timeouts_total": self.timeouts,
+            }
@@ -0,0 +1,80 @@
+"""Server-side idea drafts: one per user in idea_drafts, with TTL expiry.
+
+The session cookie only carries the draft's version number
+(session["draft_v"]); the text lives in SQLite with a small in-process
+LRU in front. A cached draft is used only when its version matches the
+one in the cookie, so a draft saved through another worker is never
+shadowed by a stale copy here.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DRAFT_TTL = int(os.environ.get("DRAFT_TTL_DAYS", "7")) * 86400
+DRAFT_CACHE_SIZE = int(os.environ.get("DRAFT_CACHE_SIZE", "1024"))
+DRAFT_MAX_TITLE = 300
+DRAFT_MAX_DESCRIPTION = 20000
+
+
+class DraftStore:
+    def __init__(self, ttl=DRAFT_TTL, cache_size=DRAFT_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()       # user_id -> draft dict
+        self._lock = threading.Lock()
+
+    def _remember(self, user_id, draft):
+        with self._lock:
+            self._cache[user_id] = draft
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, c, user_id, version):
+        """The user's draft ({"title", "description", "category_id", "version"}) or None."""
+        if not version:
+            return None
+        with self._lock:
+            draft = self._cache.get(user_id)
+        if draft is None or draft["version"] != version:
+            c.execute("""
+                SELECT title, description, category_id, version, updated_at FROM idea_drafts
+                WHERE user_id = ?
+            """, (user_id,))
+            row = c.fetchone()
+            if row is None:
+                return None
+            draft = dict(row)
+            self._remember(user_id, draft)
+        if draft["updated_at"] < time.time() - self.ttl:
+            return None
+        return draft
+
+    def save(self, c, user_id, title, description, category_id):
+        """Insert or replace the user's draft (caller commits); returns the new version."""
+        now = int(time.time())
+        c.execute("""
+            INSERT INTO idea_drafts (user_id, title, description, category_id, version, updated_at)
+            VALUES (?, ?, ?, ?, 1, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                title = excluded.title, description = excluded.description,
+                category_id = excluded.category_id, version = version + 1,
+                updated_at = excluded.updated_at
+            RETURNING version
+        """, (user_id, title[:DRAFT_MAX_TITLE], description[:DRAFT_MAX_DESCRIPTION], category_id or "", now))
+        version = c.fetchone()[0]
+        self._remember(user_id, {"title": title[:DRAFT_MAX_TITLE],
+                                 "description": description[:DRAFT_MAX_DESCRIPTION],
+                                 "category_id": category_id or "", "version": version, "updated_at": now})
+        return version
+
+    def delete(self, c, user_id):
+        c.execute("DELETE FROM idea_drafts WHERE user_id = ?", (user_id,))
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def purge_expired(self, c):
+        """Delete drafts untouched for longer than the TTL; returns how many."""
+        c.execute("DELETE FROM idea_drafts WHERE updated_at < ?", (int(time.time()) - self.ttl,))
+        return c.rowcount
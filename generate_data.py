@@ -0,0 +1,171 @@
+"""Fill a database with synthetic users, ideas, votes, ratings and threaded comments.
+
+The database must already exist (python init_db.py); rows are appended
+with the same derived data the app maintains (idea_stats, rankings, comment scores,
+thread_id, title_key, the FTS and title-similarity indexes), so every
+route behaves as it would on real data. The same --seed gives the same
+rows.
+
+Every generated user has the password GENERATED_PASSWORD (one hash is
+shared: hashing 100k passwords would dominate the run).
+
+Usage:  python generate_data.py --users 100000 --ideas 200000 --votes 5000000 \\
+            --ratings 1000000 --comments 2000000 --comment-votes 1000000
+        DATABASE_PATH=bench.db python generate_data.py --preset small
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+from bulk import rebuild_derived
+from db import connect
+from migrations import migrate
+from similarity import normalize_title
+
+GENERATED_PASSWORD = "Passw0rd!"
+GENERATED_EMAIL = "user{}@example.com"
+BATCH = 50_000
+YEAR = 365 * 24 * 3600
+
+PRESETS = {
+    "small": dict(users=1_000, ideas=2_000, votes=50_000, ratings=20_000, comments=20_000, comment_votes=10_000),
+    "medium": dict(users=20_000, ideas=40_000, votes=1_000_000, ratings=300_000, comments=400_000, comment_votes=200_000),
+    "large": dict(users=100_000, ideas=200_000, votes=5_000_000, ratings=1_000_000, comments=2_000_000,
+                  comment_votes=1_000_000),
+}
+
+WORDS = ("solar roof bike lane rain garden smart meter remote work badge kiosk queue portal feedback "
+         "recycling canteen shuttle parking charger sensor dashboard onboarding mentor training "
+         "wellness desk booking printer energy water lighting heating survey chatbot archive").split()
+ADJECTIVES = "better faster shared green digital automated quiet open mobile modular weekly local".split()
+
+
+def skewed(rng, n):
+    """1..n, biased toward low numbers (a few popular ideas / active users)."""
+    return int(n * rng.random() ** 2) + 1
+
+
+def chunks(rows, size=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_many(conn, sql, rows, label):
+    start = time.perf_counter()
+    total = 0
+    for batch in chunks(rows):
+        conn.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+    print(f"{label}: {total} rows in {time.perf_counter() - start:.1f}s")
+
+
+def generate(conn, rng, users, ideas, votes, ratings, comments, comment_votes):
+    first_user = conn.execute("SELECT COALESCE(MAX(user_id), 0) + 1 FROM users").fetchone()[0]
+    first_idea = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM ideas").fetchone()[0]
+    first_comment = conn.execute("SELECT COALESCE(MAX(comment_id), 0) + 1 FROM comments").fetchone()[0]
+    category_ids = [row[0] for row in conn.execute("SELECT category_id FROM categories")]
+    now = int(time.time())
+    pw = generate_password_hash(GENERATED_PASSWORD)
+
+    def user_rows():
+        for n in range(first_user, first_user + users):
+            role = "reviewer" if rng.random() < 0.1 else "submitter"
+            yield n, f"user{n}", GENERATED_EMAIL.format(n), pw, role
+
+    insert_many(conn, "INSERT INTO users (user_id, username, email, password_hash, role) VALUES (?, ?, ?, ?, ?)",
+                user_rows(), "users")
+    user_ids = range(first_user, first_user + users)
+
+    def idea_rows():
+        for i, n in enumerate(range(first_idea, first_idea + ideas)):
+            title = f"{rng.choice(ADJECTIVES).capitalize()} {rng.choice(WORDS)} {rng.choice(WORDS)} {n}"
+            description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 60)))
+            # ids grow with time, as they do for real submissions
+            submitted_at = now - YEAR + YEAR * i // max(ideas, 1)
+            yield (n, title, description, rng.choice(category_ids), rng.choice(user_ids), submitted_at,
+                   normalize_title(title))
+
+    insert_many(conn, """INSERT INTO ideas (id, title, description, category_id, submitter_id, submitted_at, title_key)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)""", idea_rows(), "ideas")
+
+    def pick_idea():
+        return first_idea + skewed(rng, ideas) - 1
+
+    def pick_user():
+        return rng.choice(user_ids)
+
+    insert_many(conn, "INSERT OR IGNORE INTO votes (idea_id, user_id, vote_value, voted_at) VALUES (?, ?, ?, ?)",
+                ((pick_idea(), pick_user(), 1 if rng.random() < 0.7 else -1, now - rng.randrange(YEAR))
+                 for _ in range(votes)), "votes")
+    insert_many(conn, "INSERT OR IGNORE INTO star_ratings (idea_id, user_id, stars, rated_at) VALUES (?, ?, ?, ?)",
+                ((pick_idea(), pick_user(), rng.randint(1, 5), now - rng.randrange(YEAR))
+                 for _ in range(ratings)), "star_ratings")
+
+    def comment_rows():
+        per_idea = {}
+        roots = {}
+        for i, cid in enumerate(range(first_comment, first_comment + comments)):
+            idea_id = pick_idea()
+            siblings = per_idea.setdefault(idea_id, [])
+            parent_id = thread_id = None
+            if siblings and rng.random() < 0.6:
+                parent_id = rng.choice(siblings)
+                thread_id = roots[parent_id]
+            roots[cid] = thread_id or cid
+            siblings.append(cid)
+            created_at = now - YEAR + YEAR * i // max(comments, 1)
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+            yield cid, idea_id, pick_user(), content, parent_id, thread_id, created_at
+
+    insert_many(conn, """INSERT INTO comments (comment_id, idea_id, user_id, content, parent_id, thread_id, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)""", comment_rows(), "comments")
+    if comments:
+        insert_many(conn, "INSERT OR IGNORE INTO comment_votes (comment_id, user_id, vote_value) VALUES (?, ?, ?)",
+                    ((first_comment + skewed(rng, comments) - 1, pick_user(), 1 if rng.random() < 0.8 else -1)
+                     for _ in range(comment_votes)), "comment_votes")
+
+    # ---- derived data the app keeps up to date on every write ----
+    start = time.perf_counter()
+    rebuild_derived(conn)
+    print(f"derived tables rebuilt in {time.perf_counter() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.environ.get("DATABASE_PATH", "database.db"))
+    parser.add_argument("--preset", choices=sorted(PRESETS))
+    parser.add_argument("--seed", type=int, default=1)
+    for name in PRESETS["small"]:
+        parser.add_argument("--" + name.replace("_", "-"), type=int)
+    args = parser.parse_args(argv)
+
+    sizes = dict(PRESETS[args.preset or "small"])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found: run init_db.py first (DATABASE_PATH={args.db} python init_db.py)")
+    conn = connect(args.db)
+    migrate(conn)
+    # bulk load: losing the last batches on a crash is fine for synthetic data
+    conn.execute("PRAGMA synchronous = OFF")
+    start = time.perf_counter()
+    generate(conn, random.Random(args.seed), **sizes)
+    conn.close()
+    print(f"done in {time.perf_counter() - start:.1f}s: {sizes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 import sqlite3
 import os
 from werkzeug.security import generate_password_hash
+from migrations import migrate
 
-DB = "database.db"
+DB = os.environ.get("DATABASE_PATH", "database.db")
 
 if os.path.exists(DB):
     os.remove(DB)
     print("Old database removed.")
+for leftover in (DB + "-wal", DB + "-shm"):
+    if os.path.exists(leftover):
+        os.remove(leftover)
 
 conn = sqlite3.connect(DB)
+# free pages can be handed back a few at a time (see maintenance.py)
+conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
 c = conn.cursor()
 
 # ---- USERS ----
@@ -109,6 +115,9 @@ c.execute("""
 """, (admin_username, admin_email, admin_pass))
 
 conn.commit()
+
+# -------- INDEXES / LATER SCHEMA CHANGES --------
+migrate(conn)
 conn.close()
 
 print("Database created successfully with admin user!")
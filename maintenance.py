@@ -0,0 +1,318 @@
+"""Scheduled database upkeep: WAL checkpoints, ANALYZE / PRAGMA optimize,
+incremental vacuum and online backups.
+
+A task is a function task(conn) -> dict of details (bytes freed, pages
+moved, ...) with how often it should run. MaintenanceScheduler runs the
+due ones, either from `flask maintenance` or, with MAINTENANCE=1, from a
+background thread in every worker that wakes every MAINTENANCE_TICK
+seconds. Tasks marked `idle` wait until the worker has served no request
+for MAINTENANCE_IDLE_SECONDS; one overdue by a whole interval runs anyway,
+so a busy site cannot put them off forever. A task that has never run is
+due at once, but "overdue" counts from when the scheduler started, so a
+fresh worker does not ANALYZE or back up under load on its first tick.
+
+Every run is a row in maintenance_runs (start, seconds, details or error),
+and one line on the "maintenance" logger. A task that raises is recorded
+as failed and the scheduler thread carries on with the next one. A task is claimed by inserting its row
+inside BEGIN IMMEDIATE once the last start is an interval old, so with
+several workers each run still happens once.
+
+Backups use the sqlite3 backup API in a single step. Under WAL that is
+one read transaction: the copy is consistent and writers carry on while
+it is taken. The copy is written next to its final name and renamed when
+complete, is switched to a rollback journal so it is one self-contained
+file, and the newest DB_BACKUP_KEEP are kept.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import db
+
+MAINTENANCE_TICK = float(os.environ.get("MAINTENANCE_TICK", "30"))
+MAINTENANCE_IDLE_SECONDS = float(os.environ.get("MAINTENANCE_IDLE_SECONDS", "20"))
+WAL_TRUNCATE_BYTES = int(os.environ.get("WAL_TRUNCATE_MB", "64")) * 1024 * 1024
+VACUUM_PAGES = int(os.environ.get("VACUUM_PAGES", "2000"))     # per run, bounds the write lock
+ANALYSIS_LIMIT = int(os.environ.get("ANALYSIS_LIMIT", "1000"))  # rows sampled per index by optimize
+DB_BACKUP_KEEP = int(os.environ.get("DB_BACKUP_KEEP", "7"))
+KEEP_RUNS_DAYS = 30
+
+log = logging.getLogger("maintenance")
+
+
+class Task:
+    __slots__ = ("name", "func", "interval", "idle")
+
+    def __init__(self, name, func, interval, idle=False):
+        self.name = name
+        self.func = func            # func(conn) -> dict
+        self.interval = interval    # seconds; 0 = only when asked for by name
+        self.idle = idle            # wait for a quiet moment
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def db_path(conn):
+    return conn.execute("PRAGMA database_list").fetchone()["file"]
+
+
+def free_pages(conn):
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+# ---------------- TASKS ----------------
+def checkpoint(conn, mode="PASSIVE"):
+    """Copy the WAL back into the database. PASSIVE never waits for anyone;
+    TRUNCATE also shrinks the -wal file, but holds the write lock while it
+    waits for readers to move past the checkpoint."""
+    wal = db_path(conn) + "-wal"
+    before = file_size(wal)
+    busy, log_pages, moved = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    after = file_size(wal)
+    return {"mode": mode, "busy": bool(busy), "wal_pages": log_pages, "checkpointed_pages": moved,
+            "wal_bytes": after, "bytes_freed": before - after}
+
+
+def truncate_wal(conn):
+    """TRUNCATE checkpoint, only once the -wal file has grown past WAL_TRUNCATE_BYTES."""
+    size = file_size(db_path(conn) + "-wal")
+    if size <= WAL_TRUNCATE_BYTES:
+        return {"skipped": "wal below WAL_TRUNCATE_MB", "wal_bytes": size}
+    return checkpoint(conn, "TRUNCATE")
+
+
+def optimize(conn):
+    """PRAGMA optimize: re-ANALYZE only the tables whose statistics look stale."""
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("PRAGMA optimize")
+    conn.execute("PRAGMA analysis_limit = 0")
+    return {}
+
+
+def analyze(conn):
+    """Full ANALYZE of every table and index."""
+    conn.execute("ANALYZE")
+    return {"stat_rows": conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0]}
+
+
+def incremental_vacuum(conn):
+    """Give up to VACUUM_PAGES free pages back to the file system (auto_vacuum = INCREMENTAL only)."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return {"skipped": "auto_vacuum is not INCREMENTAL (flask maintenance --enable-incremental-vacuum)",
+                "free_pages": free_pages(conn)}
+    free_before = free_pages(conn)
+    # execute() steps this pragma once (one page); executescript() runs it to the end
+    conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+    free_after = free_pages(conn)
+    # under WAL the file itself shrinks at the next checkpoint
+    released = free_before - free_after
+    return {"pages_released": released, "free_pages": free_after,
+            "bytes_freed": released * conn.execute("PRAGMA page_size").fetchone()[0]}
+
+
+def enable_incremental_vacuum(conn):
+    """One-off: switch the file to auto_vacuum = INCREMENTAL. Runs a full VACUUM,
+    which rewrites the whole database under an exclusive lock."""
+    path = db_path(conn)
+    before = file_size(path)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return {"bytes_freed": before - file_size(path)}
+
+
+def backup(conn, dest_dir, keep=DB_BACKUP_KEEP):
+    """Consistent online copy of the database into dest_dir; prunes old copies."""
+    os.makedirs(dest_dir, exist_ok=True)
+    base = os.path.splitext(os.path.basename(db_path(conn)))[0]
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    dest = os.path.join(dest_dir, f"{base}-{stamp}.db")
+    partial = dest + ".partial"
+
+    target = sqlite3.connect(partial)
+    try:
+        conn.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE")
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        target.close()
+    if check != "ok":
+        os.remove(partial)
+        raise sqlite3.DatabaseError(f"backup failed quick_check: {check}")
+    os.replace(partial, dest)
+
+    old = sorted(name for name in os.listdir(dest_dir)
+                 if name.startswith(base + "-") and name.endswith(".db"))[:-max(keep, 1)]
+    freed = 0
+    for name in old:
+        freed += file_size(os.path.join(dest_dir, name))
+        os.remove(os.path.join(dest_dir, name))
+    return {"path": dest, "bytes": file_size(dest), "pruned": len(old), "bytes_freed": freed}
+
+
+def db_tasks(backup_dir, backup_hours=24):
+    """The database upkeep tasks, in the order they run (backup_hours=0: backups only on demand)."""
+    return [
+        Task("checkpoint", checkpoint, 5 * 60),
+        Task("truncate_wal", truncate_wal, 3600, idle=True),
+        Task("optimize", optimize, 3600),
+        Task("analyze", analyze, 86400, idle=True),
+        Task("incremental_vacuum", incremental_vacuum, 3600, idle=True),
+        Task("backup", lambda conn: backup(conn, backup_dir), backup_hours * 3600, idle=True),
+    ]
+
+
+# ---------------- SCHEDULER ----------------
+class MaintenanceScheduler:
+    def __init__(self, path, tasks, tick=MAINTENANCE_TICK, idle_seconds=MAINTENANCE_IDLE_SECONDS):
+        self.path = path
+        self.tasks = {task.name: task for task in tasks}
+        self.tick = tick
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._in_flight = 0
+        self._last_request = 0.0
+        self._since = time.time()      # what a never-run task's age counts from
+        self.runs = 0
+        self.failures = 0
+
+    # request hooks: what "idle" means for this worker
+    def request_started(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._last_request = time.time()
+
+    def idle(self):
+        with self._lock:
+            return self._in_flight == 0 and time.time() - self._last_request >= self.idle_seconds
+
+    def start(self):
+        with self._lock:
+            # a thread does not survive fork(): each worker starts its own
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._since = time.time()
+            self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        conn = None
+        while True:
+            time.sleep(self.tick)
+            try:
+                if conn is None:
+                    conn = db.connect(self.path)
+                elif conn.in_transaction:
+                    conn.rollback()
+                self.run_due(conn, idle=self.idle())
+            except Exception:
+                log.exception("scheduler tick failed")
+
+    def run_due(self, conn, idle=True, names=None, force=False):
+        """Run the tasks that are due (or the named ones; force ignores the schedule).
+        Returns [(name, seconds, details or None, error or None)] for the tasks that ran."""
+        done = []
+        for task in self.tasks.values():
+            if names is not None and task.name not in names:
+                continue
+            if names is None and not task.interval:
+                continue
+            run_id = self._claim(conn, task, idle, force)
+            if run_id is not None:
+                done.append(self._run_task(conn, task, run_id))
+        return done
+
+    def _due(self, conn, task, idle):
+        last = conn.execute("SELECT MAX(started_at) FROM maintenance_runs WHERE task = ?",
+                            (task.name,)).fetchone()[0]
+        if last is None:
+            # never run: due now, but only forced through a busy worker after
+            # two intervals of running without a quiet moment
+            return idle or not task.idle or time.time() - self._since >= 2 * task.interval
+        age = time.time() - last
+        return age >= task.interval and (idle or not task.idle or age >= 2 * task.interval)
+
+    def _claim(self, conn, task, idle, force):
+        # cheap read first: most ticks find nothing due and take no write lock
+        if not force and not self._due(conn, task, idle):
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not force and not self._due(conn, task, idle):
+                conn.rollback()
+                return None
+            conn.execute("DELETE FROM maintenance_runs WHERE task = ? AND started_at < ?",
+                         (task.name, int(time.time()) - KEEP_RUNS_DAYS * 86400))
+            run_id = conn.execute("INSERT INTO maintenance_runs (task, started_at) VALUES (?, ?)",
+                                  (task.name, int(time.time()))).lastrowid
+            conn.commit()
+            return run_id
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _run_task(self, conn, task, run_id):
+        start = time.perf_counter()
+        details = error = None
+        try:
+            details = task.func(conn)
+            if conn.in_transaction:
+                conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            error = str(e) or type(e).__name__
+        seconds = time.perf_counter() - start
+        conn.execute("UPDATE maintenance_runs SET seconds = ?, details = ?, error = ? WHERE run_id = ?",
+                     (round(seconds, 6), json.dumps(details) if details is not None else None, error, run_id))
+        conn.commit()
+        with self._lock:
+            self.runs += 1
+            if error is not None:
+                self.failures += 1
+        if error is None:
+            log.info("%s ok in %.3fs %s", task.name, seconds, json.dumps(details))
+        else:
+            log.warning("%s failed in %.3fs %s", task.name, seconds, error)
+        return task.name, seconds, details, error
+
+    def status(self, conn):
+        """Last run of every task and when the next one is due, for the admin page."""
+        # newest run of each task: one index seek per task, in one statement
+        parts = ["SELECT * FROM (SELECT task, run_id, started_at, seconds, details, error FROM maintenance_runs "
+                 "WHERE task = ? ORDER BY started_at DESC LIMIT 1)"] * len(self.tasks)
+        rows = {row["task"]: dict(row) for row in conn.execute(" UNION ALL ".join(parts), list(self.tasks))}
+        tasks = []
+        for task in self.tasks.values():
+            last = rows.get(task.name)
+            if last and last["details"]:
+                last["details"] = json.loads(last["details"])
+            tasks.append({
+                "task": task.name,
+                "interval_seconds": task.interval,
+                "waits_for_idle": task.idle,
+                "next_due": last["started_at"] + task.interval if last and task.interval else None,
+                "last": last,
+            })
+        with self._lock:
+            return {
+                "scheduler_running": self._thread is not None and self._thread.is_alive(),
+                "runs_total": self.runs,
+                "failures_total": self.failures,
+                "tasks": tasks,
+            }
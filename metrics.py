@@ -0,0 +1,153 @@
+"""Per-request SQL and latency metrics, slow-query log, Prometheus text output.
+
+db.STATEMENT_HOOKS feeds every statement run on our connections into the
+current request's counters (statement count, time spent executing
+statements and fetching their rows, repeats of the same normalized
+statement). When the request ends its latency and DB totals go into
+per-route histograms; a statement repeated N_PLUS_ONE_THRESHOLD times in
+one request is logged as a probable N+1 loop, and any statement slower
+than SLOW_QUERY_MS goes to the slow-query log with its literals stripped.
+
+Counters live in this process; with several gunicorn workers each one
+reports its own series (scrape them individually or aggregate).
+"""
+import logging
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "10"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+log = logging.getLogger("sql")
+if os.environ.get("SLOW_QUERY_LOG"):
+    _handler = logging.FileHandler(os.environ["SLOW_QUERY_LOG"])
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Statement text with literals replaced by ? and IN (?, ?, ...) lists collapsed."""
+    sql = " ".join(sql.split())
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RequestStats:
+    """Statement counters for one request (kept on flask.g)."""
+
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()                                  # (route, method, status)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.db_seconds = Counter()
+        self.slow_queries = Counter()
+        self.n_plus_one = Counter()
+
+    def on_statement(self, stats, route, sql, seconds):
+        """Record one statement; stats is None outside a request (e.g. the write-behind thread)."""
+        if sql.startswith("--"):
+            return
+        normalized = None
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+            normalized = normalize_sql(sql)
+            stats.statements[normalized] += 1
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            normalized = normalized or normalize_sql(sql)
+            with self._lock:
+                self.slow_queries[route] += 1
+            log.warning("slow query %.1f ms [%s] %s", seconds * 1000, route, normalized)
+
+    def on_request_end(self, route, method, status, seconds, stats):
+        repeated = [(sql, n) for sql, n in stats.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+        for sql, n in repeated:
+            log.warning("possible N+1: %s ran %d times in one request [%s %s]", sql, n, method, route)
+        with self._lock:
+            self.requests[(route, method, status)] += 1
+            self.latency[route].observe(seconds)
+            self.queries[route].observe(stats.queries)
+            self.db_seconds[route] += stats.db_seconds
+            self.n_plus_one[route] += len(repeated)
+
+    def render(self, gauges=(), counters=()):
+        """Prometheus text exposition format; gauges and counters (values that only go up,
+        named *_total) are lists of (name, help, {labels: value}) read from elsewhere."""
+        out = []
+
+        def family(name, kind, help_text):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, help_text, series):
+            family(name, "histogram", help_text)
+            for route, h in sorted(series.items()):
+                for bound, count in zip(h.buckets, h.counts):
+                    out.append(f'{name}_bucket{{route="{_escape(route)}",le="{bound}"}} {count}')
+                out.append(f'{name}_bucket{{route="{_escape(route)}",le="+Inf"}} {h.count}')
+                out.append(f'{name}_sum{{route="{_escape(route)}"}} {h.sum:.6f}')
+                out.append(f'{name}_count{{route="{_escape(route)}"}} {h.count}')
+
+        def counter(name, help_text, series):
+            family(name, "counter", help_text)
+            for route, value in sorted(series.items()):
+                out.append(f'{name}{{route="{_escape(route)}"}} {value:g}')
+
+        with self._lock:
+            family("http_requests_total", "counter", "Requests by route, method and status.")
+            for (route, method, status), n in sorted(self.requests.items()):
+                out.append(f'http_requests_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {n}')
+            histogram("http_request_duration_seconds", "Request latency.", self.latency)
+            histogram("db_queries_per_request", "SQL statements executed per request.", self.queries)
+            counter("db_time_seconds_total", "Time spent running SQL statements and fetching their rows, by route.", self.db_seconds)
+            counter("db_slow_queries_total", f"Statements slower than {SLOW_QUERY_MS:g} ms.", self.slow_queries)
+            counter("db_n_plus_one_total", "Statements repeated N_PLUS_ONE_THRESHOLD+ times in one request.",
+                    self.n_plus_one)
+
+        for kind, series in (("gauge", gauges), ("counter", counters)):
+            for name, help_text, values in series:
+                family(name, kind, help_text)
+                for labels, value in values.items():
+                    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    out.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
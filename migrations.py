@@ -0,0 +1,507 @@
+"""Versioned schema migrations for database.db.
+
+The schema version lives in PRAGMA user_version. Every migration runs in
+its own BEGIN IMMEDIATE transaction together with the version bump, so a
+live database is either fully at version N or still at N-1, and several
+workers starting at once apply each step only once.
+
+Usage:  python migrations.py            (upgrade database.db)
+        python migrations.py --status   (show current / latest version)
+"""
+import sqlite3
+import sys
+
+# rounded star average, as shown and sorted on /ideas
+STAR_AVG_SQL = "CASE WHEN star_count > 0 THEN ROUND(star_sum * 1.0 / star_count, 1) ELSE 0 END"
+
+
+def table_columns(conn, table_name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+def table_exists(conn, table_name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone()
+    return row is not None
+
+
+def rebuild_search_index(conn):
+    """Rebuild ideas_fts from the ideas table, leaving out soft-deleted ideas."""
+    # 'rebuild' reads every row of the content table; the purge deletes the
+    # hidden ones later without touching the index, so take them out now
+    conn.execute("INSERT INTO ideas_fts(ideas_fts) VALUES('rebuild')")
+    if "deleted_at" in table_columns(conn, "ideas"):
+        conn.execute("""
+            INSERT INTO ideas_fts(ideas_fts, rowid, title, description)
+            SELECT 'delete', id, title, description FROM ideas WHERE deleted_at IS NOT NULL
+        """)
+
+
+def rebuild_idea_stats(conn):
+    """Recompute every idea_stats row from the votes and star_ratings tables."""
+    # soft-deleted ideas stay out of the listing (no idea_stats row)
+    live = "WHERE ideas.deleted_at IS NULL" if "deleted_at" in table_columns(conn, "ideas") else ""
+    has_comment_count = "comment_count" in table_columns(conn, "idea_stats")
+    conn.execute("DELETE FROM idea_stats")
+    conn.execute(f"""
+        INSERT INTO idea_stats (idea_id, vote_score, vote_count, star_sum, star_count)
+        SELECT ideas.id,
+               COALESCE(v.vote_score, 0), COALESCE(v.vote_count, 0),
+               COALESCE(r.star_sum, 0), COALESCE(r.star_count, 0)
+        FROM ideas
+        LEFT JOIN (SELECT idea_id, SUM(vote_value) AS vote_score, COUNT(*) AS vote_count
+                   FROM votes GROUP BY idea_id) v ON v.idea_id = ideas.id
+        LEFT JOIN (SELECT idea_id, SUM(stars) AS star_sum, COUNT(*) AS star_count
+                   FROM star_ratings GROUP BY idea_id) r ON r.idea_id = ideas.id
+        {live}
+    """)
+    conn.execute(f"UPDATE idea_stats SET star_avg = {STAR_AVG_SQL}")
+    if has_comment_count:
+        conn.execute("""
+            UPDATE idea_stats SET comment_count = c.n
+            FROM (SELECT idea_id, COUNT(*) AS n FROM comments GROUP BY idea_id) AS c
+            WHERE c.idea_id = idea_stats.idea_id
+        """)
+
+
+# ---------------- MIGRATIONS ----------------
+# Each step is idempotent, so databases that already got part of a change
+# from the old ad hoc ensure_* helpers upgrade cleanly.
+
+def m001_star_ratings(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS star_ratings (
+        rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idea_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        stars INTEGER NOT NULL CHECK(stars BETWEEN 1 AND 5),
+        UNIQUE(idea_id, user_id),
+        FOREIGN KEY (idea_id) REFERENCES ideas(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    """)
+
+
+def m002_idea_stats(conn):
+    existed = table_exists(conn, "idea_stats")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS idea_stats (
+        idea_id INTEGER PRIMARY KEY,
+        vote_score INTEGER NOT NULL DEFAULT 0,
+        vote_count INTEGER NOT NULL DEFAULT 0,
+        star_sum INTEGER NOT NULL DEFAULT 0,
+        star_count INTEGER NOT NULL DEFAULT 0,
+        star_avg REAL NOT NULL DEFAULT 0,
+        FOREIGN KEY (idea_id) REFERENCES ideas(id) ON DELETE CASCADE
+    );
+    """)
+    if not existed:
+        rebuild_idea_stats(conn)
+    elif "star_avg" not in table_columns(conn, "idea_stats"):
+        conn.execute("ALTER TABLE idea_stats ADD COLUMN star_avg REAL NOT NULL DEFAULT 0")
+        conn.execute(f"UPDATE idea_stats SET star_avg = {STAR_AVG_SQL}")
+    # covering index for the /ideas ordering (stars, score, then oldest first)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_idea_stats_rank
+        ON idea_stats (star_avg DESC, vote_score DESC, idea_id ASC)
+    """)
+
+
+def m003_ideas_fts(conn):
+    if table_exists(conn, "ideas_fts"):
+        return
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE ideas_fts USING fts5(
+            title, description,
+            content='ideas', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        """)
+    except sqlite3.OperationalError as e:
+        # no FTS5 in this SQLite build: search falls back to LIKE
+        print("FTS5 unavailable, skipping ideas_fts:", e)
+        return
+    conn.execute("INSERT INTO ideas_fts(ideas_fts) VALUES('rebuild')")
+
+
+def m004_comment_threads(conn):
+    # comments.thread_id: NULL for top-level comments, the root comment_id
+    # for replies at any depth
+    if "thread_id" not in table_columns(conn, "comments"):
+        conn.execute("ALTER TABLE comments ADD COLUMN thread_id INTEGER")
+        conn.execute("""
+            CREATE TEMP TABLE comment_roots AS
+            WITH RECURSIVE tree(comment_id, root_id) AS (
+                SELECT comment_id, comment_id FROM comments WHERE parent_id IS NULL
+                UNION ALL
+                SELECT comments.comment_id, tree.root_id
+                FROM comments JOIN tree ON comments.parent_id = tree.comment_id
+            )
+            SELECT comment_id, root_id FROM tree
+        """)
+        conn.execute("CREATE UNIQUE INDEX temp.comment_roots_id ON comment_roots(comment_id)")
+        conn.execute("""
+            UPDATE comments SET thread_id = (
+                SELECT root_id FROM comment_roots WHERE comment_roots.comment_id = comments.comment_id)
+            WHERE parent_id IS NOT NULL
+        """)
+        conn.execute("DROP TABLE temp.comment_roots")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_idea_roots ON comments (idea_id, parent_id, comment_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments (thread_id, comment_id)")
+
+
+def m005_comment_scores(conn):
+    if "score" not in table_columns(conn, "comments"):
+        conn.execute("ALTER TABLE comments ADD COLUMN score INTEGER NOT NULL DEFAULT 0")
+        conn.execute("""
+            UPDATE comments SET score = (
+                SELECT SUM(vote_value) FROM comment_votes WHERE comment_votes.comment_id = comments.comment_id)
+            WHERE comment_id IN (SELECT comment_id FROM comment_votes)
+        """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_idea_top ON comments (idea_id, parent_id, score DESC, comment_id)")
+
+
+def m006_hot_path_indexes(conn):
+    # lookups by idea_id on votes / star_ratings / comment_votes are already
+    # served by their UNIQUE(idea_id|comment_id, user_id) autoindexes
+    for ddl in (
+        # delete_comment() and the parent_id ON DELETE CASCADE
+        "CREATE INDEX IF NOT EXISTS idx_comments_parent ON comments (parent_id)",
+        # delete_user(): per-user rollback of aggregates and FK cascades
+        "CREATE INDEX IF NOT EXISTS idx_votes_user ON votes (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_star_ratings_user ON star_ratings (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comment_votes_user ON comment_votes (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_user ON comments (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_ideas_submitter ON ideas (submitter_id)",
+        # delete_category() FK check
+        "CREATE INDEX IF NOT EXISTS idx_ideas_category ON ideas (category_id)",
+        # submit_idea() duplicate check: WHERE LOWER(title) = LOWER(?)
+        "CREATE INDEX IF NOT EXISTS idx_ideas_title_lower ON ideas (LOWER(title))",
+    ):
+        conn.execute(ddl)
+
+
+def m007_title_key_and_similarity(conn):
+    from similarity import lsh_buckets, normalize_title
+
+    if "title_key" not in table_columns(conn, "ideas"):
+        conn.execute("ALTER TABLE ideas ADD COLUMN title_key TEXT")
+    # existing rows whose keys collide keep the oldest idea's key; the rest
+    # get "#<id>" appended so the unique index can be built
+    seen = set()
+    rows = conn.execute("SELECT id, title FROM ideas ORDER BY id").fetchall()
+    updates = []
+    for idea_id, title in rows:
+        key = normalize_title(title)
+        if key in seen:
+            key = f"{key}#{idea_id}"
+        seen.add(key)
+        updates.append((key, idea_id))
+    conn.executemany("UPDATE ideas SET title_key = ? WHERE id = ?", updates)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ideas_title_key ON ideas (title_key)")
+    conn.execute("DROP INDEX IF EXISTS idx_ideas_title_lower")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS idea_title_lsh (
+        bucket INTEGER NOT NULL,
+        idea_id INTEGER NOT NULL,
+        PRIMARY KEY (bucket, idea_id),
+        FOREIGN KEY (idea_id) REFERENCES ideas(id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_idea_title_lsh_idea ON idea_title_lsh (idea_id)")
+    conn.execute("DELETE FROM idea_title_lsh")
+    conn.executemany("INSERT OR IGNORE INTO idea_title_lsh (bucket, idea_id) VALUES (?, ?)",
+                     ((bucket, idea_id) for idea_id, title in rows for bucket in lsh_buckets(title)))
+
+
+def m008_cache_versions(conn):
+    # page-cache version counters, bumped by writes (see cached_page in app.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        key TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    """)
+
+
+def m009_epoch_timestamps(conn):
+    # the old TEXT columns have TEXT affinity (an integer written there comes
+    # back as a string), so the epoch values get new INTEGER columns; the
+    # legacy submission_date / timestamp columns are no longer written
+    if "submitted_at" not in table_columns(conn, "ideas"):
+        conn.execute("ALTER TABLE ideas ADD COLUMN submitted_at INTEGER")
+        conn.execute("""
+            UPDATE ideas SET submitted_at = CAST(strftime('%s', submission_date) AS INTEGER)
+            WHERE submission_date IS NOT NULL
+        """)
+    if "created_at" not in table_columns(conn, "comments"):
+        conn.execute("ALTER TABLE comments ADD COLUMN created_at INTEGER")
+        conn.execute("""
+            UPDATE comments SET created_at = CAST(strftime('%s', timestamp) AS INTEGER)
+            WHERE timestamp IS NOT NULL
+        """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ideas_submitted ON ideas (submitted_at)")
+
+
+def m010_activity_rollups(conn):
+    from analytics import create_activity_tables, rebuild_activity
+
+    create_activity_tables(conn)
+    rebuild_activity(conn)
+
+
+def m011_user_search(conn):
+    # case-insensitive prefix search on /admin: range seeks on NOCASE indexes
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users (username COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users (email COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)")
+
+    # user totals per role for the /admin header, kept exact by triggers so
+    # every writer (register, change_role, delete_user, scripts) is covered
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_counts (
+        role TEXT PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("DELETE FROM user_counts")
+    conn.execute("INSERT INTO user_counts (role, n) SELECT COALESCE(role, ''), COUNT(*) FROM users GROUP BY 1")
+    bump = """INSERT INTO user_counts (role, n) VALUES (COALESCE({row}.role, ''), {delta})
+              ON CONFLICT(role) DO UPDATE SET n = n + {delta};"""
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_count_insert AFTER INSERT ON users BEGIN
+            {bump.format(row="NEW", delta=1)}
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_count_delete AFTER DELETE ON users BEGIN
+            {bump.format(row="OLD", delta=-1)}
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_count_role AFTER UPDATE OF role ON users
+        WHEN COALESCE(OLD.role, '') IS NOT COALESCE(NEW.role, '') BEGIN
+            {bump.format(row="OLD", delta=-1)}
+            {bump.format(row="NEW", delta=1)}
+        END""")
+
+
+def m012_idea_drafts(conn):
+    # server-side submit-form drafts (see drafts.py); replaces temp_* session keys
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS idea_drafts (
+        user_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL DEFAULT '',
+        description TEXT NOT NULL DEFAULT '',
+        category_id TEXT NOT NULL DEFAULT '',
+        version INTEGER NOT NULL DEFAULT 1,
+        updated_at INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_idea_drafts_updated ON idea_drafts (updated_at)")
+
+
+def m013_ranking(conn):
+    # hot / trending / controversial orderings for /ideas (see ranking.py)
+    from ranking import RANK_COLUMNS, rebuild_ranking
+
+    if "voted_at" not in table_columns(conn, "votes"):
+        conn.execute("ALTER TABLE votes ADD COLUMN voted_at INTEGER")
+    if "rated_at" not in table_columns(conn, "star_ratings"):
+        conn.execute("ALTER TABLE star_ratings ADD COLUMN rated_at INTEGER")
+    stats_columns = table_columns(conn, "idea_stats")
+    for column in RANK_COLUMNS:
+        if column not in stats_columns:
+            conn.execute(f"ALTER TABLE idea_stats ADD COLUMN {column} REAL NOT NULL DEFAULT 0")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_idea_stats_{column} ON idea_stats ({column} DESC, idea_id ASC)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rank_landmark (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        landmark INTEGER NOT NULL
+    );
+    """)
+    conn.execute("INSERT OR IGNORE INTO rank_landmark (id, landmark) VALUES (1, CAST(strftime('%s', 'now') AS INTEGER))")
+    rebuild_ranking(conn)
+
+
+def m014_soft_delete(conn):
+    # delete_idea / delete_user hide the row, purge.py removes it in batches
+    for table in ("ideas", "users"):
+        if "deleted_at" not in table_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN deleted_at INTEGER")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS purge_jobs (
+        job_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        target_id INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        step INTEGER NOT NULL DEFAULT 0,
+        rows_deleted INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_purge_jobs_state ON purge_jobs (state, job_id)")
+
+
+def m015_maintenance_runs(conn):
+    # one row per scheduled upkeep run (see maintenance.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        run_id INTEGER PRIMARY KEY,
+        task TEXT NOT NULL,
+        started_at INTEGER NOT NULL,
+        seconds REAL,
+        details TEXT,
+        error TEXT
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_runs_task ON maintenance_runs (task, started_at)")
+
+
+def m016_comment_count(conn):
+    # the "Comments (n)" header without counting the thread on every view;
+    # triggers cover every writer, including the parent_id ON DELETE CASCADE
+    if "comment_count" not in table_columns(conn, "idea_stats"):
+        conn.execute("ALTER TABLE idea_stats ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        UPDATE idea_stats SET comment_count = c.n
+        FROM (SELECT idea_id, COUNT(*) AS n FROM comments GROUP BY idea_id) AS c
+        WHERE c.idea_id = idea_stats.idea_id
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_count_insert AFTER INSERT ON comments BEGIN
+            UPDATE idea_stats SET comment_count = comment_count + 1 WHERE idea_id = NEW.idea_id;
+        END""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_count_delete AFTER DELETE ON comments BEGIN
+            UPDATE idea_stats SET comment_count = comment_count - 1 WHERE idea_id = OLD.idea_id;
+        END""")
+
+
+def m017_title_key_fallback(conn):
+    # titles with no letters / digits used to get the empty key (or "#<id>"
+    # from m007); give them their casefolded title instead
+    from similarity import idea_title_key, normalize_title
+
+    taken = {key for (key,) in conn.execute("SELECT title_key FROM ideas WHERE title_key IS NOT NULL")}
+    updates = []
+    for idea_id, title, old_key in conn.execute("SELECT id, title, title_key FROM ideas").fetchall():
+        if normalize_title(title) or old_key is None:
+            continue
+        key = idea_title_key(title)
+        if key == old_key:
+            continue
+        if key in taken:
+            key = f"{key}#{idea_id}"
+        taken.add(key)
+        updates.append((key, idea_id))
+    conn.executemany("UPDATE ideas SET title_key = ? WHERE id = ?", updates)
+
+
+def m018_user_counts_live(conn):
+    # user_counts counts live users: soft delete takes a user out of the
+    # /admin totals in its own transaction, not when the purge gets to the row
+    for name in ("users_count_insert", "users_count_delete", "users_count_role"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DELETE FROM user_counts")
+    conn.execute("""INSERT INTO user_counts (role, n)
+                    SELECT COALESCE(role, ''), COUNT(*) FROM users WHERE deleted_at IS NULL GROUP BY 1""")
+    bump = """INSERT INTO user_counts (role, n) VALUES (COALESCE({row}.role, ''), {delta})
+              ON CONFLICT(role) DO UPDATE SET n = n + {delta};"""
+    conn.execute(f"""
+        CREATE TRIGGER users_count_insert AFTER INSERT ON users
+        WHEN NEW.deleted_at IS NULL BEGIN
+            {bump.format(row="NEW", delta=1)}
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER users_count_delete AFTER DELETE ON users
+        WHEN OLD.deleted_at IS NULL BEGIN
+            {bump.format(row="OLD", delta=-1)}
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER users_count_role AFTER UPDATE OF role ON users
+        WHEN COALESCE(OLD.role, '') IS NOT COALESCE(NEW.role, '')
+         AND OLD.deleted_at IS NULL AND NEW.deleted_at IS NULL BEGIN
+            {bump.format(row="OLD", delta=-1)}
+            {bump.format(row="NEW", delta=1)}
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_count_soft_delete AFTER UPDATE OF deleted_at ON users
+        WHEN OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL BEGIN
+            {bump.format(row="OLD", delta=-1)}
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_count_restore AFTER UPDATE OF deleted_at ON users
+        WHEN OLD.deleted_at IS NOT NULL AND NEW.deleted_at IS NULL BEGIN
+            {bump.format(row="NEW", delta=1)}
+        END""")
+
+
+MIGRATIONS = [
+    (1, "star_ratings table", m001_star_ratings),
+    (2, "idea_stats rollup", m002_idea_stats),
+    (3, "ideas_fts full-text index", m003_ideas_fts),
+    (4, "comments.thread_id", m004_comment_threads),
+    (5, "comments.score", m005_comment_scores),
+    (6, "hot-path indexes", m006_hot_path_indexes),
+    (7, "ideas.title_key + title similarity index", m007_title_key_and_similarity),
+    (8, "cache_versions", m008_cache_versions),
+    (9, "epoch timestamps", m009_epoch_timestamps),
+    (10, "daily activity rollups", m010_activity_rollups),
+    (11, "user search indexes + user_counts", m011_user_search),
+    (12, "idea_drafts", m012_idea_drafts),
+    (13, "idea ranking columns + vote timestamps", m013_ranking),
+    (14, "soft delete + purge_jobs", m014_soft_delete),
+    (15, "maintenance_runs", m015_maintenance_runs),
+    (16, "idea_stats.comment_count", m016_comment_count),
+    (17, "title_key fallback for symbol-only titles", m017_title_key_fallback),
+    (18, "user_counts without soft-deleted users", m018_user_counts_live),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, verbose=False):
+    """Apply pending migrations in order; returns the list of versions applied."""
+    applied = []
+    if schema_version(conn) >= LATEST_VERSION:
+        return applied
+
+    for version, description, step in MIGRATIONS:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # re-check under the write lock: another worker may have got here first
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"applied migration {version}: {description}")
+    return applied
+
+
+if __name__ == "__main__":
+    from db import connect
+    import os
+
+    conn = connect(os.environ.get("DATABASE_PATH", "database.db"))
+    if "--status" in sys.argv:
+        print(f"schema version {schema_version(conn)} (latest {LATEST_VERSION})")
+    else:
+        applied = migrate(conn, verbose=True)
+        print(f"schema at version {schema_version(conn)}" + ("" if applied else " (nothing to do)"))
+    conn.close()
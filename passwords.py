@@ -0,0 +1,155 @@
+"""Password hashing off the request thread, plus login throttling.
+
+Hashes are computed by werkzeug in a small process pool (HASH_WORKERS
+processes per app process, created on first use so each gunicorn worker
+gets its own after the fork). At most HASH_QUEUE_MAX hash jobs may be
+in flight or queued; past that HasherBusy is raised right away instead
+of letting a login burst pile up behind the CPU. A job keeps its slot
+until the pool has finished it, even when the request gave up waiting
+after HASH_TIMEOUT (also HasherBusy). HASH_WORKERS=0 hashes inline.
+
+PASSWORD_HASH_METHOD sets the cost for new hashes (any werkzeug method
+string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"); a stored hash
+made with a different method is re-hashed after the next successful
+login (see needs_rehash).
+
+LoginThrottle counts failed logins per client IP and per account in
+fixed windows and rejects further tries before any hashing happens, so
+many users behind one address only share a budget for wrong passwords.
+Counters are per process.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "2"))
+HASH_QUEUE_MAX = int(os.environ.get("HASH_QUEUE_MAX", "16"))
+HASH_TIMEOUT = float(os.environ.get("HASH_TIMEOUT", "10"))
+
+
+class HasherBusy(Exception):
+    """Too many hash jobs queued (or one timed out); the caller should answer 503."""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def needs_rehash(pwhash):
+    return pwhash.split("$", 1)[0] != PASSWORD_HASH_METHOD
+
+
+class PasswordHasher:
+    def __init__(self, workers=HASH_WORKERS, queue_max=HASH_QUEUE_MAX, timeout=HASH_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_max = queue_max
+        self._slots = threading.BoundedSemaphore(queue_max)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _executor(self):
+        with self._lock:
+            # a pool inherited through fork() is unusable in the child
+            if self._pool is None or self._pool_pid != os.getpid():
+                # imported here: multiprocessing costs a cold start ~20 ms before any login
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        with self._lock:
+            self.in_flight += 1
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # the slot is freed when the pool is done with the job, not when we stop waiting
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy() from None
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, PASSWORD_HASH_METHOD)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "queue_max": self.queue_max,
+                    "in_flight": self.in_flight, "rejected_total": self.rejected}
+
+
+class LoginThrottle:
+    """Fixed-window counters of failed attempts per IP and per account."""
+
+    def __init__(self, ip_limit, account_limit, window, max_keys=100_000):
+        self.ip_limit = ip_limit
+        self.account_limit = account_limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counts = OrderedDict()      # key -> [window_start, count]
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def _count(self, key, now):
+        entry = self._counts.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            return 0
+        return entry[1]
+
+    def _add(self, key, now):
+        entry = self._counts.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            entry = self._counts[key] = [now, 0]
+        entry[1] += 1
+        self._counts.move_to_end(key)
+        while len(self._counts) > self.max_keys:
+            self._counts.popitem(last=False)
+
+    def allow(self, ip, account):
+        """False if ip or account has used up its failed attempts for this window."""
+        now = time.monotonic()
+        with self._lock:
+            if (self._count(("ip", ip), now) >= self.ip_limit
+                    or self._count(("account", account), now) >= self.account_limit):
+                self.throttled += 1
+                return False
+            return True
+
+    def failed(self, ip, account):
+        now = time.monotonic()
+        with self._lock:
+            self._add(("ip", ip), now)
+            self._add(("account", account), now)
+
+    def succeeded(self, account):
+        with self._lock:
+            self._counts.pop(("account", account), None)
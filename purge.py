@@ -0,0 +1,141 @@
+"""Background purge of soft-deleted ideas and users.
+
+Deleting a popular idea or a very active user used to remove thousands
+of votes, ratings and comments (and their ON DELETE cascades) in one
+transaction, holding the write lock for seconds. Now the delete only
+hides the row (deleted_at) and queues a job in purge_jobs; PurgeQueue
+then removes the dependent rows PURGE_BATCH at a time, each batch in
+its own short BEGIN IMMEDIATE transaction with PURGE_PAUSE_MS between
+batches so other writers get the lock, and deletes the row itself last,
+when its cascades have nothing left to do.
+
+A job kind is a list of steps, step(c, target_id, limit) -> rows
+handled; a step is repeated until it handles fewer than `limit` rows.
+purge_jobs records the current step and the rows removed so far, so a
+job cut off by a restart resumes where it stopped (a "running" job not
+updated for PURGE_STALE_SECONDS is picked up again). Each worker starts
+a purge thread when it queues a job; `flask purge` drains whatever is
+left. Two workers on the same job are harmless: every step only deletes
+what is still there.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import db
+
+PURGE_BATCH = int(os.environ.get("PURGE_BATCH", "500"))
+PURGE_PAUSE = float(os.environ.get("PURGE_PAUSE_MS", "20")) / 1000
+PURGE_STALE_SECONDS = 60
+NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def enqueue(c, kind, target_id):
+    """Queue a purge job (caller commits, then calls PurgeQueue.start())."""
+    c.execute(f"""
+        INSERT INTO purge_jobs (kind, target_id, created_at, updated_at)
+        VALUES (?, ?, {NOW_SQL}, {NOW_SQL})
+    """, (kind, target_id))
+
+
+class PurgeQueue:
+    def __init__(self, path, steps, batch=PURGE_BATCH, pause=PURGE_PAUSE):
+        self.path = path
+        self.steps = steps              # kind -> [step(c, target_id, limit)]
+        self.batch = batch
+        self.pause = pause
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.rows_deleted = 0
+
+    def start(self):
+        """Make sure this process has a purge thread working through the queue."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="purge", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        conn = db.connect(self.path)
+        try:
+            self.drain(conn)
+        finally:
+            conn.close()
+
+    def drain(self, conn):
+        """Run jobs until none is left; returns how many were finished."""
+        finished = 0
+        while True:
+            job = self._claim(conn)
+            if job is None:
+                return finished
+            if self._run_job(conn, *job):
+                finished += 1
+
+    def _claim(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(f"""
+            UPDATE purge_jobs SET state = 'running', updated_at = {NOW_SQL}
+            WHERE job_id = (SELECT job_id FROM purge_jobs
+                            WHERE state = 'pending'
+                               OR (state = 'running' AND updated_at < {NOW_SQL} - ?)
+                            ORDER BY job_id LIMIT 1)
+            RETURNING job_id, kind, target_id, step
+        """, (PURGE_STALE_SECONDS,)).fetchone()
+        conn.commit()
+        return tuple(row) if row else None
+
+    def _run_job(self, conn, job_id, kind, target_id, step):
+        steps = self.steps[kind]
+        while step < len(steps):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                handled = steps[step](conn.cursor(), target_id, self.batch)
+                if handled < self.batch:
+                    step += 1
+                conn.execute(f"""
+                    UPDATE purge_jobs SET step = ?, rows_deleted = rows_deleted + ?, updated_at = {NOW_SQL},
+                                          state = ?
+                    WHERE job_id = ?
+                """, (step, handled, "done" if step == len(steps) else "running", job_id))
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                conn.execute("UPDATE purge_jobs SET state = 'failed', error = ? WHERE job_id = ?", (str(e), job_id))
+                conn.commit()
+                with self._lock:
+                    self.jobs_failed += 1
+                return False
+            with self._lock:
+                self.rows_deleted += handled
+            time.sleep(self.pause)
+        with self._lock:
+            self.jobs_done += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "batch": self.batch,
+                "jobs_done_total": self.jobs_done,
+                "jobs_failed_total": self.jobs_failed,
+                "rows_deleted_total": self.rows_deleted,
+            }
+
+
+def job_progress(c, limit=50):
+    """Counts by state and the most recent jobs, for the admin page."""
+    c.execute("SELECT state, COUNT(*) FROM purge_jobs GROUP BY state")
+    counts = dict(c.fetchall())
+    c.execute("""
+        SELECT job_id, kind, target_id, state, step, rows_deleted, error, created_at, updated_at
+        FROM purge_jobs ORDER BY job_id DESC LIMIT ?
+    """, (limit,))
+    return counts, [dict(row) for row in c.fetchall()]
@@ -0,0 +1,161 @@
+"""Hot / trending / controversial orderings for the ideas list.
+
+Each mode is a REAL column of idea_stats with its own index, kept current
+by update_rank() in the same transaction as the vote or rating, so a
+ranked page is an index seek like the default stars / score order:
+
+    hot            log10 of the idea's points plus one unit per HOT_PERIOD
+                   of submission time: 12.5 hours of age cost a factor of
+                   10 in points
+    trend_24h      points from votes and ratings, each event's weight halving
+    trend_7d       every TRENDING[column] seconds
+    controversy    (ups + downs) ** (minority / majority): many votes, evenly split
+
+Points: an up / down vote is +1 / -1, a rating (stars - 3) / 2.
+
+Trending uses forward decay: an event at time t adds
+points * 2 ** ((t - landmark) / half_life) rather than every row being
+decayed as the clock moves. At any moment these values are the decayed
+scores times one common factor, so the order is right without touching
+other rows; only the magnitudes grow. rebase() (flask rerank, run
+periodically) moves the landmark up to now and scales the stored values
+down to match; a /ideas cursor carries its landmark and is scaled the
+same way on read (rescale), so a page fetched across a rebase neither
+skips nor repeats ideas. votes.voted_at / star_ratings.rated_at remember when each
+event happened, so an unvote or a changed rating takes back exactly what
+it added.
+"""
+import math
+import time
+
+HOT_EPOCH = 1704067200          # 2024-01-01 UTC
+HOT_PERIOD = 45000              # seconds per factor of 10 in points
+TRENDING = {"trend_24h": 6 * 3600, "trend_7d": 42 * 3600}   # column -> half-life
+REBASE_AFTER = 30 * 86400       # update_rank() rebases itself past this (2**120 at 6h)
+TREND_EPSILON = 1e-9
+
+# /ideas?sort=<mode> -> idea_stats column ("top" is the default stars / score order)
+SORT_COLUMNS = {
+    "hot": "hot",
+    "trending_24h": "trend_24h",
+    "trending_7d": "trend_7d",
+    "controversial": "controversy",
+}
+RANK_COLUMNS = ("hot", "trend_24h", "trend_7d", "controversy")
+
+
+def rating_points(stars):
+    return (stars - 3) / 2
+
+
+def hot_score(points, submitted_at):
+    order = math.log10(max(abs(points), 1))
+    sign = (points > 0) - (points < 0)
+    return sign * order + ((submitted_at or HOT_EPOCH) - HOT_EPOCH) / HOT_PERIOD
+
+
+def controversy_score(vote_score, vote_count):
+    ups = (vote_count + vote_score) // 2
+    downs = vote_count - ups
+    if ups <= 0 or downs <= 0:
+        return 0.0
+    return float(ups + downs) ** (min(ups, downs) / max(ups, downs))
+
+
+def decay_weight(at, landmark, half_life):
+    if at is None:
+        return 0.0
+    return 2.0 ** ((at - landmark) / half_life)
+
+
+def idea_points(vote_score, star_sum, star_count):
+    return vote_score + (star_sum - 3 * star_count) / 2
+
+
+def update_rank(c, idea_id, events=()):
+    """Recompute hot / controversy from the idea's idea_stats row and add
+    events [(points, at)] to its trending scores (negative points take an
+    event back). Call after bump_idea_stats, inside the same transaction."""
+    c.execute("""
+        SELECT idea_stats.vote_score, idea_stats.vote_count, idea_stats.star_sum, idea_stats.star_count,
+               ideas.submitted_at, rank_landmark.landmark
+        FROM idea_stats
+        JOIN ideas ON ideas.id = idea_stats.idea_id
+        JOIN rank_landmark ON rank_landmark.id = 1
+        WHERE idea_stats.idea_id = ?
+    """, (idea_id,))
+    row = c.fetchone()
+    if row is None:
+        return
+    vote_score, vote_count, star_sum, star_count, submitted_at, landmark = row
+    if events and time.time() - landmark > REBASE_AFTER:
+        # the periodic job has not run for a long time: keep 2 ** x finite
+        landmark = rebase(c)
+
+    trend = [sum(points * decay_weight(at, landmark, half_life) for points, at in events)
+             for half_life in TRENDING.values()]
+    c.execute("""
+        UPDATE idea_stats SET hot = ?, controversy = ?,
+               trend_24h = trend_24h + ?, trend_7d = trend_7d + ?
+        WHERE idea_id = ?
+    """, (hot_score(idea_points(vote_score, star_sum, star_count), submitted_at),
+          controversy_score(vote_score, vote_count), trend[0], trend[1], idea_id))
+
+
+def _register_functions(conn):
+    conn.create_function("rank_weight", 3, decay_weight, deterministic=True)
+    conn.create_function("rank_hot", 2, hot_score, deterministic=True)
+    conn.create_function("rank_controversy", 2, controversy_score, deterministic=True)
+
+
+def rescale(column, value, landmark, new_landmark):
+    """A trending value scored against landmark, expressed against new_landmark."""
+    return value * 2.0 ** ((landmark - new_landmark) / TRENDING[column])
+
+
+def rebase(c, now=None):
+    """Move the trending landmark to now, scaling stored scores to match; returns the new landmark."""
+    now = int(now or time.time())
+    c.execute("SELECT landmark FROM rank_landmark WHERE id = 1")
+    old = c.fetchone()[0]
+    sets = []
+    params = []
+    for column in TRENDING:
+        factor = rescale(column, 1.0, old, now)
+        sets.append(f"{column} = CASE WHEN abs({column} * ?) < ? THEN 0 ELSE {column} * ? END")
+        params += [factor, TREND_EPSILON, factor]
+    c.execute(f"UPDATE idea_stats SET {', '.join(sets)} WHERE trend_24h != 0 OR trend_7d != 0", params)
+    c.execute("UPDATE rank_landmark SET landmark = ?", (now,))
+    # cached /ideas pages hold cursors and ETags for the old scale
+    c.execute("""
+        INSERT INTO cache_versions (key, version) VALUES ('ideas', 1)
+        ON CONFLICT(key) DO UPDATE SET version = version + 1
+    """)
+    return now
+
+
+def rebuild_ranking(conn, now=None):
+    """Recompute every rank column from idea_stats, votes and star_ratings (landmark = now)."""
+    _register_functions(conn)
+    now = int(now or time.time())
+    conn.execute("UPDATE rank_landmark SET landmark = ?", (now,))
+    conn.execute("""
+        UPDATE idea_stats SET
+            hot = rank_hot(vote_score + (star_sum - 3 * star_count) / 2.0,
+                           (SELECT submitted_at FROM ideas WHERE ideas.id = idea_stats.idea_id)),
+            controversy = rank_controversy(vote_score, vote_count),
+            trend_24h = 0, trend_7d = 0
+    """)
+    sources = [
+        ("votes", "vote_value", "voted_at"),
+        ("star_ratings", "(stars - 3) / 2.0", "rated_at"),
+    ]
+    (col_a, hl_a), (col_b, hl_b) = TRENDING.items()
+    for table, points, at in sources:
+        conn.execute(f"""
+            UPDATE idea_stats SET {col_a} = {col_a} + e.a, {col_b} = {col_b} + e.b
+            FROM (SELECT idea_id, SUM({points} * rank_weight({at}, ?, ?)) AS a,
+                         SUM({points} * rank_weight({at}, ?, ?)) AS b
+                  FROM {table} WHERE {at} IS NOT NULL GROUP BY idea_id) AS e
+            WHERE e.idea_id = idea_stats.idea_id
+        """, (now, hl_a, now, hl_b))
@@ -0,0 +1,106 @@
+"""Idea-title normalization and near-duplicate lookup (trigram MinHash + LSH).
+
+normalize_title() gives the key stored in ideas.title_key (unique index),
+so "Solar  Roofs!" and "solar roofs" are the same idea.
+
+For near-duplicates every title gets a MinHash signature over its
+character trigrams, cut into LSH bands. Each band hash is a row in
+idea_title_lsh, so finding candidates is a handful of primary-key
+lookups no matter how many ideas exist; candidates are then confirmed
+with the exact trigram Jaccard similarity.
+"""
+import hashlib
+import re
+import unicodedata
+
+NUM_HASHES = 16
+BAND_ROWS = 2                      # 8 bands of 2 -> ~35% similarity to become a candidate
+NEAR_DUPLICATE_THRESHOLD = 0.5     # trigram Jaccard needed to warn the submitter
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# fixed (a, b) pairs so signatures are stable across processes and deploys
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME)
+    for i in range(NUM_HASHES)
+]
+
+
+def normalize_title(title):
+    """Case-, accent-, punctuation- and whitespace-insensitive title key."""
+    text = unicodedata.normalize("NFKD", title or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def idea_title_key(title):
+    """ideas.title_key: normalize_title(), or the plain casefolded title when
+    that leaves nothing (only punctuation / emoji), so such titles do not all
+    share the empty key."""
+    return normalize_title(title) or (title or "").strip().casefold()
+
+
+def trigrams(title):
+    key = normalize_title(title)
+    if not key:
+        return set()
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _gram_hash(gram):
+    return int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "big")
+
+
+def lsh_buckets(title):
+    """Band hashes (signed 64-bit ints) for the title's MinHash signature."""
+    grams = trigrams(title)
+    if not grams:
+        return []
+    hashes = [_gram_hash(g) for g in grams]
+    signature = [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    buckets = []
+    for band in range(NUM_HASHES // BAND_ROWS):
+        rows = signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]
+        digest = hashlib.blake2b(f"{band}:{rows}".encode(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+
+def index_title(c, idea_id, title):
+    c.executemany("INSERT OR IGNORE INTO idea_title_lsh (bucket, idea_id) VALUES (?, ?)",
+                  [(bucket, idea_id) for bucket in lsh_buckets(title)])
+
+
+def unindex_title(c, idea_id):
+    c.execute("DELETE FROM idea_title_lsh WHERE idea_id = ?", (idea_id,))
+
+
+def find_similar(c, title, exclude_id=None, limit=5):
+    """Ideas whose titles look like `title`, most similar first."""
+    buckets = lsh_buckets(title)
+    if not buckets:
+        return []
+    marks = ",".join("?" * len(buckets))
+    c.execute(f"""
+        SELECT ideas.id, ideas.title
+        FROM ideas
+        WHERE ideas.id IN (SELECT DISTINCT idea_id FROM idea_title_lsh WHERE bucket IN ({marks}))
+        LIMIT 200
+    """, buckets)
+    wanted = trigrams(title)
+    matches = []
+    for row in c.fetchall():
+        if row["id"] == exclude_id:
+            continue
+        score = jaccard(wanted, trigrams(row["title"]))
+        if score >= NEAR_DUPLICATE_THRESHOLD:
+            matches.append({"id": row["id"], "title": row["title"], "similarity": round(score, 2)})
+    matches.sort(key=lambda m: -m["similarity"])
+    return matches[:limit]
@@ -0,0 +1,164 @@
+"""Optional in-memory, read-only copy of the database for read-heavy routes.
+
+With READ_SNAPSHOT=1 every worker keeps a copy of database.db in a
+shared-cache in-memory database, taken with the sqlite3 backup API. A
+background thread polls PRAGMA data_version on its own connection every
+SNAPSHOT_CHECK_SECONDS and copies the file again when another connection
+has committed since the last copy, at most once every SNAPSHOT_INTERVAL.
+
+Staleness is bounded on the read side: a copy is known to be current as
+of verified_at (the start of the backup, then every poll that finds
+data_version unchanged). reader() hands it out only while
+now - verified_at <= SNAPSHOT_MAX_STALENESS, and only to a user whose
+last write (session["wrote_at"]) is older than the copy; otherwise it
+returns None and the caller reads the primary file. If refreshing falls
+behind (a large file, a busy disk) reads simply move back to the primary.
+
+Each thread reads through its own connection to the current copy; an old
+copy is freed once the holder and the last thread still using it have
+moved on.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import db
+
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "1"))
+SNAPSHOT_CHECK_SECONDS = float(os.environ.get("SNAPSHOT_CHECK_SECONDS", "0.2"))
+SNAPSHOT_MAX_STALENESS = float(os.environ.get("SNAPSHOT_MAX_STALENESS", "5"))
+
+
+class Snapshot:
+    __slots__ = ("generation", "uri", "holder", "data_version", "started_at", "verified_at")
+
+    def __init__(self, generation, uri, holder, data_version, started_at):
+        self.generation = generation
+        self.uri = uri
+        self.holder = holder            # keeps the in-memory database alive
+        self.data_version = data_version
+        self.started_at = started_at    # every commit before this is in the copy
+        self.verified_at = started_at   # ... and none after this is missing
+
+
+def _open_memory(uri):
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=db.PooledConnection)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ReadSnapshot:
+    def __init__(self, path, interval=SNAPSHOT_INTERVAL, check_every=SNAPSHOT_CHECK_SECONDS,
+                 max_staleness=SNAPSHOT_MAX_STALENESS):
+        self.path = path
+        self.interval = interval
+        self.check_every = check_every
+        self.max_staleness = max_staleness
+        self._current = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.generation = 0
+        self.refreshes = 0
+        self.refresh_seconds_last = 0.0
+        self.errors = 0
+        self.served = 0
+        self.fallback_stale = 0
+        self.fallback_own_write = 0
+
+    def start(self):
+        with self._lock:
+            # a thread does not survive fork(): each worker starts its own
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._current = None
+            self._thread = threading.Thread(target=self._run, name="read-snapshot", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        source = db.connect(self.path)
+        while True:
+            try:
+                self._check(source)
+            except sqlite3.Error:
+                with self._lock:
+                    self.errors += 1
+            time.sleep(self.check_every)
+
+    def _check(self, source):
+        now = time.time()
+        data_version = source.execute("PRAGMA data_version").fetchone()[0]
+        snap = self._current
+        if snap is not None and snap.data_version == data_version:
+            snap.verified_at = now
+        elif snap is None or now - snap.started_at >= self.interval:
+            self._refresh(source, data_version)
+
+    def _refresh(self, source, data_version):
+        self.generation += 1
+        uri = f"file:snapshot-{os.getpid()}-{self.generation}?mode=memory&cache=shared"
+        holder = _open_memory(uri)
+        started = time.time()
+        source.backup(holder)
+        holder.execute("PRAGMA query_only = ON")
+        snap = Snapshot(self.generation, uri, holder, data_version, started)
+        old, self._current = self._current, snap
+        if old is not None:
+            old.holder.really_close()
+        with self._lock:
+            self.refreshes += 1
+            self.refresh_seconds_last = time.time() - started
+
+    def reader(self, wrote_at=0):
+        """(connection, snapshot) for this thread, or None if the caller must use the primary."""
+        self.start()
+        while True:
+            snap = self._current
+            if snap is None or time.time() - snap.verified_at > self.max_staleness:
+                with self._lock:
+                    self.fallback_stale += 1
+                return None
+            if snap.started_at <= wrote_at:
+                with self._lock:
+                    self.fallback_own_write += 1
+                return None
+
+            local = self._local
+            if getattr(local, "generation", None) != snap.generation:
+                if getattr(local, "conn", None) is not None:
+                    local.conn.really_close()
+                    local.conn = local.generation = None
+                conn = _open_memory(snap.uri)
+                # _refresh publishes a new copy before closing the old holder: if snap
+                # is still current it was open when we connected, and now conn keeps
+                # it alive; otherwise the uri may have made a new, empty database
+                if self._current is not snap:
+                    conn.really_close()
+                    continue
+                conn.execute("PRAGMA query_only = ON")
+                for hook in db.CONNECT_HOOKS:
+                    hook(conn)
+                local.conn, local.generation = conn, snap.generation
+            with self._lock:
+                self.served += 1
+            return local.conn, snap
+
+    def stats(self):
+        snap = self._current
+        now = time.time()
+        with self._lock:
+            return {
+                "generation": snap.generation if snap else None,
+                "age_seconds": round(now - snap.started_at, 3) if snap else None,
+                "staleness_seconds": round(now - snap.verified_at, 3) if snap else None,
+                "max_staleness_seconds": self.max_staleness,
+                "refreshes_total": self.refreshes,
+                "refresh_seconds_last": round(self.refresh_seconds_last, 6),
+                "errors_total": self.errors,
+                "reads_served_total": self.served,
+                "fallback_stale_total": self.fallback_stale,
+                "fallback_own_write_total": self.fallback_own_write,
+            }
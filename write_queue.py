@@ -0,0 +1,167 @@
+"""Write-behind queue for vote / rating writes.
+
+Requests enqueue an intent ("vote", idea_id, user_id, value) and a single
+writer thread applies whatever has queued up in one BEGIN IMMEDIATE
+transaction, so a burst of votes takes the SQLite write lock once per
+batch instead of once per request. Intents are applied in arrival order
+with the same handler code as the synchronous path, so toggles (same vote
+twice = unvote) behave exactly as before. Each intent runs under its own
+SAVEPOINT: a failing one is rolled back alone and reported to its caller.
+
+submit() waits until the batch holding the intent has committed, which
+gives the acting user read-your-writes on the page they are redirected to.
+An intent still queued after wait_timeout is dropped, never applied later,
+so the user can simply try again (a late vote would turn a retry into an
+unvote); one the writer has already started is waited for.
+With several gunicorn workers each process has its own writer thread.
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+from db import connect
+
+
+class WriteIntent:
+    __slots__ = ("kind", "args", "enqueued", "done", "error", "started", "dropped")
+
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.error = None
+        self.started = False    # taken by the writer (under the queue's lock)
+        self.dropped = False    # the caller gave up first: skip it
+
+
+class WriteBehindQueue:
+    """Single writer thread applying queued intents in batched transactions.
+
+    handlers maps an intent kind to handler(cursor, *args); handlers must not
+    commit.
+    """
+
+    def __init__(self, path, handlers, batch_max=200, batch_delay=0.005, wait_timeout=10.0):
+        self.path = path
+        self.handlers = handlers
+        self.batch_max = batch_max
+        self.batch_delay = batch_delay
+        self.wait_timeout = wait_timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.intents = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, *args):
+        """Queue an intent and wait for its batch to commit.
+
+        Returns False if the writer had not got to it after wait_timeout
+        (it is dropped, not applied); re-raises the handler's exception if
+        it failed.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"unknown write intent {kind!r}")
+        self.start()
+        intent = WriteIntent(kind, args)
+        self._queue.put(intent)
+        if not intent.done.wait(self.wait_timeout):
+            with self._lock:
+                if not intent.started:
+                    intent.dropped = True
+                    self.dropped += 1
+                    return False
+            # already in a batch: it commits (or fails) shortly
+            intent.done.wait()
+        if intent.error is not None:
+            raise intent.error
+        return True
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_delay
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect(self.path)
+        while True:
+            batch = self._next_batch()
+            try:
+                self._apply(conn, batch)
+            except sqlite3.Error as e:
+                # the whole batch failed (lock timeout, disk error): report it to every caller
+                if conn.in_transaction:
+                    conn.rollback()
+                for intent in batch:
+                    if intent.error is None:
+                        intent.error = e
+            self._finish(batch)
+
+    def _apply(self, conn, batch):
+        c = conn.cursor()
+        conn.execute("BEGIN IMMEDIATE")
+        for intent in batch:
+            with self._lock:
+                if intent.dropped:
+                    continue
+                intent.started = True
+            c.execute("SAVEPOINT intent")
+            try:
+                self.handlers[intent.kind](c, *intent.args)
+            except Exception as e:
+                c.execute("ROLLBACK TO intent")
+                intent.error = e
+            c.execute("RELEASE intent")
+        conn.commit()
+
+    def _finish(self, batch):
+        now = time.perf_counter()
+        for intent in batch:
+            intent.done.set()
+        with self._lock:
+            batch = [intent for intent in batch if not intent.dropped]
+            if not batch:
+                return
+            latencies = [now - intent.enqueued for intent in batch]
+            self.batches += 1
+            self.intents += len(batch)
+            self.errors += sum(1 for intent in batch if intent.error is not None)
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.latency_seconds_total += sum(latencies)
+            self.latency_seconds_max = max(self.latency_seconds_max, max(latencies))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches_total": self.batches,
+                "intents_total": self.intents,
+                "errors_total": self.errors,
+                "dropped_total": self.dropped,
+                "batch_size_last": self.last_batch_size,
+                "batch_size_max": self.max_batch_size,
+                "batch_size_avg": round(self.intents / self.batches, 2) if self.batches else 0,
+                "queue_latency_seconds_avg": round(self.latency_seconds_total / self.intents, 6) if self.intents else 0,
+                "queue_latency_seconds_max": round(self.latency_seconds_max, 6),
+            }